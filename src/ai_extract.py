@@ -25,7 +25,47 @@ if sys.platform == 'win32':
 from dotenv import load_dotenv
 load_dotenv()
 
-from anthropic import Anthropic
+
+from ai_telemetry import AITelemetry, create_client
+from model_router import call_cost
+from prompt_cache import build_system, cache_usage
+
+# Static instructions sent as a cached system prefix on every call
+EXTRACTION_INSTRUCTIONS = """أنت خبير في استخراج بيانات المساجد من رسائل تيليجرام.
+
+ستصلك رسالة واحدة مع اسم المقاطعة وسياق الرسائل السابقة.
+
+**المطلوب:**
+حلل هذه الرسالة واستخرج معلومات المساجد.
+
+- هل هذه رسالة تحتوي على بيانات مسجد؟ (نعم/لا/ربما)
+- إذا كانت رسالة مسجد، استخرج:
+  * اسم المسجد (يجب أن يحتوي على كلمة "مسجد" أو "جامع" أو "مصلى")
+  * المنطقة/الحي/القرية
+  * حالة الضرر (مدمر/متضرر/تاريخي) إن وُجدت
+  * أي تكاليف مذكورة
+  * أي ملاحظات إضافية
+
+- إذا كانت رسالة نقاش/تنسيق (مثل "انتهيت"، "أرسل الملفات"، "بدي الملف")، اذكر "ليست بيانات"
+
+**الرد بصيغة JSON فقط:**
+{
+  "is_mosque_data": true/false,
+  "confidence": "high/medium/low",
+  "mosques": [
+    {
+      "name": "اسم المسجد الكامل",
+      "area": "المنطقة",
+      "damage_status": "destroyed/damaged/historical/unknown",
+      "cost": "التكلفة إن وجدت",
+      "notes": "ملاحظات"
+    }
+  ],
+  "reasoning": "سبب قصير للقرار"
+}
+
+إذا كانت الرسالة تحتوي على أكثر من مسجد، أدرج كل مسجد في القائمة."""
+
 
 class AIMosqueExtractor:
     """Extract mosque data from Telegram messages using Claude AI."""
@@ -40,8 +80,10 @@ class AIMosqueExtractor:
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in .env file")
 
-        self.client = Anthropic(api_key=api_key)
+        self.client = create_client(api_key)
+        self.telemetry = AITelemetry('ai_extract')
         self.model = "claude-3-haiku-20240307"
+        self.system_prompt = build_system(EXTRACTION_INSTRUCTIONS)
 
         # Load data
         self.messages = []
@@ -57,7 +99,9 @@ class AIMosqueExtractor:
             'medium_confidence': 0,
             'low_confidence': 0,
             'api_calls': 0,
-            'api_cost': 0.0
+            'api_cost': 0.0,
+            'cache_write_tokens': 0,
+            'cache_read_tokens': 0
         }
 
     def load_data(self):
@@ -136,54 +180,23 @@ class AIMosqueExtractor:
             if ctx_text:
                 context_text += f"\n- {ctx_text[:100]}"
 
-        # Build prompt for Claude
-        prompt = f"""أنت خبير في استخراج بيانات المساجد من رسائل تيليجرام.
-
-**المقاطعة:** {province_name}
+        # Build the small per-message suffix (static instructions are cached)
+        prompt = f"""**المقاطعة:** {province_name}
 
 **الرسالة المراد تحليلها:**
 {text}
 
 **السياق (الرسائل السابقة):**
-{context_text if context_text else 'لا يوجد سياق'}
-
-**المطلوب:**
-حلل هذه الرسالة واستخرج معلومات المساجد.
-
-- هل هذه رسالة تحتوي على بيانات مسجد؟ (نعم/لا/ربما)
-- إذا كانت رسالة مسجد، استخرج:
-  * اسم المسجد (يجب أن يحتوي على كلمة "مسجد" أو "جامع" أو "مصلى")
-  * المنطقة/الحي/القرية
-  * حالة الضرر (مدمر/متضرر/تاريخي) إن وُجدت
-  * أي تكاليف مذكورة
-  * أي ملاحظات إضافية
-
-- إذا كانت رسالة نقاش/تنسيق (مثل "انتهيت"، "أرسل الملفات"، "بدي الملف")، اذكر "ليست بيانات"
-
-**الرد بصيغة JSON فقط:**
-{{
-  "is_mosque_data": true/false,
-  "confidence": "high/medium/low",
-  "mosques": [
-    {{
-      "name": "اسم المسجد الكامل",
-      "area": "المنطقة",
-      "damage_status": "destroyed/damaged/historical/unknown",
-      "cost": "التكلفة إن وجدت",
-      "notes": "ملاحظات"
-    }}
-  ],
-  "reasoning": "سبب قصير للقرار"
-}}
-
-إذا كانت الرسالة تحتوي على أكثر من مسجد، أدرج كل مسجد في القائمة."""
+{context_text if context_text else 'لا يوجد سياق'}"""
 
         try:
             # Call Claude API
-            response = self.client.messages.create(
+            response = self.telemetry.create(
+                self.client,
                 model=self.model,
                 max_tokens=1024,
                 temperature=0.1,  # Low temperature for consistent extraction
+                system=self.system_prompt,
                 messages=[
                     {
                         "role": "user",
@@ -194,9 +207,10 @@ class AIMosqueExtractor:
 
             # Update statistics
             self.stats['api_calls'] += 1
-            # Haiku pricing: $0.25 per 1M input tokens, $1.25 per 1M output tokens
-            # Rough estimate: ~500 tokens per call
-            self.stats['api_cost'] += 0.0002  # Approximate cost per call
+            for key, tokens in cache_usage(response).items():
+                self.stats[key] += tokens
+            # Real cost from response.usage (Haiku: $0.25 / $1.25 per 1M tokens)
+            self.stats['api_cost'] += call_cost(self.model, response.usage)
 
             # Extract response
             response_text = response.content[0].text.strip()
@@ -226,6 +240,7 @@ class AIMosqueExtractor:
             return None
 
         except json.JSONDecodeError as e:
+            self.telemetry.mark_outcome(response, 'unparseable')
             print(f"⚠️  JSON parse error for message {message.get('id')}: {e}")
             print(f"   Response was: {response_text[:200]}")
             return None
@@ -311,7 +326,10 @@ class AIMosqueExtractor:
         print(f"  • Low confidence: {self.stats['low_confidence']}")
         print(f"\nAPI Usage:")
         print(f"  • API calls made: {self.stats['api_calls']}")
-        print(f"  • Estimated cost: ${self.stats['api_cost']:.2f}")
+        print(f"  • Actual cost: ${self.stats['api_cost']:.4f}")
+        print(f"  • Cache write tokens: {self.stats['cache_write_tokens']:,}")
+        print(f"  • Cache hit tokens: {self.stats['cache_read_tokens']:,}")
+        self.telemetry.report()
 
     def export_to_csv(self):
         """Export extracted data to CSV"""
@@ -9,34 +9,50 @@ Author: Claude Code
 Date: October 25, 2025
 """
 
+import hashlib
 import json
 import pandas as pd
-import anthropic
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List
-import time
+from typing import Dict, List, Set, Tuple
+
+from ai_telemetry import AITelemetry, create_client
+from maps_links import MapsRegistry
+from model_router import call_cost
+
+ASSIGNMENT_MODEL = "claude-3-5-haiku-20241022"
+CACHE_SAVE_EVERY = 20  # Persist the result cache every N finished clusters
 
 
 class AIPhotoAssigner:
     """Use AI to assign photos to mosques based on conversation context"""
 
-    def __init__(self, telegram_export_path: str, clusters_csv_path: str):
+    def __init__(self, telegram_export_path: str, clusters_csv_path: str, max_workers: int = 4,
+                 cache_path: str = 'out_csv/photo_assignment_cache.json'):
         self.telegram_export_path = Path(telegram_export_path)
         self.clusters_csv_path = Path(clusters_csv_path)
+        self.max_workers = max_workers  # Concurrent API requests
+
+        # Cluster content hash -> validated AI result from earlier runs
+        self.cache_path = Path(cache_path)
+        self.cache = self.load_cache()
 
         # Load API key
         self.api_key = os.environ.get('ANTHROPIC_API_KEY')
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment")
 
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.client = create_client(self.api_key)
+        self.telemetry = AITelemetry('ai_photo_assignment')
 
         # Load data
         print("Loading Telegram export...")
         with open(self.telegram_export_path / 'result.json', 'r', encoding='utf-8') as f:
             telegram_data = json.load(f)
         self.messages = {msg['id']: msg for msg in telegram_data['messages']}
+        self.maps = MapsRegistry(telegram_data['messages'])
 
         print("Loading conversation clusters...")
         self.clusters_df = pd.read_csv(clusters_csv_path, encoding='utf-8')
@@ -46,6 +62,9 @@ class AIPhotoAssigner:
 
         self.total_cost = 0
         self.api_calls = 0
+        self.cache_hits = 0
+        self.rejected_paths = 0  # Returned media paths that were not in the cluster
+        self._stats_lock = threading.Lock()
 
     def _extract_text(self, text_obj) -> str:
         """Extract text from Telegram text object"""
@@ -89,7 +108,7 @@ class AIPhotoAssigner:
                 text = self._extract_text(msg['text'])
                 if text.strip():
                     # Check if text contains Google Maps link
-                    if 'maps.app.goo.gl' in text or 'google.com/maps' in text:
+                    if self.maps.has_maps(msg_id):
                         context_lines.append(f"[{date}] Message {msg_id}: MAPS LINK + TEXT - {text[:100]}")
                     else:
                         context_lines.append(f"[{date}] Message {msg_id}: TEXT - {text[:150]}")
@@ -141,19 +160,17 @@ OUTPUT FORMAT (JSON):
 Respond ONLY with valid JSON, no additional text."""
 
         try:
-            self.api_calls += 1
-            message = self.client.messages.create(
-                model="claude-3-5-haiku-20241022",
+            message = self.telemetry.create(
+                self.client,
+                model=ASSIGNMENT_MODEL,
                 max_tokens=2000,
                 temperature=0,
                 messages=[{"role": "user", "content": prompt}]
             )
 
-            # Calculate cost (Haiku: $0.25 per 1M input, $1.25 per 1M output)
-            input_tokens = message.usage.input_tokens
-            output_tokens = message.usage.output_tokens
-            cost = (input_tokens * 0.25 / 1_000_000) + (output_tokens * 1.25 / 1_000_000)
-            self.total_cost += cost
+            with self._stats_lock:
+                self.api_calls += 1
+                self.total_cost += call_cost(ASSIGNMENT_MODEL, message.usage)
 
             # Parse response
             response_text = message.content[0].text
@@ -164,16 +181,90 @@ Respond ONLY with valid JSON, no additional text."""
             elif '```' in response_text:
                 response_text = response_text.split('```')[1].split('```')[0]
 
-            result = json.loads(response_text.strip())
+            try:
+                result = json.loads(response_text.strip())
+            except json.JSONDecodeError:
+                self.telemetry.mark_outcome(message, 'unparseable')
+                raise
             return result
 
         except Exception as e:
             print(f"  ⚠ Error analyzing cluster {cluster_id}: {str(e)}")
             return {
                 "assignments": {name: {"photos": [], "videos": [], "maps": []} for name in mosque_names},
-                "reasoning": f"Error: {str(e)}"
+                "reasoning": f"Error: {str(e)}",
+                "error": True
             }
 
+    def cluster_files(self, msg_ids: List[int]) -> Set[str]:
+        """All media file paths sent in the cluster."""
+        return {self.messages[m]['file'] for m in msg_ids
+                if m in self.messages and self.messages[m].get('file')}
+
+    def cluster_hash(self, mosque_names: List[str], conversation_context: str) -> str:
+        """Content hash of everything the AI sees for a cluster."""
+        payload = json.dumps({'model': ASSIGNMENT_MODEL, 'names': mosque_names,
+                              'context': conversation_context}, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def validate_result(self, ai_result: Dict, cluster_files: Set[str]) -> Tuple[Dict, int]:
+        """
+        Keep only photo/video paths that exist in the cluster.
+
+        Returns:
+            (cleaned result, number of rejected paths)
+        """
+        rejected = 0
+        assignments = {}
+        for name, assignment in (ai_result.get('assignments') or {}).items():
+            if not isinstance(assignment, dict):
+                continue
+            cleaned = {'maps': list(assignment.get('maps') or [])}
+            for kind in ('photos', 'videos'):
+                paths = list(assignment.get(kind) or [])
+                cleaned[kind] = [p for p in paths if p in cluster_files]
+                rejected += len(paths) - len(cleaned[kind])
+            assignments[name] = cleaned
+        return {**ai_result, 'assignments': assignments, 'rejected_paths': rejected}, rejected
+
+    def assign_cluster(self, job: Dict) -> Dict:
+        """Analyze one cluster with AI and validate the answer (runs in a worker thread)."""
+        result = self.analyze_cluster_with_ai(job['cluster_id'], job['names'], job['context'])
+        if result.get('error'):
+            return result
+        result, rejected = self.validate_result(result, job['files'])
+        if rejected:
+            with self._stats_lock:
+                self.rejected_paths += rejected
+        return result
+
+    def load_cache(self) -> Dict[str, Dict]:
+        """Load validated results from earlier runs, keyed by cluster hash."""
+        if self.cache_path.exists():
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def save_cache(self):
+        """Persist the result cache (written atomically)."""
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        tmp_path.replace(self.cache_path)
+
+    @staticmethod
+    def needs_ai(group: pd.DataFrame) -> bool:
+        """
+        Multi-mosque clusters need AI unless fix_photo_assignments already
+        resolved them (input carries a `needs_review` column).
+        """
+        if len(group) <= 1:
+            return False
+        if 'needs_review' not in group:
+            return True
+        return bool(group['needs_review'].astype(str).str.lower().isin(['true', '1']).any())
+
     def process_all_clusters(self) -> pd.DataFrame:
         """
         Process all clusters with AI-based assignment.
@@ -184,13 +275,48 @@ Respond ONLY with valid JSON, no additional text."""
         results = []
 
         # Group by cluster_id
-        cluster_groups = self.clusters_df.groupby('cluster_id')
-        multi_mosque_clusters = [cid for cid, group in cluster_groups if len(group) > 1]
+        cluster_groups = list(self.clusters_df.groupby('cluster_id'))
+
+        # One job per cluster that needs AI; unchanged clusters come from the cache
+        ai_results = {}
+        pending = []
+        for cluster_id, group in cluster_groups:
+            if not self.needs_ai(group):
+                continue
+            msg_ids = [int(x.strip()) for x in group.iloc[0]['message_ids'].split(';')]
+            job = {
+                'cluster_id': cluster_id,
+                'names': group['name'].tolist(),
+                'context': self.build_conversation_context(msg_ids),
+                'files': self.cluster_files(msg_ids)
+            }
+            job['key'] = self.cluster_hash(job['names'], job['context'])
+            if job['key'] in self.cache:
+                ai_results[cluster_id] = self.cache[job['key']]
+                self.cache_hits += 1
+            else:
+                pending.append(job)
+
+        print(f"\nFound {len(ai_results) + len(pending)} clusters with multiple mosques")
+        print(f"  Reused from cache: {self.cache_hits}")
+        print(f"Processing {len(pending)} with AI ({self.max_workers} workers)...\n")
 
-        print(f"\nFound {len(multi_mosque_clusters)} clusters with multiple mosques")
-        print("Processing with AI...\n")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.assign_cluster, job): job for job in pending}
+            for processed, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                result = future.result()
+                ai_results[job['cluster_id']] = result
+                if not result.get('error'):
+                    self.cache[job['key']] = result
+
+                if processed % 10 == 0:
+                    print(f"  Progress: {processed}/{len(pending)} clusters | Cost: ${self.total_cost:.4f}")
+                if processed % CACHE_SAVE_EVERY == 0:
+                    self.save_cache()
+        if pending:
+            self.save_cache()
 
-        processed = 0
         for cluster_id, group in cluster_groups:
             if len(group) == 1:
                 # Single mosque - keep as-is
@@ -198,18 +324,15 @@ Respond ONLY with valid JSON, no additional text."""
                 row['assignment_method'] = 'single_mosque_direct'
                 row['ai_analyzed'] = False
                 results.append(row)
+            elif cluster_id not in ai_results:
+                # Already resolved deterministically by fix_photo_assignments
+                for idx, row in group.iterrows():
+                    new_row = row.copy()
+                    new_row['assignment_method'] = row.get('photo_assignment_method', 'deterministic')
+                    new_row['ai_analyzed'] = False
+                    results.append(new_row)
             else:
-                # Multiple mosques - use AI
-                mosque_names = group['name'].tolist()
-                msg_ids_str = group.iloc[0]['message_ids']
-                msg_ids = [int(x.strip()) for x in msg_ids_str.split(';')]
-
-                # Build context
-                conversation_context = self.build_conversation_context(msg_ids)
-
-                # Analyze with AI
-                print(f"Analyzing Cluster #{cluster_id} ({len(group)} mosques)...")
-                ai_result = self.analyze_cluster_with_ai(cluster_id, mosque_names, conversation_context)
+                ai_result = ai_results[cluster_id]
 
                 # Apply assignments
                 for idx, row in group.iterrows():
@@ -245,23 +368,20 @@ Respond ONLY with valid JSON, no additional text."""
                     new_row['assignment_method'] = 'ai_context_based'
                     new_row['ai_analyzed'] = True
                     new_row['ai_reasoning'] = ai_result.get('reasoning', '')
+                    new_row['ai_rejected_paths'] = ai_result.get('rejected_paths', 0)
 
                     results.append(new_row)
 
-                processed += 1
-                if processed % 10 == 0:
-                    print(f"  Progress: {processed}/{len(multi_mosque_clusters)} clusters | Cost: ${self.total_cost:.4f}")
-
-                # Rate limiting
-                time.sleep(0.5)
-
         # Create result DataFrame
         result_df = pd.DataFrame(results)
 
         print(f"\n=== Processing Complete ===")
         print(f"Total API calls: {self.api_calls}")
         print(f"Total cost: ${self.total_cost:.4f}")
+        print(f"Cache hits: {self.cache_hits}")
+        print(f"Rejected media paths (not in cluster): {self.rejected_paths}")
         print(f"Mosques processed: {len(result_df)}")
+        self.telemetry.report()
         print(f"AI-analyzed: {result_df['ai_analyzed'].sum()}")
 
         return result_df
@@ -269,6 +389,13 @@ Respond ONLY with valid JSON, no additional text."""
 
 def main():
     """Main execution function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='AI-based photo assignment for multi-mosque clusters')
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help='Concurrent API requests')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("AI-Based Photo Assignment")
     print("=" * 60)
@@ -276,7 +403,10 @@ def main():
 
     # Paths
     telegram_export = Path('MasajidChat')
-    clusters_csv = Path('out_csv/conversation_clusters_analyzed.csv')
+    # Prefer the fixer's output so only ambiguous clusters are sent to AI
+    clusters_csv = Path('out_csv/mosques_fixed_photos.csv')
+    if not clusters_csv.exists():
+        clusters_csv = Path('out_csv/conversation_clusters_analyzed.csv')
     output_csv = Path('out_csv/mosques_ai_assigned.csv')
 
     # Check API key
@@ -286,13 +416,15 @@ def main():
         return
 
     # Initialize assigner
-    assigner = AIPhotoAssigner(telegram_export, clusters_csv)
+    assigner = AIPhotoAssigner(telegram_export, clusters_csv, max_workers=args.max_workers)
 
     # Estimate cost
-    multi_mosque_clusters = len([cid for cid, group in assigner.clusters_df.groupby('cluster_id') if len(group) > 1])
+    multi_mosque_clusters = len([cid for cid, group in assigner.clusters_df.groupby('cluster_id')
+                                 if assigner.needs_ai(group)])
     estimated_cost = multi_mosque_clusters * 0.02  # ~$0.02 per cluster
 
     print(f"\nEstimated cost: ${estimated_cost:.2f}")
+    print(f"Input: {clusters_csv}")
     print(f"Clusters to analyze: {multi_mosque_clusters}")
     print()
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI Call Telemetry
+=================
+Shared usage accounting and latency telemetry for every AI stage.
+
+Each stage creates one `AITelemetry` and sends its requests through
+`telemetry.create(client, ...)` instead of `client.messages.create(...)`.
+Every call is recorded with its model, input/output/cache tokens, latency,
+SDK retries, outcome and real cost. At the end of a run `report()` prints
+p50/p95/p99 latency, tokens per second and cost, and appends the raw
+records to `out_csv/ai_call_metrics.jsonl` for tuning concurrency and
+batch sizes.
+
+Clients are built with `create_client()`, which honors ANTHROPIC_BASE_URL so
+any stage can be pointed at the local stand-in server
+(`mock_anthropic_server.py`) instead of the real API.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import anthropic
+import numpy as np
+
+from model_router import call_cost
+
+DEFAULT_METRICS_PATH = 'out_csv/ai_call_metrics.jsonl'
+
+
+def create_client(api_key: Optional[str] = None, **kwargs) -> anthropic.Anthropic:
+    """
+    Build the Anthropic client for a stage.
+
+    Set ANTHROPIC_BASE_URL (e.g. http://127.0.0.1:8765) to send every call
+    to a local stand-in server instead of the real API.
+    """
+    base_url = os.getenv('ANTHROPIC_BASE_URL') or None
+    if base_url:
+        print(f"🧪 AI endpoint override: {base_url}")
+    return anthropic.Anthropic(api_key=api_key, base_url=base_url, **kwargs)
+
+
+class AITelemetry:
+    """Record every API call made by one pipeline stage."""
+
+    def __init__(self, stage: str, metrics_path: str = DEFAULT_METRICS_PATH):
+        self.stage = stage
+        self.metrics_path = Path(metrics_path)
+        self.records: List[Dict] = []
+        self._by_response_id: Dict[str, Dict] = {}
+        self._lock = threading.Lock()  # Stages call the API from worker threads
+
+    def create(self, client, **kwargs):
+        """
+        Call `client.messages.create(**kwargs)` and record the call.
+
+        Returns the parsed Message, exactly like the SDK call it wraps.
+        Exceptions are recorded and re-raised.
+        """
+        model = kwargs.get('model', '')
+        start = time.perf_counter()
+        try:
+            raw = client.messages.with_raw_response.create(**kwargs)
+            response = raw.parse()
+        except Exception as e:
+            self._add({
+                'model': model,
+                'latency_s': time.perf_counter() - start,
+                'retries': None,
+                'outcome': type(e).__name__
+            })
+            raise
+
+        usage = response.usage
+        record = self._add({
+            'model': model,
+            'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+            'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+            'cache_write_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+            'cache_read_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            'latency_s': time.perf_counter() - start,
+            'retries': getattr(raw, 'retries_taken', 0),
+            'outcome': 'ok',
+            'cost': call_cost(model, usage)
+        })
+        with self._lock:
+            self._by_response_id[response.id] = record
+        return response
+
+    def mark_outcome(self, response, outcome: str):
+        """Update the outcome of a recorded call (e.g. 'unparseable' JSON)."""
+        with self._lock:
+            record = self._by_response_id.get(getattr(response, 'id', None))
+            if record is not None:
+                record['outcome'] = outcome
+
+    def _add(self, record: Dict) -> Dict:
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'stage': self.stage,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_write_tokens': 0,
+            'cache_read_tokens': 0,
+            'cost': 0.0,
+            **record
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    @property
+    def total_cost(self) -> float:
+        with self._lock:
+            return sum(r['cost'] for r in self.records)
+
+    def summary(self) -> Dict:
+        """Aggregate latency percentiles, throughput, tokens and cost."""
+        with self._lock:
+            records = list(self.records)
+
+        latencies = np.array([r['latency_s'] for r in records], dtype=float)
+        ok = [r for r in records if r['outcome'] == 'ok']
+        ok_latency = sum(r['latency_s'] for r in ok)
+        output_tokens = sum(r['output_tokens'] for r in records)
+
+        outcomes = {}
+        for r in records:
+            outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+
+        return {
+            'calls': len(records),
+            'outcomes': outcomes,
+            'retries': sum(r['retries'] or 0 for r in records),
+            'p50_s': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p95_s': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+            'p99_s': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            'input_tokens': sum(r['input_tokens'] for r in records),
+            'output_tokens': output_tokens,
+            'cache_write_tokens': sum(r['cache_write_tokens'] for r in records),
+            'cache_read_tokens': sum(r['cache_read_tokens'] for r in records),
+            'output_tokens_per_s': (sum(r['output_tokens'] for r in ok) / ok_latency) if ok_latency else 0.0,
+            'cost': sum(r['cost'] for r in records)
+        }
+
+    def report(self):
+        """Print the stage summary and append raw records to the metrics file."""
+        s = self.summary()
+        outcomes = ', '.join(f"{k}={v}" for k, v in sorted(s['outcomes'].items())) or 'none'
+
+        print(f"\n📈 AI telemetry [{self.stage}]:")
+        print(f"   Calls: {s['calls']} ({outcomes}), SDK retries: {s['retries']}")
+        print(f"   Latency p50/p95/p99: {s['p50_s']:.2f}s / {s['p95_s']:.2f}s / {s['p99_s']:.2f}s")
+        print(f"   Tokens: {s['input_tokens']:,} in, {s['output_tokens']:,} out, "
+              f"{s['cache_read_tokens']:,} cache hit, {s['cache_write_tokens']:,} cache write")
+        print(f"   Throughput: {s['output_tokens_per_s']:.1f} output tokens/s per call")
+        print(f"   Real cost: ${s['cost']:.4f}")
+
+        if not self.records:
+            return
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        with open(self.metrics_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"   Metrics: {self.metrics_path} (+{len(records)} calls)")
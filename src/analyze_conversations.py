@@ -14,14 +14,22 @@ Strategy:
 
 import sys
 import os
+import copy
+import hashlib
 from pathlib import Path
 import json
+import threading
 import pandas as pd
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
-from anthropic import Anthropic
 from dotenv import load_dotenv
 
+from ai_telemetry import AITelemetry, create_client
+from clustering import MessageIndex, parse_epochs
+from maps_links import MapsRegistry
+from model_router import MODEL_PRICING, TieredModelRouter, call_cost, count_mosque_texts, escalation_reason
+from prompt_cache import build_system, cache_usage
+
 # Fix Windows console encoding
 if sys.platform == 'win32':
     try:
@@ -33,28 +41,83 @@ if sys.platform == 'win32':
 # Load environment variables
 load_dotenv()
 
+# Sub-cluster splitting: keep each AI prompt small enough that the JSON
+# reply (max_tokens=1024) is never truncated
+CLUSTER_TOKEN_BUDGET = 800     # Estimated input tokens per sub-cluster
+CHARS_PER_TOKEN = 3            # Rough estimate for mixed Arabic text
+MESSAGE_TOKEN_OVERHEAD = 2     # Separators / media placeholders
+SPLIT_OVERLAP = 2              # Messages repeated between sub-clusters
+BOUNDARY_GAP_SECONDS = 180     # A pause this long is a natural split point
+
+# Static instructions sent as a cached system prefix on every cluster call
+CLUSTER_INSTRUCTIONS = """أنت خبير في تحليل بيانات المساجد من محادثات تيليجرام.
+
+ستصلك نصوص محادثة واحدة مع اسم المقاطعة وعدد الصور والخرائط والفيديوهات.
+
+**المطلوب:**
+1. استخرج أسماء المساجد من النصوص
+2. حدد المنطقة/المدينة إذا كانت مذكورة
+3. حدد إذا كان هناك مسجد واحد أم عدة مساجد
+4. حدد نوع الضرر إذا ذُكر (متضرر/مدمر)
+
+**الرد بصيغة JSON فقط (بدون أي نص إضافي):**
+{
+  "mosques_count": عدد المساجد,
+  "mosques": [
+    {
+      "name": "اسم المسجد",
+      "area": "المنطقة",
+      "damage_type": "damaged/demolished/unknown",
+      "confidence": "high/medium/low",
+      "reasoning": "سبب هذا الاستنتاج"
+    }
+  ],
+  "has_photos": true/false,
+  "has_maps": true/false
+}
+
+إذا لم تجد معلومات عن مساجد، أرجع: {"mosques_count": 0, "mosques": []}
+"""
+
 
 class ConversationAnalyzer:
     """Analyze Telegram conversations to group mosque data properly."""
 
-    def __init__(self, export_path: str, output_dir: str = "out_csv"):
+    def __init__(self, export_path: str, output_dir: str = "out_csv", max_workers: int = 4):
         self.export_path = Path(export_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
 
         self.export_data = None
+        self.maps = None  # MapsRegistry of the export
         self.topics = {}  # topic_id -> province_name
         self.messages_by_topic = {}  # topic_id -> [messages]
         self.clusters = []  # Final conversation clusters
+        self.max_workers = max_workers  # Parallel sub-cluster requests
+        self.split_count = 0  # Clusters that exceeded the token budget
+
+        # Fingerprint -> AI result from earlier runs (unchanged clusters are reused)
+        self.fingerprint_cache_path = self.output_dir / "cluster_fingerprints.json"
+        self.reused_clusters = 0
+        self.new_clusters = 0
 
         # Initialize Claude AI
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in .env file")
-        self.client = Anthropic(api_key=api_key)
+        self.client = create_client(api_key)
+        self.telemetry = AITelemetry('analyze_conversations')
+
+        self.system_prompt = build_system(CLUSTER_INSTRUCTIONS)
+
+        # Cheapest Haiku first, escalate to Sonnet only for doubtful clusters
+        self.router = TieredModelRouter(['claude-3-haiku-20240307', 'claude-3-5-sonnet-20241022'])
 
         self.api_calls = 0
         self.total_cost = 0.0
+        self.cache_write_tokens = 0
+        self.cache_read_tokens = 0
+        self._stats_lock = threading.Lock()  # Sub-clusters run in worker threads
 
         print("=" * 70)
         print("🔍 CONVERSATION-FIRST ANALYZER")
@@ -66,6 +129,8 @@ class ConversationAnalyzer:
         with open(self.export_path, 'r', encoding='utf-8') as f:
             self.export_data = json.load(f)
         print(f"✅ Loaded {len(self.export_data['messages'])} messages")
+        self.maps = MapsRegistry(self.export_data['messages'])
+        print(f"✅ Maps links: {len(self.maps)} unique")
 
     def extract_topics(self):
         """Extract topics (provinces) from service messages."""
@@ -126,61 +191,25 @@ class ConversationAnalyzer:
         """
         print("\n🔗 Clustering consecutive messages...")
 
-        all_clusters = []
+        # Cluster parameters
+        MAX_TIME_GAP_MINUTES = 10
+        MAX_ID_GAP = 10
 
-        for topic_id, messages in self.messages_by_topic.items():
-            if len(messages) == 0:
-                continue
-
-            province = self.topics[topic_id]
+        # Topic codes follow messages_by_topic order so cluster ids stay stable
+        topic_order = list(self.messages_by_topic.keys())
+        messages = [msg for topic_id in topic_order for msg in self.messages_by_topic[topic_id]]
+        codes = [code for code, topic_id in enumerate(topic_order)
+                 for _ in self.messages_by_topic[topic_id]]
+        index = MessageIndex(messages, topics=codes)
 
-            # Sort by message ID
-            sorted_msgs = sorted(messages, key=lambda m: m['id'])
-
-            # Cluster parameters
-            MAX_TIME_GAP_MINUTES = 10
-            MAX_ID_GAP = 10
-
-            current_cluster = []
-            last_timestamp = None
-            last_id = None
-
-            for msg in sorted_msgs:
-                msg_id = msg['id']
-                timestamp = datetime.fromisoformat(msg['date'].replace('Z', '+00:00'))
-
-                # Check if this message should start a new cluster
-                start_new_cluster = False
-
-                if current_cluster:
-                    time_gap = (timestamp - last_timestamp).total_seconds() / 60
-                    id_gap = msg_id - last_id
-
-                    if time_gap > MAX_TIME_GAP_MINUTES or id_gap > MAX_ID_GAP:
-                        start_new_cluster = True
-
-                if start_new_cluster:
-                    # Save current cluster
-                    if len(current_cluster) > 0:
-                        all_clusters.append({
-                            'topic_id': topic_id,
-                            'province': province,
-                            'messages': current_cluster.copy()
-                        })
-                    current_cluster = []
-
-                # Add message to current cluster
-                current_cluster.append(msg)
-                last_timestamp = timestamp
-                last_id = msg_id
-
-            # Save final cluster
-            if len(current_cluster) > 0:
-                all_clusters.append({
-                    'topic_id': topic_id,
-                    'province': province,
-                    'messages': current_cluster
-                })
+        all_clusters = []
+        for rows in index.clusters(MAX_TIME_GAP_MINUTES * 60, MAX_ID_GAP):
+            topic_id = topic_order[index.topics[rows[0]]]
+            all_clusters.append({
+                'topic_id': topic_id,
+                'province': self.topics[topic_id],
+                'messages': [index.messages[r] for r in rows]
+            })
 
         self.clusters = all_clusters
         print(f"✅ Created {len(self.clusters)} message clusters")
@@ -227,19 +256,13 @@ class ConversationAnalyzer:
                     'text': text
                 })
 
-                # Check for maps URLs in text
-                if 'maps.app.goo.gl' in text or 'maps.google.com' in text:
-                    # Extract URL
-                    import re
-                    url_pattern = r'(https?://[^\s]+)'
-                    urls = re.findall(url_pattern, text)
-                    for url in urls:
-                        if 'maps' in url:
-                            maps_urls.append({
-                                'message_id': msg_id,
-                                'url': url,
-                                'context': text
-                            })
+                # Maps URLs found once, up front, by the registry
+                for url in self.maps.urls_in(msg_id):
+                    maps_urls.append({
+                        'message_id': msg_id,
+                        'url': url,
+                        'context': text
+                    })
 
         return {
             'photos': photos,
@@ -279,53 +302,31 @@ class ConversationAnalyzer:
         if not combined_text and len(content['photos']) == 0:
             return None  # Nothing to analyze
 
-        prompt = f"""أنت خبير في تحليل بيانات المساجد من محادثات تيليجرام.
-
-**المقاطعة:** {province}
+        prompt = f"""**المقاطعة:** {province}
 
 **النصوص في المحادثة:**
 {combined_text if combined_text else 'لا يوجد نص (فقط صور)'}
 
 **عدد الصور:** {len(content['photos'])}
 **عدد روابط الخرائط:** {len(content['maps'])}
-**عدد الفيديوهات:** {len(content['videos'])}
+**عدد الفيديوهات:** {len(content['videos'])}"""
 
-**المطلوب:**
-1. استخرج أسماء المساجد من النصوص
-2. حدد المنطقة/المدينة إذا كانت مذكورة
-3. حدد إذا كان هناك مسجد واحد أم عدة مساجد
-4. حدد نوع الضرر إذا ذُكر (متضرر/مدمر)
-
-**الرد بصيغة JSON فقط (بدون أي نص إضافي):**
-{{
-  "mosques_count": عدد المساجد,
-  "mosques": [
-    {{
-      "name": "اسم المسجد",
-      "area": "المنطقة",
-      "damage_type": "damaged/demolished/unknown",
-      "confidence": "high/medium/low",
-      "reasoning": "سبب هذا الاستنتاج"
-    }}
-  ],
-  "has_photos": true/false,
-  "has_maps": true/false
-}}
-
-إذا لم تجد معلومات عن مساجد، أرجع: {{"mosques_count": 0, "mosques": []}}
-"""
-
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
+        def call(model: str) -> Dict:
+            response = self.telemetry.create(
+                self.client,
+                model=model,
                 max_tokens=1024,
                 temperature=0.1,
+                system=self.system_prompt,
                 messages=[{"role": "user", "content": prompt}]
             )
 
-            self.api_calls += 1
-            # Estimate cost (Haiku: $0.00025 per 1K input tokens, $0.00125 per 1K output)
-            self.total_cost += 0.0005  # Rough estimate
+            usage = cache_usage(response)
+            with self._stats_lock:
+                self.api_calls += 1
+                self.cache_write_tokens += usage['cache_write_tokens']
+                self.cache_read_tokens += usage['cache_read_tokens']
+                self.total_cost += call_cost(model, response.usage)
 
             # Parse JSON response
             response_text = response.content[0].text.strip()
@@ -346,7 +347,20 @@ class ConversationAnalyzer:
 
             # Replace any problematic quotes in Arabic text
             # This is a workaround for malformed JSON from AI
-            result = json.loads(response_text)
+            try:
+                return json.loads(response_text)
+            except json.JSONDecodeError:
+                self.telemetry.mark_outcome(response, 'unparseable')
+                raise
+
+        # Rule-based fast path: mosque-naming texts in this cluster
+        expected_count = count_mosque_texts([t['text'] for t in content['text']])
+
+        try:
+            result, model = self.router.route(
+                call,
+                lambda r: escalation_reason(r.get('mosques', []), expected_count)
+            )
 
             # Enhance result with cluster content
             if result.get('mosques_count', 0) > 0:
@@ -359,30 +373,206 @@ class ConversationAnalyzer:
                     mosque['video_files'] = [v['file_path'] for v in content['videos']]
                     mosque['message_ids'] = [m['id'] for m in cluster_data['messages']]
                     mosque['original_text'] = combined_text
+                    mosque['ai_model'] = model
 
             return result
 
         except json.JSONDecodeError as e:
             print(f"   ⚠️ JSON Error cluster {cluster_id}: {str(e)[:100]}")
-            # Return empty result to skip this cluster
-            return {'mosques_count': 0, 'mosques': []}
+            # Return empty result to skip this cluster (not cached, retried next run)
+            return {'mosques_count': 0, 'mosques': [], 'error': True}
         except Exception as e:
             print(f"   ⚠️ Error cluster {cluster_id}: {str(e)[:100]}")
-            return {'mosques_count': 0, 'mosques': []}
+            return {'mosques_count': 0, 'mosques': [], 'error': True}
+
+    def estimate_tokens(self, msg: Dict) -> int:
+        """Estimate the prompt tokens a message contributes (from text length)."""
+        return len(self._extract_text(msg.get('text', ''))) // CHARS_PER_TOKEN + MESSAGE_TOKEN_OVERHEAD
+
+    def _is_boundary(self, prev_msg: Dict, gap: float) -> bool:
+        """A maps link or a long pause (`gap` seconds) usually closes one mosque's entry."""
+        return self.maps.has_maps(prev_msg['id']) or gap >= BOUNDARY_GAP_SECONDS
+
+    def split_cluster(self, cluster: Dict, token_budget: int = CLUSTER_TOKEN_BUDGET,
+                      overlap: int = SPLIT_OVERLAP) -> List[Dict]:
+        """
+        Split a cluster into sub-clusters that each fit the token budget.
+
+        Splits prefer natural boundaries (after a maps link or before a long
+        pause) in the second half of each window, and consecutive
+        sub-clusters share `overlap` messages so no mosque entry is cut in
+        half without context.
+        """
+        messages = cluster['messages']
+        costs = [self.estimate_tokens(m) for m in messages]
+
+        if sum(costs) <= token_budget:
+            return [cluster]
+
+        epochs = parse_epochs(m.get('date') for m in messages)
+        parts = []
+        start = 0
+        while start < len(messages):
+            # Grow the window while it fits (always take at least one message)
+            end = start
+            total = 0
+            while end < len(messages) and (end == start or total + costs[end] <= token_budget):
+                total += costs[end]
+                end += 1
+
+            # Pull the split back to the latest natural boundary, if any
+            if end < len(messages):
+                for i in range(end - 1, start + (end - start) // 2, -1):
+                    if self._is_boundary(messages[i - 1], epochs[i] - epochs[i - 1]):
+                        end = i
+                        break
+
+            parts.append({**cluster, 'messages': messages[start:end]})
+            if end >= len(messages):
+                break
+            start = max(end - overlap, start + 1)
+
+        return parts
+
+    def _mosque_key(self, mosque: Dict) -> Tuple[str, str]:
+        """Dedup key for mosques seen in overlapping sub-clusters."""
+        def clean(value) -> str:
+            value = ' '.join(str(value or '').split())
+            for prefix in ('مسجد ', 'جامع ', 'مصلى '):
+                if value.startswith(prefix):
+                    value = value[len(prefix):]
+            return value
+        return clean(mosque.get('name')), clean(mosque.get('area'))
+
+    def stitch_results(self, results: List[Optional[Dict]]) -> Dict:
+        """Merge sub-cluster results, collapsing mosques found twice in the overlap."""
+        confidence_rank = {'high': 3, 'medium': 2, 'low': 1}
+        merged = {}
+        error = False
+
+        for result in results:
+            if not result:
+                continue
+            error = error or result.get('error', False)
+            for mosque in result.get('mosques', []):
+                key = self._mosque_key(mosque)
+                if key not in merged:
+                    merged[key] = mosque
+                    continue
+
+                existing = merged[key]
+                for col in ['photo_files', 'maps_urls', 'video_files', 'message_ids']:
+                    seen = existing.get(col, [])
+                    existing[col] = seen + [v for v in mosque.get(col, []) if v not in seen]
+                existing['photo_count'] = len(existing.get('photo_files', []))
+                if (confidence_rank.get(mosque.get('confidence'), 0) >
+                        confidence_rank.get(existing.get('confidence'), 0)):
+                    existing['confidence'] = mosque['confidence']
+
+        mosques = list(merged.values())
+        stitched = {'mosques_count': len(mosques), 'mosques': mosques}
+        if error:
+            stitched['error'] = True
+        return stitched
+
+    def analyze_cluster(self, cluster: Dict, cluster_id: int) -> Optional[Dict]:
+        """Analyze one cluster, splitting it into parallel sub-clusters if too large."""
+        parts = self.split_cluster(cluster)
+        if len(parts) == 1:
+            return self.parse_cluster_with_ai(cluster, cluster_id)
+
+        self.split_count += 1
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(parts))) as pool:
+            results = list(pool.map(lambda part: self.parse_cluster_with_ai(part, cluster_id), parts))
+
+        return self.stitch_results(results)
+
+    def fingerprint_cluster(self, cluster: Dict) -> str:
+        """
+        Fingerprint a cluster by province, message ids, text hashes and files.
+
+        The prompt instructions are hashed in too, so editing the prompt
+        invalidates every stored result.
+        """
+        digest = hashlib.sha256(CLUSTER_INSTRUCTIONS.encode('utf-8'))
+        digest.update(str(cluster['province']).encode('utf-8'))
+
+        for msg in cluster['messages']:
+            text = self._extract_text(msg.get('text', ''))
+            text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            file_path = msg.get('file') or msg.get('photo') or ''
+            digest.update(f"\n{msg['id']}|{text_hash}|{file_path}".encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def estimate_cost(self, clusters: List[Dict]) -> float:
+        """
+        Fast-tier cost of analyzing `clusters`, like perfect_ai_etl's estimate_run.
+
+        Input tokens come from the instructions and message text lengths;
+        output tokens from the number of mosque-naming texts.
+        """
+        input_tokens = 0
+        output_tokens = 0
+        for cluster in clusters:
+            messages = cluster['messages']
+            input_tokens += len(CLUSTER_INSTRUCTIONS) // CHARS_PER_TOKEN
+            input_tokens += sum(self.estimate_tokens(m) for m in messages)
+            texts = [self._extract_text(m.get('text', '')) for m in messages]
+            output_tokens += 100 + 150 * count_mosque_texts(texts)
+
+        input_price, output_price = MODEL_PRICING.get(self.router.tiers[0],
+                                                      MODEL_PRICING['claude-3-5-sonnet-20241022'])
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def load_fingerprint_cache(self) -> Dict[str, Dict]:
+        """Load fingerprint -> result from previous runs."""
+        if not self.fingerprint_cache_path.exists():
+            return {}
+        with open(self.fingerprint_cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_fingerprint_cache(self, cache: Dict[str, Dict]):
+        """Persist fingerprint -> result (written atomically)."""
+        tmp_path = self.fingerprint_cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        tmp_path.replace(self.fingerprint_cache_path)
 
     def analyze_all_clusters(self):
-        """Analyze all message clusters using AI."""
+        """Analyze new or changed clusters with AI, reusing stored results for the rest."""
+        previous = self.load_fingerprint_cache()
+        fingerprints = [self.fingerprint_cluster(c) for c in self.clusters]
+        pending_clusters = [c for c, fp in zip(self.clusters, fingerprints) if fp not in previous]
+        pending = len(pending_clusters)
+
         print(f"\n🤖 Analyzing {len(self.clusters)} clusters with Claude AI...")
-        print(f"   Estimated cost: ${len(self.clusters) * 0.0005:.2f}")
+        print(f"   • Unchanged (reused): {len(self.clusters) - pending}")
+        print(f"   • New or changed: {pending}")
+        print(f"   Estimated cost: ~${self.estimate_cost(pending_clusters):.2f} (fast tier)")
 
         extracted_mosques = []
         processed = 0
+        cache = {}  # Only fingerprints still present in this export are kept
 
         for idx, cluster in enumerate(self.clusters):
             if idx % 50 == 0 and idx > 0:
                 print(f"   Progress: {idx}/{len(self.clusters)} ({idx/len(self.clusters)*100:.1f}%)")
+                self.save_fingerprint_cache({**previous, **cache})
+
+            fp = fingerprints[idx]
+            if fp in previous:
+                result = copy.deepcopy(previous[fp])
+                # Cluster ids are positional and shift between exports
+                for mosque in result.get('mosques', []):
+                    mosque['cluster_id'] = idx
+                self.reused_clusters += 1
+            else:
+                result = self.analyze_cluster(cluster, idx)
+                self.new_clusters += 1
 
-            result = self.parse_cluster_with_ai(cluster, idx)
+            if not (result and result.get('error')):
+                cache[fp] = result or {'mosques_count': 0, 'mosques': []}
 
             if result and result.get('mosques_count', 0) > 0:
                 for mosque in result['mosques']:
@@ -391,11 +581,19 @@ class ConversationAnalyzer:
 
             processed += 1
 
+        self.save_fingerprint_cache(cache)
+
         print(f"\n✅ AI Analysis complete!")
-        print(f"   • Clusters analyzed: {processed}")
+        print(f"   • Clusters processed: {processed}")
+        print(f"   • Reused (unchanged): {self.reused_clusters}")
+        print(f"   • Analyzed (new/changed): {self.new_clusters}")
+        print(f"   • Clusters split by token budget: {self.split_count}")
         print(f"   • Mosques extracted: {len(extracted_mosques)}")
         print(f"   • API calls: {self.api_calls}")
         print(f"   • Total cost: ${self.total_cost:.2f}")
+        print(f"   • Cache hit tokens: {self.cache_read_tokens:,} (written: {self.cache_write_tokens:,})")
+        self.router.print_summary()
+        self.telemetry.report()
 
         return extracted_mosques
 
@@ -428,9 +626,12 @@ class ConversationAnalyzer:
             f.write("=" * 70 + "\n\n")
 
             f.write(f"Total Clusters Analyzed: {len(self.clusters)}\n")
+            f.write(f"  • Reused (unchanged since last run): {self.reused_clusters}\n")
+            f.write(f"  • New or changed (sent to AI): {self.new_clusters}\n")
             f.write(f"Mosques Extracted: {len(df)}\n")
             f.write(f"API Calls: {self.api_calls}\n")
-            f.write(f"Total Cost: ${self.total_cost:.2f}\n\n")
+            f.write(f"Total Cost: ${self.total_cost:.2f}\n")
+            f.write(f"Cache Hit Tokens: {self.cache_read_tokens:,} (written: {self.cache_write_tokens:,})\n\n")
 
             f.write("By Province:\n")
             for province in df['province'].unique():
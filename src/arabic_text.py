@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arabic Text Normalization
+=========================
+One normalization shared by every matcher (merge, photo fixing, ETL).
+
+- alef variants (أ إ آ ٱ) -> ا, ta marbuta ة -> ه, alef maqsura / Farsi ya -> ي
+- diacritics (tashkeel, superscript alef) and tatweel removed
+- whitespace collapsed, lower-cased (for Latin text)
+- optionally the mosque prefix (مسجد / جامع / مصلى) stripped
+
+`skeleton_key` goes further for exact joins: no prefix, no "ال" article,
+tokens sorted, so "جامع الرحمة الكبير" and "مسجد كبير  الرحمه" share a key.
+
+Normalize a whole column once and keep the result:
+
+    add_normalized_columns(df, {'mosque_name': 'name_norm', 'area': 'area_norm'})
+    df['name_norm']  # reused by every comparison
+"""
+
+import re
+from typing import Dict, Optional
+
+import pandas as pd
+
+# Single translate table: character variants folded, marks deleted
+_FOLD = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي', 'ی': 'ي',
+}
+_DELETE = [chr(c) for c in range(0x064B, 0x0653)] + ['ٰ', 'ـ']  # tashkeel, dagger alef, tatweel
+TRANSLATION_TABLE = str.maketrans({**_FOLD, **{ch: None for ch in _DELETE}})
+
+# Prefixes in their normalized spelling (مصلى -> مصلي)
+MOSQUE_PREFIXES = ('مسجد', 'جامع', 'مصلي')
+_PREFIX_PATTERN = re.compile(r'^(?:' + '|'.join(MOSQUE_PREFIXES) + r')\s+')
+_SPACES = re.compile(r'\s+')
+_COMPOUND = re.compile(r'(?:^|(?<=\s))(عبد|ابو)(?=ال)')  # عبدالرحمن -> عبد الرحمن
+_ARTICLE = re.compile(r'(?:^|(?<=\s))ال(?=\S{2})')
+
+
+def normalize_arabic(text, strip_prefix: bool = False) -> str:
+    """Normalize one string (missing values become '')."""
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ''
+    text = _SPACES.sub(' ', str(text).translate(TRANSLATION_TABLE)).strip()
+    if strip_prefix:
+        text = _PREFIX_PATTERN.sub('', text)
+    return text.lower()
+
+
+def normalize_name(text) -> str:
+    """Normalize a mosque name and strip its مسجد/جامع/مصلى prefix."""
+    return normalize_arabic(text, strip_prefix=True)
+
+
+def normalize_series(values: pd.Series, strip_prefix: bool = False) -> pd.Series:
+    """Vectorized `normalize_arabic` over a whole column."""
+    text = values.astype('string').fillna('')
+    text = text.str.translate(TRANSLATION_TABLE).str.replace(_SPACES, ' ', regex=True).str.strip()
+    if strip_prefix:
+        text = text.str.replace(_PREFIX_PATTERN, '', regex=True)
+    return text.str.lower().astype(object)
+
+
+def add_normalized_columns(df: pd.DataFrame, columns: Dict[str, str],
+                           strip_prefix: Optional[Dict[str, bool]] = None) -> pd.DataFrame:
+    """
+    Store normalized copies of `columns` (source -> target) on `df` in place.
+
+    Names (targets ending in 'name_norm') get their prefix stripped unless
+    `strip_prefix` says otherwise. Targets that already exist are kept, so
+    repeated calls are free. Missing source columns give ''.
+    """
+    strip_prefix = strip_prefix or {}
+    for source, target in columns.items():
+        if target in df:
+            continue
+        strip = strip_prefix.get(source, target.endswith('name_norm'))
+        if source in df:
+            df[target] = normalize_series(df[source], strip_prefix=strip)
+        else:
+            df[target] = ''
+    return df
+
+
+def skeleton_key(text) -> str:
+    """
+    Aggressive matching key: normalized, prefix stripped, "ال" removed from
+    every word (also in "عبدال..."), tokens sorted.
+    """
+    text = _ARTICLE.sub('', _COMPOUND.sub(r'\1 ', normalize_name(text)))
+    return ' '.join(sorted(text.split()))
+
+
+def skeleton_series(values: pd.Series) -> pd.Series:
+    """`skeleton_key` over a whole column (normalization vectorized)."""
+    text = normalize_series(values, strip_prefix=True).str.replace(_COMPOUND, r'\1 ', regex=True)
+    text = text.str.replace(_ARTICLE, '', regex=True)
+    return pd.Series([' '.join(sorted(t.split())) for t in text], index=values.index, dtype=object)
@@ -10,13 +10,20 @@ load_dotenv()
 
 from anthropic import Anthropic
 
+from model_router import DEFAULT_TIERS, tiers_from_env
+
 client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
 
+# Models used by the tiered router (fast -> strong)
+tier_models = tiers_from_env(DEFAULT_TIERS)
+
 # List of all possible Claude models
 all_models = [
     "claude-3-5-sonnet-latest",
     "claude-3-5-sonnet-20241022",
     "claude-3-5-sonnet-20240620",
+    "claude-3-5-haiku-latest",
+    "claude-3-5-haiku-20241022",
     "claude-3-opus-latest",
     "claude-3-opus-20240229",
     "claude-3-sonnet-latest",
@@ -32,7 +39,7 @@ print("="*60)
 
 working_models = []
 
-for model in all_models:
+for model in all_models + [m for m in tier_models if m not in all_models]:
     try:
         message = client.messages.create(
             model=model,
@@ -56,6 +63,11 @@ if working_models:
     print("\nYou can use these models:")
     for model in working_models:
         print(f"  • {model}")
+    missing_tiers = [m for m in tier_models if m not in working_models]
+    if missing_tiers:
+        print("\n⚠️  Router tiers not available (set AI_MODEL_TIERS to override):")
+        for model in missing_tiers:
+            print(f"  • {model}")
 else:
     print("\n❌ No models available!")
     print("\nPossible issues:")
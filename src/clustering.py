@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conversation Clustering Engine
+==============================
+One vectorized clustering implementation shared by every stage.
+
+Messages are turned into NumPy columns (topic, epoch seconds, id) once.
+Clustering is then a single sort plus vectorized gap masks:
+
+    order, starts = cluster_boundaries(topics, epochs, ids, max_time_gap=600, max_id_gap=10)
+    for members in split_clusters(order, starts):
+        ...  # members are row positions into the original columns
+
+A new cluster starts whenever the topic changes, the time gap to the
+previous message exceeds `max_time_gap` seconds, or (optionally) the id gap
+exceeds `max_id_gap`.
+
+`ThreadIndex` numbers messages by their position inside their topic, so
+"nearby" means nearby in the same thread rather than nearby global ids.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+def parse_epochs(dates: Iterable[Optional[str]]) -> np.ndarray:
+    """
+    Parse ISO timestamps to epoch seconds in one vectorized pass.
+
+    Missing or unparseable dates become NaN.
+    """
+    parsed = pd.to_datetime(pd.Series(list(dates), dtype=object), errors='coerce',
+                            utc=True, format='ISO8601')
+    return (parsed - _EPOCH).dt.total_seconds().to_numpy(dtype=float)
+
+
+class MessageIndex:
+    """Column arrays (id, topic, epoch seconds) for messages, sorted by id."""
+
+    def __init__(self, messages: List[Dict], topics: Optional[Iterable[int]] = None):
+        """
+        Args:
+            messages: Telegram message dicts
+            topics: Topic code per message (defaults to reply_to_message_id, -1 if none)
+        """
+        ids = np.fromiter((m['id'] for m in messages), dtype=np.int64, count=len(messages))
+        if topics is None:
+            topics = (m.get('reply_to_message_id') or -1 for m in messages)
+        topic_arr = np.fromiter(topics, dtype=np.int64, count=len(messages))
+        epochs = parse_epochs(m.get('date') for m in messages)
+
+        order = np.argsort(ids, kind='stable')
+        self.messages = [messages[i] for i in order]
+        self.ids = ids[order]
+        self.topics = topic_arr[order]
+        self.epochs = epochs[order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def locate(self, msg_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row position of every given id plus a mask of which ids were found.
+
+        Positions of unknown ids are meaningless; filter them with the mask.
+        """
+        wanted = np.asarray(msg_ids if isinstance(msg_ids, np.ndarray) else list(msg_ids),
+                            dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.zeros(len(wanted), dtype=np.int64), np.zeros(len(wanted), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.ids, wanted), len(self.ids) - 1)
+        return pos, self.ids[pos] == wanted
+
+    def positions(self, msg_ids: Iterable[int]) -> np.ndarray:
+        """Row positions for the given ids (unknown ids are dropped, order kept)."""
+        pos, found = self.locate(msg_ids)
+        return pos[found]
+
+    def clusters(self, max_time_gap: float, max_id_gap: Optional[int] = None,
+                 mask: Optional[np.ndarray] = None) -> List[np.ndarray]:
+        """Cluster the (optionally masked) rows; returns row positions per cluster."""
+        rows = np.arange(len(self.ids)) if mask is None else np.flatnonzero(mask)
+        order, starts = cluster_boundaries(self.topics[rows], self.epochs[rows], self.ids[rows],
+                                           max_time_gap, max_id_gap)
+        return split_clusters(rows[order], starts)
+
+
+class ThreadIndex:
+    """
+    Position of every message within its topic thread, built once.
+
+    Messages are keyed as segment * KEY_STRIDE + position, where position
+    counts messages of the same topic in id order and a segment is a topic
+    (optionally cut wherever the thread went quiet for more than
+    `max_time_gap` seconds). Keys within `radius` of each other are then
+    at most `radius` messages apart in one conversation.
+    """
+
+    KEY_STRIDE = 1 << 32
+
+    def __init__(self, index: MessageIndex, max_time_gap: Optional[float] = None):
+        self.index = index
+        n = len(index)
+        order = np.argsort(index.topics, kind='stable')  # Rows are id-sorted already
+        topics = index.topics[order]
+
+        topic_start = np.ones(n, dtype=bool)
+        topic_start[1:] = topics[1:] != topics[:-1]
+        segment_start = topic_start.copy()
+        if max_time_gap is not None and n > 1:
+            segment_start[1:] |= np.diff(index.epochs[order]) > max_time_gap  # NaN never cuts
+
+        starts = np.flatnonzero(topic_start)
+        first = starts[np.cumsum(topic_start) - 1]
+        self.positions = np.empty(n, dtype=np.int64)
+        self.positions[order] = np.arange(n) - first
+        self.segments = np.empty(n, dtype=np.int64)
+        self.segments[order] = np.cumsum(segment_start) - 1
+
+    def keys(self, msg_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Thread key of every given id plus a mask of which ids were found."""
+        pos, found = self.index.locate(msg_ids)
+        if len(self.index) == 0:
+            return np.zeros(len(pos), dtype=np.int64), found
+        return self.segments[pos] * self.KEY_STRIDE + self.positions[pos], found
+
+
+def cluster_boundaries(topics: np.ndarray, epochs: np.ndarray, ids: np.ndarray,
+                       max_time_gap: float,
+                       max_id_gap: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sort messages by (topic, id) and find where each cluster starts.
+
+    Rows with a NaN epoch (missing date) are left out.
+
+    Returns:
+        (order, starts): `order` holds row positions in cluster order and
+        `starts` the offsets into `order` where each cluster begins.
+    """
+    topics = np.asarray(topics)
+    epochs = np.asarray(epochs, dtype=float)
+    ids = np.asarray(ids)
+
+    valid = np.flatnonzero(~np.isnan(epochs))
+    order = valid[np.lexsort((ids[valid], topics[valid]))]
+
+    breaks = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        t = topics[order]
+        breaks[1:] = (t[1:] != t[:-1]) | (np.diff(epochs[order]) > max_time_gap)
+        if max_id_gap is not None:
+            breaks[1:] |= np.diff(ids[order]) > max_id_gap
+
+    return order, np.flatnonzero(breaks)
+
+
+def split_clusters(order: np.ndarray, starts: np.ndarray) -> List[np.ndarray]:
+    """Cut `order` at `starts` into one array of row positions per cluster."""
+    if len(order) == 0:
+        return []
+    return np.split(order, starts[1:])
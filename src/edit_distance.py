@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bit-Parallel Edit-Distance Similarity
+=====================================
+Levenshtein similarity for name matching (Myers' bit-vector algorithm).
+
+One query is scored against many candidates at once: candidates are packed
+into a NumPy code-point array and every candidate's bit-vector state is
+advanced together, one column per step. Candidates that can no longer reach
+the threshold are dropped on the way, and the loop ends when none is left.
+Small batches (a trigram shortlist) run the same algorithm on Python ints,
+which beats NumPy's per-call overhead there.
+
+    ratio('النور الكبير', 'النور الكبيرة')           # 0.92
+    batch_ratio(query, PackedStrings(names), 0.8)  # array of ratios
+    search_ratio(names, long_text, 0.85)           # best fuzzy occurrence
+
+ratio = 1 - distance / max(len(a), len(b)); 0.0 when either string is empty,
+like merge_data.similarity_ratio always did.
+"""
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+WORD_BITS = 64  # Longest query handled by the NumPy kernel (longer: Python ints)
+MIN_NUMPY_BATCH = 32  # Fewer candidates than this are scored one by one
+_ONE = np.uint64(1)
+
+
+class PackedStrings:
+    """Strings as a zero-padded (n, max_len) array of code points plus lengths."""
+
+    def __init__(self, texts: Sequence[str] = (), codes: Optional[np.ndarray] = None,
+                 lengths: Optional[np.ndarray] = None):
+        if codes is None:
+            texts = ['' if t is None else str(t) for t in texts]
+            lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+            codes = np.zeros((len(texts), int(lengths.max()) if len(texts) else 0), dtype=np.int32)
+            for row, text in enumerate(texts):
+                if text:
+                    codes[row, :len(text)] = np.frombuffer(text.encode('utf-32-le'), dtype=np.int32)
+        self.codes = codes
+        self.lengths = lengths
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def take(self, rows) -> 'PackedStrings':
+        """Subset by row positions (no re-encoding)."""
+        lengths = self.lengths[rows]
+        width = int(lengths.max()) if len(lengths) else 0
+        return PackedStrings(codes=self.codes[rows, :width], lengths=lengths)
+
+    def text(self, row: int) -> str:
+        return ''.join(map(chr, self.codes[row, :self.lengths[row]]))
+
+
+def levenshtein(a: str, b: str, max_dist: Optional[int] = None) -> int:
+    """
+    Edit distance of two strings (bit-parallel over Python ints, any length).
+
+    With `max_dist`, stops as soon as the distance must exceed it and
+    returns max_dist + 1.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+    if max_dist is not None and len(a) - m > max_dist:
+        return max_dist + 1
+
+    peq = {}
+    for i, ch in enumerate(b):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    vp, vn, score = mask, 0, m
+    remaining = len(a)
+    for ch in a:
+        remaining -= 1
+        eq = peq.get(ch, 0)
+        xv = eq | vn
+        xh = ((((eq & vp) + vp) & mask) ^ vp) | eq
+        ph = vn | (~(xh | vp) & mask)
+        mh = vp & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        vp = mh | (~(xv | ph) & mask)
+        vn = ph & xv
+        if max_dist is not None and score - remaining > max_dist:
+            return max_dist + 1
+    return score
+
+
+def ratio(a: str, b: str, threshold: float = 0.0) -> float:
+    """Levenshtein similarity of two strings in 0..1 (0.0 below `threshold`)."""
+    if not a or not b:
+        return 0.0
+    longest = max(len(a), len(b))
+    max_dist = int((1.0 - threshold) * longest + 1e-9) if threshold > 0 else None
+    dist = levenshtein(a, b, max_dist)
+    if max_dist is not None and dist > max_dist:
+        return 0.0
+    return 1.0 - dist / longest
+
+
+def _peq_table(query: str):
+    """Sorted code points of the query and the bit mask of each one's positions."""
+    alphabet = np.array(sorted(set(map(ord, query))), dtype=np.int32)
+    masks = np.zeros(len(alphabet), dtype=np.uint64)
+    for i, ch in enumerate(query):
+        masks[np.searchsorted(alphabet, ord(ch))] |= _ONE << np.uint64(i)
+    return alphabet, masks
+
+
+def _lookup(alphabet: np.ndarray, values: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """values[alphabet index of each code], 0 for codes not in the alphabet."""
+    pos = np.minimum(np.searchsorted(alphabet, codes), len(alphabet) - 1)
+    return np.where(alphabet[pos] == codes, values[pos], np.uint64(0))
+
+
+def batch_ratio(query: str, candidates: Union[PackedStrings, Sequence[str]],
+                threshold: float = 0.0) -> np.ndarray:
+    """
+    Levenshtein similarity of `query` to every candidate.
+
+    With a threshold, candidates are dropped as soon as they cannot reach
+    it (length difference first, then a running lower bound per column);
+    their ratio is reported as 0.0. Ratios at or above the threshold are
+    exact.
+    """
+    if not isinstance(candidates, PackedStrings):
+        candidates = PackedStrings(candidates)
+    n = len(candidates)
+    result = np.zeros(n)
+    m = len(query) if query else 0
+    if m == 0 or n == 0:
+        return result
+    if m > WORD_BITS or n < MIN_NUMPY_BATCH:
+        for row in range(n):
+            result[row] = ratio(query, candidates.text(row), threshold)
+        return result
+
+    lengths = candidates.lengths
+    longest = np.maximum(lengths, m)
+    max_dist = np.floor((1.0 - threshold) * longest + 1e-9).astype(np.int64)
+    alive = np.flatnonzero((lengths > 0) & (np.abs(lengths - m) <= max_dist))
+    if len(alive) == 0:
+        return result
+
+    alphabet, masks = _peq_table(query)
+    eq_all = _lookup(alphabet, masks, candidates.codes[alive])  # Match masks per cell
+    lengths, max_dist = lengths[alive], max_dist[alive]
+    mask = np.uint64((1 << m) - 1)
+    top = np.uint64(m - 1)
+    vp = np.full(len(alive), mask, dtype=np.uint64)
+    vn = np.zeros(len(alive), dtype=np.uint64)
+    score = np.full(len(alive), m, dtype=np.int64)
+    final = np.zeros(len(alive), dtype=np.int64)
+
+    for j in range(eq_all.shape[1]):
+        eq = eq_all[:, j]
+        xv = eq | vn
+        xh = ((((eq & vp) + vp) & mask) ^ vp) | eq
+        ph = vn | (~(xh | vp) & mask)
+        mh = vp & xh
+        score += ((ph >> top) & _ONE).astype(np.int64) - ((mh >> top) & _ONE).astype(np.int64)
+        ph = ((ph << _ONE) | _ONE) & mask
+        mh = (mh << _ONE) & mask
+        vp = mh | (~(xv | ph) & mask)
+        vn = ph & xv
+
+        # Candidates ending here are done; padding columns after that are ignored
+        ended = lengths == j + 1
+        final[ended] = score[ended]
+
+        # Each remaining column lowers the distance by at most one
+        keep = np.where(lengths <= j + 1, final <= max_dist, score - (lengths - j - 1) <= max_dist)
+        if not keep.all():
+            if not keep.any():
+                return result
+            alive, eq_all, lengths, max_dist = alive[keep], eq_all[keep], lengths[keep], max_dist[keep]
+            vp, vn, score, final = vp[keep], vn[keep], score[keep], final[keep]
+
+    ratios = 1.0 - final / np.maximum(lengths, m)
+    result[alive] = np.where(final <= max_dist, ratios, 0.0)
+    return result
+
+
+def search_ratio(patterns: Sequence[str], text: str, threshold: float = 0.0) -> np.ndarray:
+    """
+    Best approximate occurrence of every pattern anywhere in `text`.
+
+    Returns 1 - (fewest edits turning the pattern into some substring of the
+    text) / len(pattern) per pattern; all patterns are scanned together in
+    one pass over the text. Below `threshold` gives 0.0.
+    """
+    result = np.zeros(len(patterns))
+    if not text or len(patterns) == 0:
+        return result
+
+    text_codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.int32)
+    alphabet, text_ids = np.unique(text_codes, return_inverse=True)
+    packed = PackedStrings(patterns)
+    m = packed.lengths
+    rows = np.flatnonzero((m > 0) & (m <= WORD_BITS))
+
+    for row in np.flatnonzero(m > WORD_BITS):
+        result[row] = 1.0 - _search_distance(packed.text(row), text) / m[row]
+
+    if len(rows):
+        # Position masks of every pattern, per text character
+        peq = np.zeros((len(rows), len(alphabet)), dtype=np.uint64)
+        codes, lengths = packed.codes[rows], m[rows]
+        for i in range(codes.shape[1]):
+            used = i < lengths
+            pos = np.searchsorted(alphabet, codes[used, i])
+            found = (pos < len(alphabet)) & (alphabet[np.minimum(pos, len(alphabet) - 1)] == codes[used, i])
+            np.bitwise_or.at(peq, (np.flatnonzero(used)[found], pos[found]), _ONE << np.uint64(i))
+
+        mask = np.array([(1 << int(k)) - 1 for k in lengths], dtype=np.uint64)
+        high = _ONE << (lengths - 1).astype(np.uint64)
+        vp, vn = mask.copy(), np.zeros(len(rows), dtype=np.uint64)
+        score = lengths.astype(np.int64)
+        best = score.copy()
+        for tid in text_ids:
+            eq = peq[:, tid]
+            xv = eq | vn
+            xh = ((((eq & vp) + vp) & mask) ^ vp) | eq
+            ph = vn | (~(xh | vp) & mask)
+            mh = vp & xh
+            score += ((ph & high) != 0).astype(np.int64) - ((mh & high) != 0).astype(np.int64)
+            ph = (ph << _ONE) & mask  # A match may start anywhere: no carry-in
+            mh = (mh << _ONE) & mask
+            vp = mh | (~(xv | ph) & mask)
+            vn = ph & xv
+            np.minimum(best, score, out=best)
+            if not best.any():
+                break  # Every pattern found exactly
+        result[rows] = 1.0 - best / lengths
+
+    return np.where(result >= threshold, result, 0.0) if threshold > 0 else result
+
+
+def _search_distance(pattern: str, text: str) -> int:
+    """Fewest edits from `pattern` to any substring of `text` (plain DP)."""
+    previous = list(range(len(pattern) + 1))
+    best = previous[-1]
+    for ch in text:
+        current = [0]
+        for i, pch in enumerate(pattern, 1):
+            current.append(min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (pch != ch)))
+        previous = current
+        best = min(best, current[-1])
+    return best
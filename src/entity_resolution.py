@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-Source Entity Resolution
+==============================
+Reconciles every mosque list the pipeline produces into one record per
+real mosque:
+
+- out_csv/excel_mosques_master.csv        (official Excel lists)
+- out_csv/mosques_perfect_ai.csv          (perfect_ai_etl.py)
+- out_csv/conversation_clusters_analyzed.csv (analyze_conversations.py)
+- out_csv/ai_extracted_mosques.csv        (ai_extract.py)
+
+Steps:
+1. Load all sources into one frame and normalize names/areas once
+2. Skeleton prepass: records with the same province and skeleton name/area
+   key (see arabic_text.skeleton_key) are joined by hash
+3. Blocking: within each province, a trigram index proposes the few most
+   similar remaining records for every record (very common trigrams skipped)
+   and exact name/area similarity is computed for those pairs only
+4. Union-find merges accepted pairs transitively, across and within sources
+5. One canonical record per cluster, with provenance from every source
+
+Output: out_csv/mosques_resolved.csv
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from arabic_text import add_normalized_columns, skeleton_series
+from merge_data import similarity_ratio
+from trigram_index import trigrams
+from union_find import UnionFind
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except AttributeError:
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+# Sources in priority order (lower wins when building the canonical record).
+# `columns` maps each source's column names onto the shared schema.
+SOURCES = [
+    {'source': 'excel', 'path': 'out_csv/excel_mosques_master.csv', 'priority': 0,
+     'columns': {'mosque_name': 'name', 'area': 'area', 'province': 'province',
+                 'damage_type': 'damage_type'}},
+    {'source': 'perfect_ai', 'path': 'out_csv/mosques_perfect_ai.csv', 'priority': 1,
+     'columns': {'name': 'name', 'area': 'area', 'province': 'province', 'damage_type': 'damage_type',
+                 'confidence': 'confidence', 'photo_files': 'photo_files', 'video_files': 'video_files',
+                 'maps_urls': 'maps_urls', 'message_ids': 'message_ids'}},
+    {'source': 'conversations', 'path': 'out_csv/conversation_clusters_analyzed.csv', 'priority': 2,
+     'columns': {'name': 'name', 'area': 'area', 'province': 'province', 'damage_type': 'damage_type',
+                 'confidence': 'confidence', 'photo_files': 'photo_files', 'video_files': 'video_files',
+                 'maps_urls': 'maps_urls', 'message_ids': 'message_ids'}},
+    {'source': 'ai_extract', 'path': 'out_csv/ai_extracted_mosques.csv', 'priority': 3,
+     'columns': {'mosque_name': 'name', 'area': 'area', 'province': 'province',
+                 'damage_status': 'damage_type', 'confidence': 'confidence',
+                 'source_message_id': 'message_ids'}},
+]
+
+FIELDS = ['name', 'area', 'province', 'damage_type', 'confidence',
+          'photo_files', 'video_files', 'maps_urls', 'message_ids']
+LIST_FIELDS = ['photo_files', 'video_files', 'maps_urls', 'message_ids']
+
+MATCH_THRESHOLD = 0.85  # Same threshold as merge_data
+MIN_AREA_SIMILARITY = 0.5  # Both areas known but this different: different villages
+BLOCK_CANDIDATES = 10  # Candidates proposed per record by the blocking index
+MIN_BLOCK_OVERLAP = 0.3  # Trigram Dice overlap needed to become a candidate
+MAX_POSTING_SHARE = 0.2  # Trigrams in more than this share of a province don't block
+CONFIDENCE_RANK = {'high': 3, 'medium': 2, 'low': 1}
+_DIGITS = re.compile(r'\d+')
+
+
+def load_sources(sources: List[Dict]) -> pd.DataFrame:
+    """Load every available source into one frame with the shared schema."""
+    frames = []
+    for spec in sources:
+        path = Path(spec['path'])
+        if not path.exists():
+            print(f"   ⚠️ {spec['source']}: {path} not found, skipped")
+            continue
+
+        raw = pd.read_csv(path, encoding='utf-8-sig', dtype=str)
+        frame = pd.DataFrame({target: raw[col] if col in raw else np.nan
+                              for col, target in spec['columns'].items()})
+        for field in FIELDS:
+            if field not in frame:
+                frame[field] = np.nan
+        frame = frame[FIELDS]
+        frame.insert(0, 'source_row', np.arange(len(raw)))
+        frame.insert(0, 'priority', spec['priority'])
+        frame.insert(0, 'source', spec['source'])
+        frames.append(frame)
+        print(f"   • {spec['source']}: {len(frame)} records")
+
+    if not frames:
+        return pd.DataFrame(columns=['source', 'priority', 'source_row'] + FIELDS)
+    records = pd.concat(frames, ignore_index=True)
+    records['record_key'] = records['source'] + ':' + records['source_row'].astype(str)
+    return records
+
+
+def candidate_pairs(names: List[str], limit: int = BLOCK_CANDIDATES,
+                    min_overlap: float = MIN_BLOCK_OVERLAP,
+                    max_share: float = MAX_POSTING_SHARE) -> np.ndarray:
+    """
+    Blocking within one province: the `limit` records sharing the most
+    trigrams with each record.
+
+    Trigrams present in more than `max_share` of the records (e.g. " ال")
+    carry no signal and are left out of the index, which keeps every
+    lookup short.
+
+    Returns:
+        (k, 2) array of row pairs (i < j), deduplicated
+    """
+    n = len(names)
+    grams = [trigrams(name) for name in names]
+    postings: Dict[str, List[int]] = {}
+    for row, row_grams in enumerate(grams):
+        for gram in row_grams:
+            postings.setdefault(gram, []).append(row)
+
+    max_posting = max(limit * 2, int(n * max_share))
+    index = {g: np.asarray(rows) for g, rows in postings.items() if len(rows) <= max_posting}
+    sizes = np.array([len(g) for g in grams])
+
+    pairs = []
+    for row, row_grams in enumerate(grams):
+        hits = [index[g] for g in row_grams if g in index]
+        if not hits:
+            continue
+        others, shared = np.unique(np.concatenate(hits), return_counts=True)
+        dice = 2.0 * shared / np.maximum(sizes[others] + sizes[row], 1)
+        keep = (others != row) & (dice >= min_overlap)
+        others, dice = others[keep], dice[keep]
+        if len(others) > limit:
+            others = others[np.argpartition(-dice, limit - 1)[:limit]]
+        pairs.append(np.column_stack([np.full(len(others), row), others]))
+
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def score_pair(name1: str, area1: str, name2: str, area2: str) -> float:
+    """
+    Name/area similarity of two normalized records.
+
+    With both areas known: 0.7 name + 0.3 area, and clearly different areas
+    veto the match. Otherwise the name alone decides. Names carrying
+    different numbers ("النور 1" / "النور 2") never match.
+    """
+    if _DIGITS.findall(name1) != _DIGITS.findall(name2):
+        return 0.0
+    name_sim = similarity_ratio(name1, name2)
+    if area1 and area2:
+        area_sim = similarity_ratio(area1, area2)
+        if area_sim < MIN_AREA_SIMILARITY:
+            return 0.0
+        return name_sim * 0.7 + area_sim * 0.3
+    return name_sim
+
+
+class EntityResolver:
+    """Resolve N mosque lists into one canonical record per mosque."""
+
+    def __init__(self, sources: Optional[List[Dict]] = None, threshold: float = MATCH_THRESHOLD):
+        self.sources = sources or SOURCES
+        self.threshold = threshold
+        self.records = None
+        self.pairs = np.empty((0, 2), dtype=np.int64)
+        self.scores = np.empty(0)
+        self.entity_of = None
+        self.stats = {}
+
+    def load(self):
+        print("\n📖 Loading sources...")
+        self.records = load_sources(self.sources)
+        add_normalized_columns(self.records, {'name': 'name_norm', 'area': 'area_norm',
+                                              'province': 'province_norm'})
+        print(f"✅ {len(self.records)} records from {self.records['source'].nunique()} sources")
+
+    def skeleton_codes(self) -> np.ndarray:
+        """Group code per record: equal for same province + skeleton name/area."""
+        name_skel = skeleton_series(self.records['name'])
+        keys = (self.records['province_norm'] + '\x1f' + name_skel + '\x1f'
+                + skeleton_series(self.records['area']))
+        # Records without a usable name never join by key
+        keys = keys.where(name_skel != '', '#' + self.records['record_key'])
+        return pd.factorize(keys)[0]
+
+    def match(self):
+        """Join skeleton duplicates, then block, score and union every province."""
+        print("\n🔍 Skeleton-key prepass...")
+        names = self.records['name_norm'].tolist()
+        areas = self.records['area_norm'].tolist()
+
+        uf = UnionFind(len(self.records))
+        codes = self.skeleton_codes()
+        skeleton_merges = uf.join_groups(codes)
+        remaining = np.unique(codes, return_index=True)[1]
+        print(f"✅ {skeleton_merges:,} records joined by key, {len(remaining):,} left for fuzzy matching")
+
+        print("\n🔍 Blocking and scoring candidate pairs...")
+        all_pairs, all_scores = [], []
+        provinces = self.records['province_norm'].iloc[remaining]
+        for province, local_rows in provinces.groupby(provinces, sort=False).indices.items():
+            rows = remaining[local_rows]
+            local = candidate_pairs([f"{names[r]} {areas[r]}" for r in rows])
+            if len(local) == 0:
+                continue
+            pairs = rows[local]
+            scores = np.array([score_pair(names[i], areas[i], names[j], areas[j]) for i, j in pairs])
+            all_pairs.append(pairs)
+            all_scores.append(scores)
+
+        if all_pairs:
+            self.pairs = np.concatenate(all_pairs)
+            self.scores = np.concatenate(all_scores)
+
+        accepted = self.scores >= self.threshold
+        merges, conflicts = self.merge_pairs(uf, self.pairs[accepted], self.scores[accepted], areas)
+
+        self.stats = {
+            'records': len(self.records),
+            'skeleton_merges': skeleton_merges,
+            'candidate_pairs': len(self.pairs),
+            'accepted_pairs': int(accepted.sum()),
+            'fuzzy_merges': merges,
+            'area_conflicts': conflicts,
+            'entities': int(len(np.unique(self.entity_of)))
+        }
+        print(f"✅ {self.stats['candidate_pairs']:,} candidate pairs, "
+              f"{self.stats['accepted_pairs']:,} accepted, {self.stats['entities']:,} entities")
+        if conflicts:
+            print(f"   ⚠️ {conflicts:,} merges refused (clusters already in different areas)")
+        print(f"   • skeleton tier: {skeleton_merges:,} merges")
+        print(f"   • fuzzy tier: {merges:,} merges")
+
+    def merge_pairs(self, uf: UnionFind, pairs: np.ndarray, scores: np.ndarray,
+                    areas: List[str]) -> tuple:
+        """
+        Union accepted pairs, best score first.
+
+        A record without an area can bridge two records from different
+        areas; every cluster therefore carries its area, and a union joining
+        two clusters with clearly different areas is refused.
+
+        Returns:
+            (merges, refused)
+        """
+        cluster_area = list(areas)
+        merges = refused = 0
+        for k in np.argsort(-scores, kind='stable'):
+            ra, rb = uf.find(int(pairs[k, 0])), uf.find(int(pairs[k, 1]))
+            if ra == rb:
+                continue
+            area_a, area_b = cluster_area[ra], cluster_area[rb]
+            if area_a and area_b and similarity_ratio(area_a, area_b) < MIN_AREA_SIMILARITY:
+                refused += 1
+                continue
+            uf.union(ra, rb)
+            cluster_area[uf.find(ra)] = area_a or area_b
+            merges += 1
+        self.entity_of = uf.labels()
+        return merges, refused
+
+    def canonical_records(self) -> pd.DataFrame:
+        """
+        One row per entity. Fields come from the highest-priority source
+        that has them; media and message ids are unioned over all members.
+        """
+        df = self.records.copy()
+        df['entity'] = self.entity_of
+        # Members best-first; groups then come out in order of their primary record
+        df = df.sort_values(['priority', 'source_row'], kind='stable')
+        groups = df.groupby('entity', sort=False)
+
+        def present(values: pd.Series) -> pd.Series:
+            text = values.astype('string').str.strip()
+            return values.where(text.fillna('') != '')
+
+        damage = present(df['damage_type'])
+        damage = damage.where(damage.astype('string').str.lower() != 'unknown')
+        rank = df['confidence'].map(CONFIDENCE_RANK)
+        best_rank = rank.groupby(df['entity'], sort=False).max()
+        rank_names = {r: name for name, r in CONFIDENCE_RANK.items()}
+
+        result = pd.DataFrame({
+            'name': groups['name'].first(),
+            'area': present(df['area']).groupby(df['entity'], sort=False).first(),
+            'province': groups['province'].first(),
+            'damage_type': damage.groupby(df['entity'], sort=False).first().fillna('unknown'),
+            'confidence': best_rank.map(rank_names).fillna('high'),
+            **{field: self._union_lists(df, field) for field in LIST_FIELDS},
+            'sources': groups['source'].agg(lambda s: '; '.join(dict.fromkeys(s))),
+            'source_count': groups['source'].nunique(),
+            'member_count': groups.size(),
+            'source_records': groups['record_key'].agg('; '.join),
+            'primary_record': groups['record_key'].first()
+        })
+        result.insert(0, 'entity_id', [f"ENT_{i + 1:05d}" for i in range(len(result))])
+        return result.reset_index(drop=True)
+
+    @staticmethod
+    def _union_lists(df: pd.DataFrame, field: str) -> pd.Series:
+        """Semicolon-separated values of all members, de-duplicated, in member order."""
+        items = df[field].dropna().astype(str).str.split(';').explode().str.strip()
+        items = items[items != '']
+        entities = df.loc[items.index, 'entity']
+        unique = pd.DataFrame({'entity': entities.values, 'item': items.values}).drop_duplicates()
+        joined = unique.groupby('entity', sort=False)['item'].agg('; '.join)
+        return joined.reindex(df['entity'].unique())
+
+    def run(self, output_path: str = 'out_csv/mosques_resolved.csv') -> pd.DataFrame:
+        start = time.perf_counter()
+        self.load()
+        if len(self.records) == 0:
+            print("⚠️ No source files found")
+            return pd.DataFrame()
+        self.match()
+        resolved = self.canonical_records()
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        resolved.to_csv(output_path, index=False, encoding='utf-8')
+
+        print(f"\n📊 RESOLUTION COMPLETE ({time.perf_counter() - start:.1f}s):")
+        print(f"   Records in: {self.stats['records']:,}")
+        print(f"   Canonical mosques: {len(resolved):,}")
+        print(f"   Found in 2+ sources: {(resolved['source_count'] > 1).sum():,}")
+        for source, count in self.records['source'].value_counts().items():
+            print(f"   • {source}: {count:,} records")
+        print(f"\n✅ Output: {output_path}")
+        return resolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve all mosque lists into one canonical list')
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD,
+                        help='Minimum pair score to merge two records')
+    parser.add_argument('--output', default='out_csv/mosques_resolved.csv')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🧩 Multi-Source Entity Resolution")
+    print("=" * 60)
+    EntityResolver(threshold=args.threshold).run(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,31 +3,51 @@
 Extract GPS Coordinates from Google Maps URLs
 
 Parses Google Maps links to extract latitude and longitude coordinates.
+Short links are expanded up front, concurrently and once per unique link
+(see link_resolver.py). Results are cached in out_csv/gps_link_cache.json,
+so a rerun only goes to the network for links it has not seen; with
+--offline it never does.
 
 Author: Claude Code
 Date: October 25, 2025
 """
 
-import pandas as pd
-import re
-import requests
-from urllib.parse import urlparse, parse_qs
-from pathlib import Path
+import argparse
 import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from link_resolver import DEFAULT_CACHE_PATH, MAX_WORKERS, LinkCache, ShortLinkResolver
+from maps_links import coordinates_from_url, extract_urls, is_short_link
 
 
 class GPSExtractor:
     """Extract GPS coordinates from Google Maps URLs"""
 
-    def __init__(self, mosques_csv_path: str):
+    def __init__(self, mosques_csv_path: str, max_workers: int = MAX_WORKERS,
+                 resolver: Optional[ShortLinkResolver] = None,
+                 cache_path: str = DEFAULT_CACHE_PATH, offline: bool = False):
+        """
+        Args:
+            offline: Never resolve links; unseen short links get 'not_cached'
+        """
         self.mosques_df = pd.read_csv(mosques_csv_path, encoding='utf-8')
         print(f"Loaded {len(self.mosques_df)} mosque records")
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-
-    def extract_coordinates(self, maps_url: str) -> tuple:
+        self.resolver = resolver or ShortLinkResolver(max_workers=max_workers)
+        self.cache = LinkCache(cache_path)
+        self.offline = offline
+
+    @staticmethod
+    def row_urls(maps_urls) -> List[str]:
+        """The maps links of one `maps_urls` cell (may hold several)."""
+        if not isinstance(maps_urls, str) or not maps_urls.strip():
+            return []
+        return extract_urls(maps_urls) or [maps_urls.strip()]
+
+    def extract_coordinates(self, maps_url: str,
+                            expanded: Optional[Tuple[Optional[str], str]] = None) -> tuple:
         """
         Extract lat, lng from Google Maps URL.
 
@@ -37,37 +57,32 @@ class GPSExtractor:
         - https://www.google.com/maps/place/@33.5689,36.3456
         - https://www.google.com/maps?q=33.5689,36.3456
 
+        Args:
+            expanded: Result of ShortLinkResolver for this link, if already resolved
+
         Returns:
             (latitude, longitude, method) or (None, None, error)
         """
         if not isinstance(maps_url, str):
             return None, None, 'invalid_url'
 
-        # Pattern 1: @lat,lng format
-        match = re.search(r'@(-?\d+\.?\d*),(-?\d+\.?\d*)', maps_url)
-        if match:
-            return float(match.group(1)), float(match.group(2)), 'direct_parse'
-
-        # Pattern 2: ?q=lat,lng format
-        match = re.search(r'[?&]q=(-?\d+\.?\d*),(-?\d+\.?\d*)', maps_url)
-        if match:
-            return float(match.group(1)), float(match.group(2)), 'direct_parse'
+        # Patterns 1-2: @lat,lng or ?q=lat,lng in the URL itself
+        coords = coordinates_from_url(maps_url)
+        if coords:
+            return coords[0], coords[1], 'direct_parse'
 
         # Pattern 3: Short links (maps.app.goo.gl) - follow redirect
-        if 'maps.app.goo.gl' in maps_url or 'goo.gl' in maps_url:
-            try:
-                time.sleep(0.1)  # Rate limiting
-                response = self.session.head(maps_url, allow_redirects=True, timeout=5)
-                expanded_url = response.url
-
-                # Try to extract from expanded URL
-                match = re.search(r'@(-?\d+\.?\d*),(-?\d+\.?\d*)', expanded_url)
-                if match:
-                    return float(match.group(1)), float(match.group(2)), 'redirect_followed'
-
-                return None, None, 'redirect_no_coords'
-            except Exception as e:
-                return None, None, f'redirect_error'
+        if is_short_link(maps_url):
+            if expanded is None and self.offline:
+                return None, None, 'not_cached'
+            expanded_url, status = expanded or self.resolver.expand(maps_url)
+            if status != 'ok' or not expanded_url:
+                return None, None, 'redirect_error'
+
+            coords = coordinates_from_url(expanded_url)
+            if coords:
+                return coords[0], coords[1], 'redirect_followed'
+            return None, None, 'redirect_no_coords'
 
         return None, None, 'unknown_format'
 
@@ -82,22 +97,47 @@ class GPSExtractor:
         longitudes = []
         extraction_methods = []
 
-        total = len(self.mosques_df)
-        for idx, row in self.mosques_df.iterrows():
-            if (idx + 1) % 50 == 0:
-                print(f"Processing {idx + 1}/{total}...")
-
-            maps_url = row.get('maps_urls')
-
-            if pd.notna(maps_url) and maps_url:
-                lat, lng, method = self.extract_coordinates(maps_url)
-                latitudes.append(lat)
-                longitudes.append(lng)
-                extraction_methods.append(method)
-            else:
+        if 'maps_urls' in self.mosques_df:
+            row_urls = [self.row_urls(value) for value in self.mosques_df['maps_urls']]
+        else:
+            row_urls = [[] for _ in range(len(self.mosques_df))]
+
+        # Cached short links first; the rest are expanded once each,
+        # concurrently, before the row loop
+        short_links = list(dict.fromkeys(url for urls in row_urls for url in urls
+                                         if is_short_link(url) and not coordinates_from_url(url)))
+        expanded = {}
+        for url in short_links:
+            entry = self.cache.get(url)
+            if entry:
+                expanded[url] = (entry['expanded'], entry['status'])
+        unseen = [url for url in short_links if url not in expanded]
+
+        if unseen and not self.offline:
+            start = time.perf_counter()
+            resolved = self.resolver.resolve_all(unseen)
+            for url, result in resolved.items():
+                self.cache.put(url, *result, *self.extract_coordinates(url, result))
+            self.cache.save()
+            expanded.update(resolved)
+            print(f"Expanded {len(resolved)} short links in {time.perf_counter() - start:.1f}s")
+        if short_links:
+            print(f"Short links: {len(short_links)} unique, {len(short_links) - len(unseen)} from cache"
+                  f"{f', {len(unseen)} not cached (offline)' if self.offline and unseen else ''}")
+
+        for urls in row_urls:
+            if not urls:
                 latitudes.append(None)
                 longitudes.append(None)
                 extraction_methods.append('no_maps_url')
+                continue
+
+            # First link with coordinates wins; otherwise report the first link's failure
+            results = [self.extract_coordinates(url, expanded.get(url)) for url in urls]
+            lat, lng, method = next((r for r in results if r[0] is not None), results[0])
+            latitudes.append(lat)
+            longitudes.append(lng)
+            extraction_methods.append(method)
 
         # Add new columns
         self.mosques_df['latitude'] = latitudes
@@ -124,6 +164,15 @@ class GPSExtractor:
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Extract GPS coordinates from Google Maps URLs')
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS,
+                        help='Short links resolved in parallel')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        help='Resolved short-link cache (delete to re-resolve everything)')
+    parser.add_argument('--offline', action='store_true',
+                        help='Use only cached short links, no network')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("GPS Coordinate Extractor")
     print("=" * 60)
@@ -134,7 +183,8 @@ def main():
     output_csv = Path('out_csv/mosques_with_gps.csv')
 
     # Initialize extractor
-    extractor = GPSExtractor(input_csv)
+    extractor = GPSExtractor(input_csv, max_workers=args.max_workers,
+                             cache_path=args.cache, offline=args.offline)
 
     # Process mosques
     print("Extracting GPS coordinates from Google Maps URLs...")
@@ -4,7 +4,9 @@ Fix Photo Assignments - Hybrid Approach
 
 This script implements the Hybrid approach to fix photo assignments:
 1. Pattern A (text-then-photos): Auto-fix using proximity matching
-2. Pattern B (photos-then-text): Flag for manual review
+2. Pattern B (photos-then-text): Split media into upload bursts by time
+   gaps and give each burst to the nearest mosque text; only ambiguous
+   clusters are flagged for AI/manual review
 3. Pattern C (single mosque): Keep as-is
 
 Author: Claude Code
@@ -12,11 +14,32 @@ Date: October 25, 2025
 """
 
 import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from collections import defaultdict
 from typing import Dict, List, Tuple
 
+from arabic_text import normalize_series
+from clustering import MessageIndex
+from edit_distance import search_ratio
+from maps_links import MapsRegistry
+
+# Message-type codes, one per message in the shared MessageIndex
+NONE, TEXT, PHOTO, VIDEO, MAPS = 0, 1, 2, 3, 4
+TYPE_NAMES = {TEXT: 'TEXT', PHOTO: 'PHOTO', VIDEO: 'VIDEO', MAPS: 'MAPS'}
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+# Cluster pattern codes (index into PATTERNS)
+UNKNOWN, SINGLE, TEXT_THEN_PHOTOS, PHOTOS_THEN_TEXT = 0, 1, 2, 3
+PATTERNS = np.array(['unknown', 'single_mosque', 'text_then_photos', 'photos_then_text'], dtype=object)
+
+# Pattern B burst segmentation
+BURST_GAP_SECONDS = 90  # A longer pause between media starts a new upload burst
+BURST_CONFIDENCE_THRESHOLD = 0.75  # Below this a cluster still goes to AI/review
+FALLBACK_CONFIDENCE = 0.5  # Burst had no text in the cluster's dominant direction
+NAME_MATCH_THRESHOLD = 0.7  # Fuzzy occurrence of a mosque name in a burst's text
+
 
 class PhotoAssignmentFixer:
     """Fix photo assignments based on message patterns"""
@@ -30,6 +53,11 @@ class PhotoAssignmentFixer:
         with open(self.telegram_export_path / 'result.json', 'r', encoding='utf-8') as f:
             telegram_data = json.load(f)
         self.messages = {msg['id']: msg for msg in telegram_data['messages']}
+        self.message_index = MessageIndex(telegram_data['messages'])
+        self.maps = MapsRegistry(telegram_data['messages'])
+        self.type_codes, self.contents = self._message_types()
+        # Normalized texts (prefix stripped), computed once for name matching
+        self.match_keys = normalize_series(pd.Series(self.contents), strip_prefix=True).to_numpy()
 
         print("Loading conversation clusters...")
         self.clusters_df = pd.read_csv(clusters_csv_path, encoding='utf-8')
@@ -37,56 +65,100 @@ class PhotoAssignmentFixer:
         print(f"Loaded {len(self.clusters_df)} mosque records")
         print(f"Loaded {len(self.messages)} Telegram messages")
 
-    def classify_cluster_pattern(self, msg_ids: List[int]) -> Tuple[str, List[Dict]]:
+    def _message_types(self) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Classify the message pattern for a cluster.
+        Type code and content (file path or stripped text) per indexed message.
 
-        Returns:
-            (pattern_type, sequence)
-            pattern_type: 'single_mosque', 'text_then_photos', 'photos_then_text', 'unknown'
-            sequence: List of {msg_id, type: 'TEXT'|'PHOTO', content}
+        Files are media (VIDEO by extension, otherwise PHOTO); non-empty texts
+        are TEXT, or MAPS when they carry a maps link. Everything else is NONE.
         """
-        sequence = []
-
-        for msg_id in msg_ids:
-            msg = self.messages.get(msg_id)
-            if not msg:
-                continue
+        messages = self.message_index.messages
+        codes = np.zeros(len(messages), dtype=np.int8)
+        contents = np.empty(len(messages), dtype=object)
 
+        for i, msg in enumerate(messages):
             if 'file' in msg and msg['file']:
-                sequence.append({
-                    'msg_id': msg_id,
-                    'type': 'PHOTO',
-                    'content': msg['file']
-                })
+                codes[i] = VIDEO if msg['file'].lower().endswith(VIDEO_EXTENSIONS) else PHOTO
+                contents[i] = msg['file']
             elif 'text' in msg and msg['text']:
                 text = msg['text'] if isinstance(msg['text'], str) else self._extract_text(msg['text'])
-                if text.strip():
-                    sequence.append({
-                        'msg_id': msg_id,
-                        'type': 'TEXT',
-                        'content': text.strip()
-                    })
+                text = text.strip()
+                if text:
+                    codes[i] = MAPS if self.maps.has_maps(msg['id']) else TEXT
+                    contents[i] = text
 
-        # Classify pattern
-        if not sequence:
-            return 'unknown', sequence
+        return codes, contents
 
-        text_count = sum(1 for s in sequence if s['type'] == 'TEXT')
-        photo_count = sum(1 for s in sequence if s['type'] == 'PHOTO')
+    @staticmethod
+    def _explode_message_ids(message_ids: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Split `message_ids` strings ("12; 13; 15") into one flat id array.
 
-        if text_count <= 1:
-            return 'single_mosque', sequence
+        Returns:
+            (ids, labels): labels[i] is the position in `message_ids` that
+            ids[i] came from; order within each entry is kept.
+        """
+        exploded = message_ids.reset_index(drop=True).astype('string').str.split(';').explode()
+        ids = pd.to_numeric(exploded.str.strip(), errors='coerce')
+        valid = ids.notna().to_numpy()
+        return ids.to_numpy()[valid].astype(np.int64), exploded.index.to_numpy()[valid]
+
+    def classify_sequences(self, ids: np.ndarray, labels: np.ndarray,
+                           n_clusters: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Classify the message pattern of every cluster in one vectorized pass.
+
+        Args:
+            ids: Concatenated message ids of all clusters
+            labels: Cluster number (0..n_clusters-1) of each id, grouped in order
+            n_clusters: Number of clusters
 
-        # Check first non-empty item
-        first_type = sequence[0]['type'] if sequence else None
+        Returns:
+            (patterns, sequence): pattern code per cluster, and the typed
+            message sequence as aligned arrays `label`, `pos` (row in the
+            message index) and `code`.
+        """
+        pos, found = self.message_index.locate(ids)
+        pos, labels = pos[found], np.asarray(labels)[found]
+        codes = self.type_codes[pos]
+
+        typed = codes != NONE
+        sequence = {'label': labels[typed], 'pos': pos[typed], 'code': codes[typed]}
+
+        labels, codes = sequence['label'], sequence['code']
+        is_text = (codes == TEXT) | (codes == MAPS)
+        text_count = np.bincount(labels, weights=is_text, minlength=n_clusters)
+        length = np.bincount(labels, minlength=n_clusters)
+
+        first_code = np.zeros(n_clusters, dtype=np.int8)
+        if len(labels):
+            starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+            first_code[labels[starts]] = codes[starts]
+        first_is_text = (first_code == TEXT) | (first_code == MAPS)
+
+        patterns = np.select(
+            [length == 0, text_count <= 1, first_is_text],
+            [UNKNOWN, SINGLE, TEXT_THEN_PHOTOS],
+            PHOTOS_THEN_TEXT
+        )
+        return patterns, sequence
 
-        if first_type == 'TEXT':
-            return 'text_then_photos', sequence
-        elif first_type == 'PHOTO':
-            return 'photos_then_text', sequence
-        else:
-            return 'unknown', sequence
+    def classify_cluster_pattern(self, msg_ids: List[int]) -> Tuple[str, List[Dict]]:
+        """
+        Classify the message pattern for a cluster.
+
+        Returns:
+            (pattern_type, sequence)
+            pattern_type: 'single_mosque', 'text_then_photos', 'photos_then_text', 'unknown'
+            sequence: List of {msg_id, type: 'TEXT'|'PHOTO'|'VIDEO'|'MAPS', content}
+        """
+        ids = np.asarray(msg_ids, dtype=np.int64)
+        patterns, sequence = self.classify_sequences(ids, np.zeros(len(ids), dtype=np.int64), 1)
+        items = [
+            {'msg_id': int(self.message_index.ids[p]), 'type': TYPE_NAMES[c], 'content': self.contents[p]}
+            for p, c in zip(sequence['pos'], sequence['code'])
+        ]
+        return PATTERNS[patterns[0]], items
 
     def _extract_text(self, text_obj) -> str:
         """Extract text from Telegram text object (can be string or list)"""
@@ -102,25 +174,164 @@ class PhotoAssignmentFixer:
             return ''.join(parts)
         return ''
 
-    def assign_photos_pattern_a(self, sequence: List[Dict], mosque_texts: List[str]) -> Dict[str, List[str]]:
+    def _proximity_assignments(self, sequence: Dict[str, np.ndarray],
+                               clusters: np.ndarray) -> Dict[int, Dict[str, List[str]]]:
         """
-        Assign photos for Pattern A (text-then-photos).
-
-        Logic: Photos immediately after a text message belong to that text.
+        Pattern A for many clusters at once: every media item goes to the
+        closest preceding text of its own cluster.
 
         Returns:
-            Dict mapping mosque_text -> list of photo files
+            cluster number -> {normalized text: [files]} (text order = first media seen)
         """
-        assignments = defaultdict(list)
-        current_text = None
+        labels, pos, codes = sequence['label'], sequence['pos'], sequence['code']
+        if len(labels) == 0:
+            return {}
+
+        idx = np.arange(len(labels))
+        is_text = (codes == TEXT) | (codes == MAPS)
+        is_media = (codes == PHOTO) | (codes == VIDEO)
+
+        # Forward-fill the last text position, not crossing cluster starts
+        anchor = np.maximum.accumulate(np.where(is_text, idx, -1))
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        cluster_start = starts[np.searchsorted(starts, idx, side='right') - 1]
+        keep = is_media & (anchor >= cluster_start) & np.isin(labels, clusters)
+
+        pairs = pd.DataFrame({
+            'label': labels[keep],
+            'text': self.match_keys[pos[anchor[keep]]],
+            'file': self.contents[pos[keep]]
+        })
+        assignments = defaultdict(dict)
+        for (label, text), files in pairs.groupby(['label', 'text'], sort=False)['file']:
+            assignments[label][text] = files.tolist()
+        return dict(assignments)
 
-        for item in sequence:
-            if item['type'] == 'TEXT':
-                current_text = item['content']
-            elif item['type'] == 'PHOTO' and current_text:
-                assignments[current_text].append(item['content'])
+    def segment_bursts(self, sequence: Dict[str, np.ndarray], clusters: np.ndarray,
+                       max_gap: float = BURST_GAP_SECONDS) -> Dict[int, Dict]:
+        """
+        Pattern B for many clusters at once: split media into upload bursts
+        and give each burst to the nearest mosque text.
 
-        return dict(assignments)
+        A burst is a run of media with no text in between and no pause longer
+        than `max_gap` seconds. Each cluster has a dominant direction (captions
+        after their photos unless most bursts sit closer to the previous
+        text); a burst goes to the nearest text in that direction. A burst's
+        confidence is how much farther the competing text on the other side
+        is: far / (near + far), 1.0 when there is none. A cluster's
+        confidence is that of its weakest burst.
+
+        Returns:
+            cluster number -> {'assignments': {normalized text: [files]}, 'confidence': float}
+        """
+        keep = np.isin(sequence['label'], clusters)
+        labels, pos, codes = sequence['label'][keep], sequence['pos'][keep], sequence['code'][keep]
+        n = len(labels)
+        if n == 0:
+            return {}
+
+        idx = np.arange(n)
+        epochs = self.message_index.epochs[pos]
+        is_text = (codes == TEXT) | (codes == MAPS)
+        is_media = (codes == PHOTO) | (codes == VIDEO)
+
+        # Nearest text on either side of every item, within its own cluster
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        item_cluster = np.searchsorted(starts, idx, side='right') - 1
+        cluster_start = starts[item_cluster]
+        cluster_end = np.r_[starts[1:], n][item_cluster] - 1
+        prev_text = np.maximum.accumulate(np.where(is_text, idx, -1))
+        prev_text = np.where(prev_text >= cluster_start, prev_text, -1)
+        next_text = np.minimum.accumulate(np.where(is_text, idx, n)[::-1])[::-1]
+        next_text = np.where(next_text <= cluster_end, next_text, -1)
+
+        # Bursts: consecutive media of one cluster without a long pause
+        media = np.flatnonzero(is_media)
+        if len(media) == 0:
+            return {}
+        new_burst = np.ones(len(media), dtype=bool)
+        new_burst[1:] = ((np.diff(media) != 1)
+                         | (labels[media[1:]] != labels[media[:-1]])
+                         | ~(np.diff(epochs[media]) <= max_gap))
+        burst_of = np.cumsum(new_burst) - 1
+        first = media[new_burst]
+        last = media[np.r_[new_burst[1:], True]]
+
+        before = prev_text[first]
+        after = next_text[last]
+        with np.errstate(invalid='ignore'):
+            gap_before = np.where(before >= 0, epochs[first] - epochs[before], np.nan)
+            gap_after = np.where(after >= 0, epochs[after] - epochs[last], np.nan)
+            gap_before, gap_after = np.maximum(gap_before, 0), np.maximum(gap_after, 0)
+
+            # Dominant direction per cluster by majority vote of its bursts
+            burst_cluster = item_cluster[first]
+            votes_before = np.bincount(burst_cluster, weights=gap_before < gap_after, minlength=len(starts))
+            votes_after = np.bincount(burst_cluster, weights=gap_after < gap_before, minlength=len(starts))
+            backward = (votes_before > votes_after)[burst_cluster]
+
+            chosen = np.where(backward, before, after)
+            near = np.where(backward, gap_before, gap_after)
+            far = np.where(backward, gap_after, gap_before)
+            confidence = np.where(np.isnan(far), 1.0, far / np.maximum(near + far, 1e-9))
+            confidence = np.where(np.isnan(near), 0.0, confidence)
+
+        # No text in the dominant direction: fall back to the other side
+        fallback = chosen < 0
+        chosen = np.where(fallback, np.where(backward, after, before), chosen)
+        confidence = np.where(fallback, FALLBACK_CONFIDENCE, confidence)
+        confidence = np.where(chosen < 0, 0.0, confidence)
+
+        # A cluster is as confident as its weakest burst
+        results = {}
+        cluster_confidence = np.ones(len(starts))
+        np.minimum.at(cluster_confidence, burst_cluster, confidence)
+        for s, c in zip(starts, cluster_confidence):
+            results[labels[s]] = {'assignments': {}, 'confidence': float(c)}
+
+        assigned = chosen[burst_of] >= 0
+        pairs = pd.DataFrame({
+            'label': labels[media[assigned]],
+            'text': self.match_keys[pos[chosen[burst_of][assigned]]],
+            'file': self.contents[pos[media[assigned]]]
+        })
+        for (label, text), files in pairs.groupby(['label', 'text'], sort=False)['file']:
+            results[label]['assignments'][text] = files.tolist()
+        return results
+
+    @staticmethod
+    def _names_mosque(text: str, name: str) -> bool:
+        """
+        Does this text mention the mosque? Both arguments already normalized.
+
+        Containment first; otherwise the name may occur in the text with a
+        few typos (best fuzzy occurrence at NAME_MATCH_THRESHOLD).
+        """
+        if not name or not text:
+            return False
+        if name in text or text in name:
+            return True
+        return search_ratio([name], text, NAME_MATCH_THRESHOLD)[0] > 0
+
+    def _photos_for_name(self, name: str, assignments: Dict[str, List[str]]) -> List[str]:
+        """Collect the files of every text that names this mosque (normalized keys)."""
+        photos = []
+        for text_key, files in assignments.items():
+            if self._names_mosque(text_key, name):
+                photos.extend(files)
+        return photos
+
+    @staticmethod
+    def _write_photos(result_df: pd.DataFrame, rows: np.ndarray, photo_files: List[List[str]]):
+        """Overwrite photo_files/photo_count for the given row positions."""
+        for col, default in (('photo_files', None), ('photo_count', 0)):
+            if col not in result_df:
+                result_df[col] = default
+        result_df['photo_files'] = result_df['photo_files'].astype(object)
+        result_df.iloc[rows, result_df.columns.get_loc('photo_files')] = [
+            '; '.join(p) if p else None for p in photo_files
+        ]
+        result_df.iloc[rows, result_df.columns.get_loc('photo_count')] = [len(p) for p in photo_files]
 
     def process_clusters(self) -> pd.DataFrame:
         """
@@ -129,110 +340,87 @@ class PhotoAssignmentFixer:
         Returns:
             Updated DataFrame with fixed photo assignments
         """
-        results = []
-        stats = {
-            'single_mosque': 0,
-            'text_then_photos_fixed': 0,
-            'photos_then_text_flagged': 0,
-            'unknown': 0
-        }
-
-        # Group by cluster_id
-        for cluster_id, group in self.clusters_df.groupby('cluster_id'):
-            msg_ids_str = group.iloc[0]['message_ids']
-            msg_ids = [int(x.strip()) for x in msg_ids_str.split(';')]
-
-            # Classify pattern
-            pattern, sequence = self.classify_cluster_pattern(msg_ids)
-
-            if len(group) == 1:
-                # Single mosque - keep as-is
-                row = group.iloc[0].copy()
-                row['photo_assignment_method'] = 'direct'
-                row['cluster_pattern'] = 'single_mosque'
-                row['needs_review'] = False
-                results.append(row)
-                stats['single_mosque'] += 1
-
-            elif pattern == 'text_then_photos':
-                # Pattern A - fix using proximity
-                mosque_texts = group['name'].tolist()
-                photo_assignments = self.assign_photos_pattern_a(sequence, mosque_texts)
-
-                for idx, row in group.iterrows():
-                    new_row = row.copy()
-                    mosque_name = row['name']
-
-                    # Find matching photos for this mosque
-                    assigned_photos = []
-                    for text_key, photos in photo_assignments.items():
-                        # Match mosque name in text (fuzzy)
-                        if mosque_name in text_key or self._fuzzy_match(mosque_name, text_key):
-                            assigned_photos.extend(photos)
-
-                    # Update photo data
-                    if assigned_photos:
-                        new_row['photo_files'] = '; '.join(assigned_photos)
-                        new_row['photo_count'] = len(assigned_photos)
-                    else:
-                        new_row['photo_files'] = None
-                        new_row['photo_count'] = 0
-
-                    new_row['photo_assignment_method'] = 'proximity_auto'
-                    new_row['cluster_pattern'] = 'text_then_photos'
-                    new_row['needs_review'] = False
-                    results.append(new_row)
-
-                stats['text_then_photos_fixed'] += len(group)
-
-            elif pattern == 'photos_then_text':
-                # Pattern B - flag for manual review
-                for idx, row in group.iterrows():
-                    new_row = row.copy()
-                    # Keep photos but flag as needing review
-                    new_row['photo_assignment_method'] = 'shared_needs_review'
-                    new_row['cluster_pattern'] = 'photos_then_text'
-                    new_row['needs_review'] = True
-                    results.append(new_row)
-
-                stats['photos_then_text_flagged'] += len(group)
-
-            else:
-                # Unknown pattern - keep as-is but flag
-                for idx, row in group.iterrows():
-                    new_row = row.copy()
-                    new_row['photo_assignment_method'] = 'unknown'
-                    new_row['cluster_pattern'] = 'unknown'
-                    new_row['needs_review'] = True
-                    results.append(new_row)
-
-                stats['unknown'] += len(group)
-
-        # Create result DataFrame
-        result_df = pd.DataFrame(results)
+        # Rows grouped by cluster_id (stable, as groupby would order them)
+        df = self.clusters_df.dropna(subset=['cluster_id'])
+        cluster_of_row, cluster_ids = pd.factorize(df['cluster_id'], sort=True)
+        order = np.argsort(cluster_of_row, kind='stable')
+        df, cluster_of_row = df.iloc[order], cluster_of_row[order]
+
+        group_size = np.bincount(cluster_of_row, minlength=len(cluster_ids))
+        first_rows = np.r_[0, np.cumsum(group_size)[:-1]] if len(cluster_ids) else np.empty(0, dtype=int)
+
+        # Classify every cluster from its first row's message ids
+        ids, labels = self._explode_message_ids(df['message_ids'].iloc[first_rows])
+        patterns, sequence = self.classify_sequences(ids, labels, len(cluster_ids))
+
+        row_pattern = patterns[cluster_of_row]
+        single = group_size[cluster_of_row] == 1
+        pattern_a = ~single & (row_pattern == TEXT_THEN_PHOTOS)
+        pattern_b = ~single & (row_pattern == PHOTOS_THEN_TEXT)
+
+        result_df = df.copy()
+        name_keys = normalize_series(result_df['name'], strip_prefix=True).to_numpy()
+        result_df['photo_assignment_method'] = np.select(
+            [single, pattern_a, pattern_b], ['direct', 'proximity_auto', 'shared_needs_review'], 'unknown')
+        result_df['cluster_pattern'] = np.select(
+            [single, pattern_a, pattern_b], ['single_mosque', 'text_then_photos', 'photos_then_text'], 'unknown')
+        result_df['needs_review'] = ~(single | pattern_a)
+
+        # Pattern A - fix using proximity
+        a_rows = np.flatnonzero(pattern_a)
+        if len(a_rows):
+            assignments = self._proximity_assignments(sequence, np.unique(cluster_of_row[a_rows]))
+            names = name_keys[a_rows]
+            photo_files = [self._photos_for_name(name, assignments.get(cluster, {}))
+                           for name, cluster in zip(names, cluster_of_row[a_rows])]
+            self._write_photos(result_df, a_rows, photo_files)
+
+        # Pattern B - burst segmentation; only ambiguous clusters stay flagged
+        b_rows = np.flatnonzero(pattern_b)
+        burst_fixed = 0
+        if len(b_rows):
+            b_clusters = cluster_of_row[b_rows]
+            bursts = self.segment_bursts(sequence, np.unique(b_clusters))
+            names = name_keys[b_rows]
+
+            confidence = np.zeros(len(b_rows))
+            fixed_rows, photo_files = [], []
+            cluster_starts = np.flatnonzero(np.r_[True, b_clusters[1:] != b_clusters[:-1]])
+            for start, end in zip(cluster_starts, np.r_[cluster_starts[1:], len(b_rows)]):
+                result = bursts.get(b_clusters[start], {'assignments': {}, 'confidence': 0.0})
+                photos = [self._photos_for_name(name, result['assignments']) for name in names[start:end]]
+
+                # Every burst's text must name one of the cluster's mosques
+                texts = result['assignments']
+                matched = all(any(self._names_mosque(text, name) for name in names[start:end])
+                              for text in texts)
+                score = result['confidence'] if texts and matched else 0.0
+                confidence[start:end] = score
+
+                if score >= BURST_CONFIDENCE_THRESHOLD:
+                    fixed_rows.extend(b_rows[start:end])
+                    photo_files.extend(photos)
+
+            result_df['assignment_confidence'] = np.nan
+            result_df.iloc[b_rows, result_df.columns.get_loc('assignment_confidence')] = confidence.round(3)
+            if fixed_rows:
+                fixed_rows = np.asarray(fixed_rows)
+                self._write_photos(result_df, fixed_rows, photo_files)
+                result_df.iloc[fixed_rows, result_df.columns.get_loc('photo_assignment_method')] = 'burst_auto'
+                result_df.iloc[fixed_rows, result_df.columns.get_loc('needs_review')] = False
+            burst_fixed = len(fixed_rows)
 
         # Print statistics
         print("\n=== Processing Statistics ===")
-        print(f"Single mosque (kept as-is): {stats['single_mosque']}")
-        print(f"Pattern A fixed: {stats['text_then_photos_fixed']}")
-        print(f"Pattern B flagged: {stats['photos_then_text_flagged']}")
-        print(f"Unknown pattern: {stats['unknown']}")
+        print(f"Single mosque (kept as-is): {int(single.sum())}")
+        print(f"Pattern A fixed: {int(pattern_a.sum())}")
+        print(f"Pattern B fixed by burst segmentation: {burst_fixed}")
+        print(f"Pattern B flagged (ambiguous): {int(pattern_b.sum()) - burst_fixed}")
+        print(f"Unknown pattern: {int(len(result_df) - single.sum() - pattern_a.sum() - pattern_b.sum())}")
         print(f"Total mosques: {len(result_df)}")
 
         return result_df
 
-    def _fuzzy_match(self, name1: str, name2: str, threshold: float = 0.7) -> bool:
-        """Simple fuzzy matching for mosque names"""
-        # Remove common prefixes
-        name1_clean = name1.replace('مسجد', '').strip()
-        name2_clean = name2.replace('مسجد', '').strip()
-
-        # Check if one contains the other
-        if name1_clean in name2_clean or name2_clean in name1_clean:
-            return True
-
-        return False
-
 
 def main():
     """Main execution function"""
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Geo-Aware Duplicate Detection
+=============================
+Finds records of the same mosque using coordinates and names together.
+
+Records are bucketed on a grid of `radius`-sized cells; a record is only
+compared with records in its own and the adjacent cells, so the pass is
+O(N) for any realistic density. Each close pair gets one score:
+
+    score = name similarity + GEO_BONUS * (1 - distance / radius)
+
+so similar names a few hundred metres apart pass, while identical names
+in different villages (farther than the radius) are never even compared.
+Records from the same conversation cluster are never paired: a cluster
+documents different mosques, usually close together.
+
+    pairs, dist = neighbor_pairs(lat, lng, radius_m=750)
+    matches = geo_duplicates(names, lat, lng)
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from edit_distance import ratio
+
+EARTH_RADIUS_M = 6_371_000
+METERS_PER_DEGREE = 111_320
+
+GEO_RADIUS_M = 750  # Farther apart than this: different mosques, never compared
+GEO_BONUS = 0.25  # Added to name similarity at distance 0, fading to 0 at the radius
+GEO_THRESHOLD = 0.85  # Same as the name-only merge threshold
+
+# Cells checked per record (own cell + half of the neighbours, so each pair once)
+_CELL_OFFSETS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def haversine_m(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance in metres (vectorized)."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# Per-mosque message id columns, in order of preference
+_OWN_ID_COLUMNS = ('source_message_id', 'telegram_msg_id')
+
+
+def _read_gps(gps_csv: Path) -> Optional[pd.DataFrame]:
+    gps_csv = Path(gps_csv)
+    if not gps_csv.exists():
+        return None
+    df = pd.read_csv(gps_csv, encoding='utf-8-sig')
+    if 'message_ids' not in df:
+        return None
+    df['message_ids'] = df['message_ids'].fillna('').astype(str)
+    df['cluster_key'] = (df['cluster_id'].astype(str) if 'cluster_id' in df
+                         else df['message_ids'])  # Rows of one cluster share its message ids
+    return df
+
+
+def load_coordinates(gps_csv: Path) -> Dict[int, Tuple[float, float]]:
+    """
+    Telegram message id -> (lat, lng) from extract_gps_coordinates.py output.
+
+    `message_ids` and `maps_urls` cover a whole conversation cluster, so
+    they only say where a mosque is when the cluster holds that one mosque.
+    Rows of multi-mosque clusters contribute only their own message id
+    (source_message_id / telegram_msg_id) if the file has one.
+    """
+    df = _read_gps(gps_csv)
+    if df is None or not {'latitude', 'longitude'} <= set(df.columns):
+        return {}
+
+    single = (df.groupby('cluster_key')['cluster_key'].transform('size') == 1).to_numpy()
+    located = (df['latitude'].notna() & df['longitude'].notna()).to_numpy()
+    alone = df[located & single]
+    df = df[located]
+
+    coordinates = {}
+    own_column = next((c for c in _OWN_ID_COLUMNS if c in df), None)
+    if own_column:
+        own = pd.to_numeric(df[own_column], errors='coerce')
+        for msg_id, lat, lng in zip(own, df['latitude'], df['longitude']):
+            if pd.notna(msg_id):
+                coordinates.setdefault(int(msg_id), (float(lat), float(lng)))
+
+    for ids, lat, lng in zip(alone['message_ids'], alone['latitude'], alone['longitude']):
+        for msg_id in re.findall(r'\d+', ids):
+            coordinates.setdefault(int(msg_id), (float(lat), float(lng)))
+    return coordinates
+
+
+def load_message_clusters(gps_csv: Path) -> Dict[int, str]:
+    """Telegram message id -> key of the conversation cluster it belongs to."""
+    df = _read_gps(gps_csv)
+    if df is None:
+        return {}
+    clusters = {}
+    for ids, key in zip(df['message_ids'], df['cluster_key']):
+        for msg_id in re.findall(r'\d+', ids):
+            clusters.setdefault(int(msg_id), key)
+    return clusters
+
+
+def neighbor_pairs(lat: np.ndarray, lng: np.ndarray,
+                   radius_m: float = GEO_RADIUS_M) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All pairs of records within `radius_m` of each other (grid bucketing).
+
+    Cells are `radius_m` high and at least `radius_m` wide everywhere in the
+    data, so every close pair lies in the same or adjacent cells. Rows
+    without coordinates are skipped.
+
+    Returns:
+        ((k, 2) row pairs with i < j, distances in metres)
+    """
+    lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+    rows = np.flatnonzero(np.isfinite(lat) & np.isfinite(lng))
+    if len(rows) < 2:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+
+    cell_lat = radius_m / METERS_PER_DEGREE
+    widest = np.cos(np.radians(np.abs(lat[rows]).max()))
+    cell_lng = radius_m / (METERS_PER_DEGREE * max(widest, 1e-6))
+    cx = np.floor(lat[rows] / cell_lat).astype(np.int64)
+    cy = np.floor(lng[rows] / cell_lng).astype(np.int64)
+    cy -= cy.min() - 1
+    span = int(cy.max()) + 2  # Keys of neighbouring columns never collide
+    keys = cx * span + cy
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    firsts, seconds = [], []
+    for dx, dy in _CELL_OFFSETS:
+        target = sorted_keys + dx * span + dy
+        lo = np.searchsorted(sorted_keys, target, side='left')
+        hi = np.searchsorted(sorted_keys, target, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        # Expand every [lo, hi) range without a Python loop
+        first = np.repeat(np.arange(len(order)), counts)
+        second = np.repeat(lo, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        if (dx, dy) == (0, 0):
+            keep = first < second
+            first, second = first[keep], second[keep]
+        firsts.append(order[first])
+        seconds.append(order[second])
+
+    if not firsts:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0)
+    pairs = rows[np.sort(np.column_stack([np.concatenate(firsts), np.concatenate(seconds)]), axis=1)]
+    dist = haversine_m(lat[pairs[:, 0]], lng[pairs[:, 0]], lat[pairs[:, 1]], lng[pairs[:, 1]])
+    close = dist <= radius_m
+    return pairs[close], dist[close]
+
+
+def geo_score(name_sim: float, dist_m: float, radius_m: float = GEO_RADIUS_M) -> float:
+    """Name similarity plus a closeness bonus, capped at 1."""
+    return min(1.0, name_sim + GEO_BONUS * max(0.0, 1.0 - dist_m / radius_m))
+
+
+def geo_duplicates(names: List[str], lat: np.ndarray, lng: np.ndarray,
+                   radius_m: float = GEO_RADIUS_M,
+                   threshold: float = GEO_THRESHOLD,
+                   clusters: Optional[np.ndarray] = None) -> List[Tuple[int, int, float, float]]:
+    """
+    Pairs of close records whose combined score reaches the threshold.
+
+    Args:
+        names: normalized names (empty names never match)
+        clusters: conversation cluster code per record (-1 = unknown);
+            records with the same code are never paired
+
+    Returns:
+        [(row i, row j, score, distance m)], best score first
+    """
+    pairs, dist = neighbor_pairs(lat, lng, radius_m)
+    if clusters is not None and len(pairs):
+        clusters = np.asarray(clusters)
+        apart = (clusters[pairs[:, 0]] < 0) | (clusters[pairs[:, 0]] != clusters[pairs[:, 1]])
+        pairs, dist = pairs[apart], dist[apart]
+
+    matches = []
+    for (i, j), d in zip(pairs, dist):
+        bonus = GEO_BONUS * (1.0 - d / radius_m)
+        name_sim = ratio(names[i], names[j], threshold - bonus)  # Early exit below what's needed
+        if name_sim > 0:
+            score = geo_score(name_sim, d, radius_m)
+            if score >= threshold:
+                matches.append((int(i), int(j), score, float(d)))
+
+    matches.sort(key=lambda match: -match[2])
+    return matches
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Concurrent Short-Link Resolver
+==============================
+Expands maps.app.goo.gl / goo.gl links by following their redirects.
+
+Every unique link is resolved once, from a bounded thread pool sharing one
+pooled session (keep-alive connections per host), with a timeout per
+request and retries with back-off on connection errors, 429 and 5xx.
+Redirects are followed by hand and the chain stops as soon as a URL
+carries coordinates, so the final Google page is usually never fetched.
+
+    resolver = ShortLinkResolver(max_workers=16)
+    expanded = resolver.resolve_all(short_urls)  # url -> (expanded url, status)
+
+Set MAPS_SHORTLINK_BASE_URL (e.g. http://127.0.0.1:8766) to send short
+links to a local stand-in server (mock_maps_server.py) instead of Google.
+
+A resolved short link never changes, so `LinkCache` keeps every result on
+disk. Failures and links that led to a page without coordinates (e.g. a
+consent page) are kept too, but only for NEGATIVE_TTL_HOURS.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from maps_links import coordinates_from_url, is_short_link
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+MAX_WORKERS = 16  # Parallel resolutions (also the connection pool size per host)
+REQUEST_TIMEOUT = 5.0  # Seconds per request (connect and read)
+MAX_RETRIES = 2  # Extra attempts on connection errors, 429 and 5xx
+MAX_REDIRECTS = 5
+
+DEFAULT_CACHE_PATH = 'out_csv/gps_link_cache.json'
+NEGATIVE_TTL_HOURS = 24  # Failures and coordinate-less results are retried after this long
+CACHE_VERSION = 1
+
+
+class ShortLinkResolver:
+    """Expand short maps links concurrently, each unique link once."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS, timeout: float = REQUEST_TIMEOUT,
+                 retries: int = MAX_RETRIES, backoff: float = 0.3,
+                 base_url: Optional[str] = None):
+        """
+        Args:
+            backoff: Retry back-off factor in seconds (doubles per attempt)
+            base_url: Send short links here instead (default: MAPS_SHORTLINK_BASE_URL)
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.base_url = base_url or os.getenv('MAPS_SHORTLINK_BASE_URL') or None
+        if self.base_url:
+            print(f"🧪 Short-link override: {self.base_url}")
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({'HEAD', 'GET'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request_url(self, url: str) -> str:
+        """The URL actually requested (short links moved to the override server)."""
+        if not self.base_url or not is_short_link(url):
+            return url
+        parts = urlsplit(url if '://' in url else 'https://' + url)
+        return self.base_url.rstrip('/') + parts.path
+
+    def expand(self, url: str) -> Tuple[Optional[str], str]:
+        """
+        Follow one link's redirects.
+
+        Returns:
+            (expanded url, 'ok') or (last url / None, error status)
+        """
+        current = self.request_url(url)
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                response = self.session.head(current, allow_redirects=False, timeout=self.timeout)
+                location = response.headers.get('Location')
+                if not (response.is_redirect and location):
+                    return current, 'ok' if response.ok else f'http_{response.status_code}'
+                current = urljoin(current, location)
+                if coordinates_from_url(current):
+                    return current, 'ok'
+            return current, 'too_many_redirects'
+        except requests.RequestException:
+            return None, 'redirect_error'
+
+    def resolve_all(self, urls: Iterable[str]) -> Dict[str, Tuple[Optional[str], str]]:
+        """Expand every unique URL once, in parallel."""
+        unique = list(dict.fromkeys(urls))
+        if not unique:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique))) as pool:
+            return dict(zip(unique, pool.map(self.expand, unique)))
+
+    def close(self):
+        self.session.close()
+
+
+class LinkCache:
+    """Short URL -> expanded URL -> (lat, lng, method), kept across runs."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, negative_ttl_hours: float = NEGATIVE_TTL_HOURS):
+        self.path = Path(path)
+        self.negative_ttl = timedelta(hours=negative_ttl_hours)
+        self.links: Dict[str, Dict] = self.load()
+
+    def load(self) -> Dict[str, Dict]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('links', {})
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Cached entry, or None if unseen or a negative entry (failure or no
+        coordinates) older than the TTL.
+        """
+        entry = self.links.get(url)
+        if entry is None:
+            return None
+        if entry['status'] != 'ok' or entry['lat'] is None:
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(entry['resolved_at'])
+            if age > self.negative_ttl:
+                return None
+        return entry
+
+    def put(self, url: str, expanded: Optional[str], status: str,
+            lat: Optional[float], lng: Optional[float], method: str):
+        self.links[url] = {
+            'expanded': expanded,
+            'status': status,
+            'lat': lat,
+            'lng': lng,
+            'method': method,
+            'resolved_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+
+    def save(self):
+        """Persist the cache (written atomically)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'links': self.links}, f, ensure_ascii=False, indent=1)
+        tmp_path.replace(self.path)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Google Maps Link Registry
+=========================
+Every maps link in a Telegram export, found in one pass over the messages.
+
+Links are extracted with one compiled pattern and canonicalized (https,
+one Google host, tracking parameters and share suffixes dropped), so the
+same place shared twice gets the same URL id. Every stage asks the
+registry instead of scanning message text with its own substring checks.
+
+    registry = MapsRegistry(export['messages'])
+    registry.has_maps(msg_id)        # True if the message holds a maps link
+    registry.urls_in(msg_id)         # canonical URLs, in text order
+    registry.message_ids[url_id]     # every message the link appears in
+
+    canonical_url('maps.google.com/?q=33.5,36.3&utm_source=x')
+    # 'https://www.google.com/maps?q=33.5,36.3'
+    coordinates_from_url('https://www.google.com/maps/@33.56,36.34,15z')
+    # (33.56, 36.34)
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Short links, goo.gl/maps, maps.google.<tld> and google.<tld>/maps; the
+# URL itself is printable ASCII, so Arabic text glued to it is not swallowed
+MAPS_URL_PATTERN = re.compile(
+    r'(?<![\w.-])(?:https?://)?(?:www\.)?'
+    r'(?:maps\.app\.goo\.gl/|goo\.gl/maps/|maps\.google\.[a-z.]+|google\.[a-z.]+/maps)'
+    r'[!-~]*',
+    re.IGNORECASE
+)
+
+SHORT_HOSTS = ('maps.app.goo.gl', 'goo.gl')
+CANONICAL_GOOGLE_HOST = 'www.google.com'
+TRACKING_PARAMS = {'g_st', 'g_ep', 'entry', 'shorturl', 'ved', 'usg', 'sa', 'ei', 'authuser', 'hl'}
+_TRAILING = '.,;:!?)]}>\'"'
+
+# Coordinates written into the URL itself: /@lat,lng,zoom or ?q=lat,lng
+_AT_COORDS = re.compile(r'@(-?\d+\.?\d*),(-?\d+\.?\d*)')
+_QUERY_COORDS = re.compile(r'[?&]q=(-?\d+\.?\d*),(-?\d+\.?\d*)')
+
+
+def message_text(text_field) -> str:
+    """Plain text of a Telegram text field (string or list of parts)."""
+    if isinstance(text_field, str):
+        return text_field
+    if isinstance(text_field, list):
+        return ''.join(item.get('text', '') if isinstance(item, dict) else str(item)
+                       for item in text_field)
+    return ''
+
+
+def canonical_url(url: str) -> str:
+    """
+    One spelling per maps link.
+
+    Short links keep their (case-sensitive) path and lose the query; Google
+    links move to www.google.com/maps and keep only meaningful parameters.
+    """
+    url = url.strip().rstrip(_TRAILING)
+    if not re.match(r'https?://', url, re.IGNORECASE):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/')
+
+    if host in SHORT_HOSTS:
+        return urlunsplit(('https', host, path, '', ''))
+
+    if not path.startswith('/maps'):
+        path = '/maps' + path
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_')]
+    return urlunsplit(('https', CANONICAL_GOOGLE_HOST, path, urlencode(query, safe=',:/@+'), ''))
+
+
+def url_id(canonical: str) -> str:
+    """Stable id of a canonical URL (same link, same id, across runs)."""
+    return 'MAP_' + hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def extract_urls(text: str) -> List[str]:
+    """Canonical maps URLs in a text, first occurrence order, no repeats."""
+    if not text:
+        return []
+    return list(dict.fromkeys(canonical_url(m.group(0)) for m in MAPS_URL_PATTERN.finditer(text)))
+
+
+def contains_maps_url(text: str) -> bool:
+    """True if the text holds at least one maps link."""
+    return bool(text) and MAPS_URL_PATTERN.search(text) is not None
+
+
+def is_short_link(url: str) -> bool:
+    """True for maps.app.goo.gl / goo.gl links, which only a redirect can expand."""
+    host = (urlsplit(url if '://' in url else 'https://' + url).hostname or '').lower()
+    return host in SHORT_HOSTS or host == 'www.goo.gl'
+
+
+def coordinates_from_url(url: str) -> Optional[Tuple[float, float]]:
+    """(lat, lng) written in a maps URL, or None (short links never have them)."""
+    match = _AT_COORDS.search(url) or _QUERY_COORDS.search(url)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    return None
+
+
+class MapsRegistry:
+    """Canonical maps URLs of an export with their ids and message ids."""
+
+    def __init__(self, messages: Iterable[Dict]):
+        self.urls: Dict[str, str] = {}  # url id -> canonical URL
+        self.message_ids: Dict[str, List[int]] = {}  # url id -> message ids, export order
+        self.by_message: Dict[int, List[str]] = {}  # message id -> url ids, text order
+
+        for msg in messages:
+            if msg.get('type', 'message') != 'message':
+                continue
+            for url in extract_urls(message_text(msg.get('text'))):
+                uid = url_id(url)
+                self.urls[uid] = url
+                self.message_ids.setdefault(uid, []).append(msg['id'])
+                self.by_message.setdefault(msg['id'], []).append(uid)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def has_maps(self, msg_id: int) -> bool:
+        return msg_id in self.by_message
+
+    def url_ids_in(self, msg_id: int) -> List[str]:
+        return self.by_message.get(msg_id, [])
+
+    def urls_in(self, msg_id: int) -> List[str]:
+        return [self.urls[uid] for uid in self.by_message.get(msg_id, [])]
+
+    def first_url(self, msg_id: int) -> Optional[str]:
+        uids = self.by_message.get(msg_id)
+        return self.urls[uids[0]] if uids else None
+
+    def links(self, msg_ids: Iterable[int]) -> List[Tuple[int, str]]:
+        """(message id, canonical URL) for every link in the given messages."""
+        return [(msg_id, self.urls[uid]) for msg_id in msg_ids for uid in self.by_message.get(msg_id, [])]
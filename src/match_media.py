@@ -7,17 +7,25 @@ Links photos and Google Maps locations from Telegram to the merged mosque databa
 
 Strategy:
 1. Parse Telegram export for photos and maps
-2. Match to mosques using message proximity and mosque names
+2. Match to mosques by position within the same topic thread
 3. Enrich master database with media links
+
+"Nearby" is counted in messages of the mosque's own topic, not in raw
+message ids: ids are global across all topics, so ±20 ids may hold none of
+the topic's messages in a busy group, or all of them. With `max_time_gap`
+set, a window also stops at any pause longer than that many seconds.
 """
 
 import sys
 import os
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import json
-import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from clustering import MessageIndex, ThreadIndex
+from maps_links import MapsRegistry
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -27,19 +35,57 @@ if sys.platform == 'win32':
         import io
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+PHOTO_WINDOW = 20  # Photos within ±20 messages of the mosque's message (same topic)
+MAPS_WINDOW = 5  # Maps links within ±5 messages (same topic)
+
+
+def sorted_media_keys(thread_index: ThreadIndex,
+                      message_ids: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Media rows ordered by thread key, once per media type.
+
+    Returns:
+        (row order, sorted keys) - media not in the index are left out
+    """
+    keys, found = thread_index.keys(message_ids.to_numpy(dtype=np.int64))
+    rows = np.flatnonzero(found)
+    order = rows[np.argsort(keys[rows], kind='stable')]
+    return order, keys[order]
+
+
+def window_bounds(sorted_keys: np.ndarray, keys: np.ndarray, valid: np.ndarray,
+                  radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    [lo, hi) slice of the sorted media inside each mosque's window:
+    same thread segment, position within ±radius. All mosques at once.
+
+    Invalid mosques (no message id, or not in the export) get an empty slice.
+    """
+    lo = np.searchsorted(sorted_keys, keys - radius, side='left')
+    hi = np.searchsorted(sorted_keys, keys + radius, side='right')
+    return lo, np.where(valid, hi, lo)
+
 
 class MediaMatcher:
     """Match photos and maps from Telegram to mosque records."""
 
-    def __init__(self, telegram_export: str, mosques_csv: str, output_dir: str = "out_csv"):
+    def __init__(self, telegram_export: str, mosques_csv: str, output_dir: str = "out_csv",
+                 max_time_gap: Optional[float] = None):
+        """
+        Args:
+            max_time_gap: Seconds of silence that end a window (None: topic only)
+        """
         self.export_path = Path(telegram_export)
         self.mosques_csv = Path(mosques_csv)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.max_time_gap = max_time_gap
 
         self.export_data = None
         self.mosques_df = None
         self.topics = {}  # topic_id -> province mapping
+        self.thread_index = None  # Position of every message in its topic
+        self.maps = None  # MapsRegistry of the export
 
         self.photos_data = []
         self.maps_data = []
@@ -56,6 +102,7 @@ class MediaMatcher:
         with open(self.export_path, 'r', encoding='utf-8') as f:
             self.export_data = json.load(f)
         print(f"✅ Telegram export: {len(self.export_data['messages'])} messages")
+        self.maps = MapsRegistry(self.export_data['messages'])
 
         # Load mosques
         self.mosques_df = pd.read_csv(self.mosques_csv, encoding='utf-8')
@@ -63,6 +110,7 @@ class MediaMatcher:
 
         # Extract topics (provinces)
         self._extract_topics()
+        self._build_thread_index()
 
     def _extract_topics(self):
         """Extract Telegram topics (provinces) from export."""
@@ -74,6 +122,31 @@ class MediaMatcher:
 
         print(f"✅ Found {len(self.topics)} topics/provinces")
 
+    def _build_thread_index(self):
+        """
+        Index every message by its position within its topic thread.
+
+        A reply to a topic belongs to it; a reply to another message joins
+        that message's thread (replies always point to earlier ids).
+        """
+        messages = sorted((m for m in self.export_data['messages'] if m.get('type') == 'message'),
+                          key=lambda m: m['id'])
+        thread_of = {}
+        for msg in messages:
+            reply_id = msg.get('reply_to_message_id')
+            if msg['id'] in self.topics:
+                thread_of[msg['id']] = msg['id']
+            elif reply_id in self.topics:
+                thread_of[msg['id']] = reply_id
+            else:
+                thread_of[msg['id']] = thread_of.get(reply_id, -1)
+
+        index = MessageIndex(messages, topics=(thread_of[m['id']] for m in messages))
+        self.thread_index = ThreadIndex(index, self.max_time_gap)
+
+        gap = f", windows end after {self.max_time_gap:g}s of silence" if self.max_time_gap else ""
+        print(f"✅ Thread index: {len(index)} messages{gap}")
+
     def extract_text_content(self, text_field) -> str:
         """Extract plain text from Telegram message text field."""
         if isinstance(text_field, str):
@@ -130,45 +203,28 @@ class MediaMatcher:
         """Extract Google Maps links from messages."""
         print("\n🗺️ Extracting Google Maps links...")
 
-        maps_pattern = re.compile(
-            r'(https?://)?(maps\.app\.goo\.gl/[A-Za-z0-9]+|'
-            r'maps\.google\.com[^\s]+|'
-            r'goo\.gl/maps/[A-Za-z0-9]+)'
-        )
-
         for msg in self.export_data['messages']:
-            if msg.get('type') != 'message':
-                continue
-
-            text = self.extract_text_content(msg.get('text', ''))
-            if not text:
-                continue
-
-            # Find maps URLs
-            matches = maps_pattern.findall(text)
-            if not matches:
+            url_ids = self.maps.url_ids_in(msg.get('id'))
+            if msg.get('type') != 'message' or not url_ids:
                 continue
 
             province = self.find_province_for_message(msg)
+            text = self.extract_text_content(msg.get('text', ''))
 
-            for match in matches:
-                # match is a tuple from findall, get the full match
-                url_part = ''.join(match) if isinstance(match, tuple) else match
-                # Reconstruct full URL
-                url = url_part if url_part.startswith('http') else f'https://{url_part}'
-
+            for url_id in url_ids:
                 maps_record = {
                     'message_id': msg['id'],
                     'date': msg.get('date', ''),
                     'province': province,
-                    'maps_url': url,
+                    'url_id': url_id,
+                    'maps_url': self.maps.urls[url_id],
                     'reply_to': msg.get('reply_to_message_id'),
                     'full_text': text
                 }
 
                 self.maps_data.append(maps_record)
 
-        print(f"✅ Found {len(self.maps_data)} Google Maps links")
+        print(f"✅ Found {len(self.maps_data)} Google Maps links ({len(self.maps)} unique)")
 
     def match_media_to_mosques(self):
         """
@@ -176,8 +232,8 @@ class MediaMatcher:
 
         Matching strategy:
         1. Use telegram_msg_id if available (from AI extraction)
-        2. Match by proximity (photos/maps near mosque name messages)
-        3. Match by province and name similarity
+        2. Match by proximity: photos/maps within a few messages of the
+           mosque's message in the same topic thread (the topic is the province)
         """
         print("\n🔗 Matching media to mosques...")
 
@@ -185,48 +241,41 @@ class MediaMatcher:
         photos_df = pd.DataFrame(self.photos_data) if self.photos_data else pd.DataFrame()
         maps_df = pd.DataFrame(self.maps_data) if self.maps_data else pd.DataFrame()
 
+        # Media sorted by thread key once; each mosque's window is then a
+        # slice found by binary search
+        msg_ids = pd.to_numeric(self.mosques_df.get('telegram_msg_id', pd.Series(np.nan, index=self.mosques_df.index)),
+                                errors='coerce').to_numpy(dtype=float)
+        has_id = np.isfinite(msg_ids)
+        keys, valid = self.thread_index.keys(np.where(has_id, msg_ids, -1).astype(np.int64))
+        valid &= has_id
+
+        # Find photos within ±20 messages
+        photo_counts = np.zeros(len(self.mosques_df), dtype=np.int64)
+        photo_files = [None] * len(self.mosques_df)
+        if len(photos_df):
+            order, media_keys = sorted_media_keys(self.thread_index, photos_df['message_id'])
+            lo, hi = window_bounds(media_keys, keys, valid, PHOTO_WINDOW)
+            files = photos_df['file_path'].to_numpy(dtype=object)[order]
+            photo_counts = hi - lo
+            photo_files = ['; '.join(files[a:b]) if b > a else None for a, b in zip(lo, hi)]
+
+        # Find maps link within ±5 messages (take first match)
+        maps_urls = np.full(len(self.mosques_df), None, dtype=object)
+        if len(maps_df):
+            order, media_keys = sorted_media_keys(self.thread_index, maps_df['message_id'])
+            lo, hi = window_bounds(media_keys, keys, valid, MAPS_WINDOW)
+            urls = maps_df['maps_url'].to_numpy(dtype=object)[order]
+            found = hi > lo
+            maps_urls[found] = urls[lo[found]]
+
         # Add columns to mosques for media
-        self.mosques_df['photo_files'] = None
-        self.mosques_df['photo_count'] = 0
-        self.mosques_df['maps_url'] = None
-        self.mosques_df['has_location'] = False
-
-        matched_photos = 0
-        matched_maps = 0
-
-        # Match for mosques with telegram message IDs (from AI extraction)
-        for idx, mosque in self.mosques_df.iterrows():
-            msg_id = mosque.get('telegram_msg_id')
-
-            if pd.notna(msg_id):
-                msg_id = int(msg_id)
-
-                # Find photos within ±20 messages
-                nearby_photos = photos_df[
-                    (photos_df['message_id'] >= msg_id - 20) &
-                    (photos_df['message_id'] <= msg_id + 20) &
-                    (photos_df['province'] == mosque['province'])
-                ]
-
-                if len(nearby_photos) > 0:
-                    photo_files = nearby_photos['file_path'].tolist()
-                    self.mosques_df.at[idx, 'photo_files'] = '; '.join(photo_files)
-                    self.mosques_df.at[idx, 'photo_count'] = len(photo_files)
-                    matched_photos += len(photo_files)
-
-                # Find maps link within ±5 messages
-                nearby_maps = maps_df[
-                    (maps_df['message_id'] >= msg_id - 5) &
-                    (maps_df['message_id'] <= msg_id + 5) &
-                    (maps_df['province'] == mosque['province'])
-                ]
-
-                if len(nearby_maps) > 0:
-                    # Take first match
-                    maps_url = nearby_maps.iloc[0]['maps_url']
-                    self.mosques_df.at[idx, 'maps_url'] = maps_url
-                    self.mosques_df.at[idx, 'has_location'] = True
-                    matched_maps += 1
+        self.mosques_df['photo_files'] = photo_files
+        self.mosques_df['photo_count'] = photo_counts
+        self.mosques_df['maps_url'] = maps_urls
+        self.mosques_df['has_location'] = pd.notna(maps_urls)
+
+        matched_photos = int(photo_counts.sum())
+        matched_maps = int(self.mosques_df['has_location'].sum())
 
         print(f"✅ Matched {matched_photos} photos to mosques")
         print(f"✅ Matched {matched_maps} maps to mosques")
@@ -316,9 +365,17 @@ class MediaMatcher:
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Match Telegram photos and maps to mosques')
+    parser.add_argument('--max-time-gap', type=float, default=None,
+                        help='Seconds of silence in a topic that end a match window')
+    args = parser.parse_args()
+
     matcher = MediaMatcher(
         telegram_export="MasajidChat/result.json",
         mosques_csv="out_csv/mosques_merged_master.csv",
-        output_dir="out_csv"
+        output_dir="out_csv",
+        max_time_gap=args.max_time_gap
     )
     matcher.run()
@@ -10,14 +10,29 @@ Strategy:
 2. AI data adds additional mosques not in Excel (461 mosques from Telegram)
 3. Use fuzzy matching to detect duplicates
 4. Create master CSV with source tracking
+
+Match decisions and mosque ids are kept in out_csv/merge_state.json; later
+runs only score records that are new or changed since then. Once
+extract_gps_coordinates.py has run, a geo pass also folds AI records into
+nearby records with similar names (geo_dedup.py).
 """
 
+import argparse
+import hashlib
+import json
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
-from difflib import SequenceMatcher
-import re
+
+from arabic_text import add_normalized_columns, normalize_name, normalize_series, skeleton_series
+from edit_distance import PackedStrings, batch_ratio, ratio
+from geo_dedup import GEO_RADIUS_M, GEO_THRESHOLD, geo_duplicates, load_coordinates, load_message_clusters
+from trigram_index import TrigramIndex, combined_overlap, top_candidates
+from union_find import UnionFind
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -27,19 +42,165 @@ if sys.platform == 'win32':
         import io
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# Only the best candidates by trigram overlap get exact similarity scoring
+CANDIDATE_LIMIT = 20
+
+# Stored normalized columns (source -> target)
+NORMALIZED_COLUMNS = {'mosque_name': 'name_norm', 'area': 'area_norm'}
+
+# Below this many Excel rows process start-up costs more than it saves
+MIN_PARALLEL_ROWS = 2000
+
+# Bump when matching rules change so stale decisions aren't reused
+STATE_VERSION = 4
+
+# Match tiers, strongest first (a row's match never moves to a weaker tier)
+TIERS = ('skeleton', 'fuzzy')
+
+
+def similarity_ratio(norm1: str, norm2: str) -> float:
+    """Levenshtein similarity ratio between two already-normalized strings."""
+    return ratio(norm1, norm2)
+
+
+def province_candidates(names: List[str], areas: List[str]) -> Dict:
+    """Trigram indexes and packed strings over one province's normalized names and areas."""
+    return {
+        'names': names,
+        'areas': areas,
+        'name_index': TrigramIndex(names),
+        'area_index': TrigramIndex(areas),
+        'packed_names': PackedStrings(names),
+        'packed_areas': PackedStrings(areas)
+    }
+
+
+def best_candidate(name: str, area: str, candidates: Dict,
+                   threshold: float) -> Optional[Tuple[int, float]]:
+    """
+    Best-scoring AI row of a province for one normalized name/area.
+
+    Exact scoring only for the top candidates by trigram overlap, in row
+    order so ties resolve to the first best match.
+
+    Returns:
+        (position within the province, score) or None below threshold
+    """
+    best_match = None
+    for local, score in scored_candidates(name, area, candidates, threshold):
+        if best_match is None or score > best_match[1]:
+            best_match = (local, score)
+
+    return best_match
+
+
+def scored_candidates(name: str, area: str, candidates: Dict,
+                      threshold: float) -> List[Tuple[int, float]]:
+    """
+    Shortlisted rows of a province scoring at least `threshold`.
+
+    Returns:
+        [(position within the province, score)] in row order
+    """
+    overlap = combined_overlap([(candidates['name_index'], name, 0.7),
+                                (candidates['area_index'], area, 0.3)])
+    shortlist, _ = top_candidates(overlap, CANDIDATE_LIMIT)
+    shortlist = np.sort(shortlist)
+
+    # Name similarity first: names below this can't reach the threshold
+    # even with identical areas, so the kernel stops on them early
+    name_floor = max(0.0, (threshold - 0.3) / 0.7)
+    name_sim = batch_ratio(name, candidates['packed_names'].take(shortlist), name_floor)
+    keep = name_sim >= name_floor
+    shortlist, name_sim = shortlist[keep], name_sim[keep]
+
+    # Plus area similarity if both have area
+    area_sim = batch_ratio(area, candidates['packed_areas'].take(shortlist))
+
+    # Combined score (name is more important)
+    scores = name_sim * 0.7 + area_sim * 0.3
+
+    return [(int(local), float(score)) for local, score in zip(shortlist, scores)
+            if score > 0 and score >= threshold]
+
+
+def record_keys(df: pd.DataFrame, columns: List[str]) -> List[str]:
+    """
+    Content key per row: hash of the normalized matching fields.
+
+    Identical rows get `#2`, `#3`... so every key is unique. A row keeps
+    its key (and mosque id) as long as these fields don't change.
+    """
+    values = df[columns].astype('string').fillna('')
+    keys, seen = [], {}
+    for row in values.itertuples(index=False):
+        digest = hashlib.sha1('\x1f'.join(row).encode('utf-8')).hexdigest()[:16]
+        seen[digest] = seen.get(digest, 0) + 1
+        keys.append(digest if seen[digest] == 1 else f"{digest}#{seen[digest]}")
+    return keys
+
+
+def skeleton_keys(df: pd.DataFrame) -> List[Optional[str]]:
+    """
+    Exact-join key per row: province + skeleton of name and area.
+
+    Rows without an area get None: fuzzy scoring never accepts those
+    (area counts for 30%), so neither may the exact join.
+    """
+    if 'name_skel' not in df:
+        df['name_skel'] = skeleton_series(df['mosque_name'])
+        df['area_skel'] = skeleton_series(df['area']) if 'area' in df else ''
+    return [f"{province}\x1f{name}\x1f{area}" if name and area else None
+            for province, name, area in zip(df['province'], df['name_skel'], df['area_skel'])]
+
+
+def better_match(candidate: Tuple[int, float, str], current: Optional[Tuple[int, float, str]]) -> bool:
+    """Stronger tier, then higher score, then earlier AI row wins."""
+    if current is None:
+        return True
+    rank = (-TIERS.index(candidate[2]), candidate[1], -candidate[0])
+    return rank > (-TIERS.index(current[2]), current[1], -current[0])
+
+
+def match_province(job: Tuple) -> Tuple[str, List[Optional[Tuple[int, float]]]]:
+    """
+    Match every Excel row of one province (runs in a worker process).
+
+    Args:
+        job: (province, excel names, excel areas, AI names, AI areas, threshold)
+
+    Returns:
+        (province, best_candidate() result per Excel row)
+    """
+    province, excel_names, excel_areas, ai_names, ai_areas, threshold = job
+    candidates = province_candidates(ai_names, ai_areas)
+    return province, [best_candidate(name, area, candidates, threshold)
+                      for name, area in zip(excel_names, excel_areas)]
+
 
 class MosqueMerger:
     """Merge Excel and AI extracted mosque data with deduplication."""
 
-    def __init__(self, excel_path: str, ai_path: str, output_dir: str = "out_csv"):
+    def __init__(self, excel_path: str, ai_path: str, output_dir: str = "out_csv",
+                 workers: Optional[int] = None, incremental: bool = True):
         self.excel_path = Path(excel_path)
         self.ai_path = Path(ai_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.workers = workers  # Matching processes (None = one per CPU, 1 = serial)
+        self.state_path = self.output_dir / "merge_state.json"
+        self.gps_path = self.output_dir / "mosques_with_gps.csv"  # extract_gps_coordinates.py output
+        self.geo_merges = 0
+        self.incremental = incremental  # False = rescore everything, ignore saved state
 
         self.excel_df = None
         self.ai_df = None
         self.merged_df = None
+        self._ai_index = None  # (ai_df, per-province trigram indexes)
+        self.excel_keys = []  # record_keys() per Excel row
+        self.ai_keys = []
+        self.mosque_ids = {}  # record key -> mosque_id
+        self.tier_counts = {}  # Matched Excel/AI pairs per tier
 
         print("=" * 60)
         print("🔗 Mosque Data Merger - Day 3")
@@ -57,39 +218,51 @@ class MosqueMerger:
         self.ai_df = pd.read_csv(self.ai_path, encoding='utf-8')
         print(f"✅ AI data: {len(self.ai_df)} mosques")
 
+        # Normalize names/areas once; every comparison reuses these columns
+        for df in (self.excel_df, self.ai_df):
+            add_normalized_columns(df, NORMALIZED_COLUMNS)
+
         # Show columns
         print(f"\n📋 Excel columns: {list(self.excel_df.columns)}")
         print(f"📋 AI columns: {list(self.ai_df.columns)}")
 
     def normalize_text(self, text: str) -> str:
-        """Normalize Arabic text for comparison."""
-        if pd.isna(text) or text == '':
-            return ''
-
-        text = str(text).strip()
-
-        # Remove common mosque prefixes for matching
-        text = re.sub(r'^(مسجد|جامع|مصلى)\s+', '', text)
-
-        # Normalize Arabic characters
-        text = text.replace('أ', 'ا').replace('إ', 'ا').replace('آ', 'ا')
-        text = text.replace('ة', 'ه')
-        text = text.replace('ى', 'ي')
-
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-
-        return text.lower()
+        """Normalize Arabic text for comparison (shared arabic_text rules)."""
+        return normalize_name(text)
 
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """Calculate similarity ratio between two strings."""
-        norm1 = self.normalize_text(text1)
-        norm2 = self.normalize_text(text2)
+        return self._ratio(self.normalize_text(text1), self.normalize_text(text2))
 
-        if not norm1 or not norm2:
-            return 0.0
+    @staticmethod
+    def _ratio(norm1: str, norm2: str) -> float:
+        """Similarity ratio between two already-normalized strings."""
+        return similarity_ratio(norm1, norm2)
 
-        return SequenceMatcher(None, norm1, norm2).ratio()
+    def build_candidate_index(self, ai_df: pd.DataFrame) -> dict:
+        """
+        Normalize AI names/areas once and index them by character trigrams,
+        one index per province.
+
+        Returns:
+            province -> {'rows', 'names', 'areas', 'name_index', 'area_index'}
+            where `rows` are positions in `ai_df`
+        """
+        add_normalized_columns(ai_df, NORMALIZED_COLUMNS)
+        names = ai_df['name_norm'].tolist()
+        areas = ai_df['area_norm'].tolist()
+
+        index = {}
+        for province, rows in ai_df.groupby('province', sort=False).indices.items():
+            index[province] = province_candidates([names[r] for r in rows], [areas[r] for r in rows])
+            index[province]['rows'] = rows
+        return index
+
+    def _candidate_index(self, ai_df: pd.DataFrame) -> dict:
+        """Trigram indexes for `ai_df`, built on first use."""
+        if self._ai_index is None or self._ai_index[0] is not ai_df:
+            self._ai_index = (ai_df, self.build_candidate_index(ai_df))
+        return self._ai_index[1]
 
     def find_duplicates(self, excel_row, ai_df, threshold: float = 0.85):
         """
@@ -101,35 +274,243 @@ class MosqueMerger:
         3. Similar area if available
         """
         province = excel_row['province']
-        name = excel_row['mosque_name']
-        area = excel_row.get('area', '')
+        name = excel_row.get('name_norm')
+        if name is None:
+            name = self.normalize_text(excel_row['mosque_name'])
+        area = excel_row.get('area_norm')
+        if area is None:
+            area = self.normalize_text(excel_row.get('area', ''))
+
+        # AI data of the same province, indexed by trigrams
+        candidates = self._candidate_index(ai_df).get(province)
 
-        # Filter AI data by province
-        province_matches = ai_df[ai_df['province'] == province]
+        if candidates is None:
+            return None
 
-        if len(province_matches) == 0:
+        match = best_candidate(name, area, candidates, threshold)
+        if match is None:
             return None
 
-        best_match = None
-        best_score = 0.0
+        local, score = match
+        row = candidates['rows'][local]
+        return (ai_df.index[row], ai_df.iloc[row], score)
 
-        for idx, ai_row in province_matches.iterrows():
-            # Calculate name similarity
-            name_sim = self.calculate_similarity(name, ai_row['mosque_name'])
+    def match_all(self, threshold: float,
+                  excel_rows: Optional[List[int]] = None) -> Dict[int, Tuple[int, float, str]]:
+        """
+        Best AI match for every Excel row (or only `excel_rows`).
 
-            # Calculate area similarity if both have area
-            area_sim = 0.0
-            if area and pd.notna(ai_row.get('area')):
-                area_sim = self.calculate_similarity(area, ai_row['area'])
+        Tier 1 joins rows with equal skeleton keys by hash (first AI row
+        wins). Only the remaining rows are fuzzy-scored, one province per
+        job: provinces never match across each other, so each is scored
+        independently (in worker processes for large inputs) and the
+        results are keyed by row position, which keeps the merge identical
+        to scoring the rows one by one.
 
-            # Combined score (name is more important)
-            score = name_sim * 0.7 + area_sim * 0.3
+        Returns:
+            Excel row position -> (AI row position, score, tier)
+        """
+        add_normalized_columns(self.excel_df, NORMALIZED_COLUMNS)
+        add_normalized_columns(self.ai_df, NORMALIZED_COLUMNS)
+
+        ai_by_key = {}
+        for pos, key in enumerate(skeleton_keys(self.ai_df)):
+            if key is not None:
+                ai_by_key.setdefault(key, pos)
+
+        matches = {}
+        targets = range(len(self.excel_df)) if excel_rows is None else excel_rows
+        excel_skeletons = skeleton_keys(self.excel_df)
+        for row in targets:
+            ai_pos = ai_by_key.get(excel_skeletons[row])
+            if ai_pos is not None:
+                matches[int(row)] = (ai_pos, 1.0, 'skeleton')
+        fuzzy_rows = [row for row in targets if row not in matches]
+
+        excel_groups = self.excel_df.groupby('province', sort=False).indices
+        ai_groups = self.ai_df.groupby('province', sort=False).indices
+
+        excel_names, excel_areas = self.excel_df['name_norm'].tolist(), self.excel_df['area_norm'].tolist()
+        ai_names, ai_areas = self.ai_df['name_norm'].tolist(), self.ai_df['area_norm'].tolist()
+
+        excel_groups = {province: rows[np.isin(rows, fuzzy_rows)]
+                        for province, rows in excel_groups.items()}
+
+        jobs = []
+        for province, rows in excel_groups.items():
+            if province not in ai_groups or len(rows) == 0:
+                continue
+            ai_rows = ai_groups[province]
+            jobs.append((province,
+                         [excel_names[r] for r in rows], [excel_areas[r] for r in rows],
+                         [ai_names[r] for r in ai_rows], [ai_areas[r] for r in ai_rows],
+                         threshold))
+
+        workers = min(self.workers or os.cpu_count() or 1, len(jobs))
+        if workers > 1 and sum(len(job[1]) for job in jobs) >= MIN_PARALLEL_ROWS:
+            print(f"   Scoring {len(jobs)} provinces in {workers} processes...")
+            # Largest provinces first so one big province doesn't finish last
+            jobs.sort(key=lambda job: -len(job[1]) * len(job[3]))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(match_province, jobs))
+        else:
+            results = [match_province(job) for job in jobs]
+
+        for province, best in results:
+            rows, ai_rows = excel_groups[province], ai_groups[province]
+            for row, match in zip(rows, best):
+                if match is not None:
+                    matches[int(row)] = (int(ai_rows[match[0]]), match[1], 'fuzzy')
+        return matches
+
+    def load_state(self, threshold: float) -> Optional[dict]:
+        """Saved decisions from the last run, if made under the same rules."""
+        if not self.incremental or not self.state_path.exists():
+            return None
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get('version') != STATE_VERSION or state.get('threshold') != threshold
+                or state.get('candidate_limit') != CANDIDATE_LIMIT):
+            print("   Saved merge state uses different rules, rescoring everything")
+            return None
+        return state
+
+    def save_state(self, matches: Dict[int, Tuple[int, float, str]], threshold: float):
+        """
+        Persist match decisions and mosque ids (written atomically).
+
+        Records are keyed by their normalized fields (`record_keys`), so
+        the fields themselves are not stored.
+        """
+        excel = {}
+        for pos, key in enumerate(self.excel_keys):
+            ai_pos, score, tier = matches.get(pos, (None, None, None))
+            excel[key] = {
+                'id': self.mosque_ids[key],
+                'match': self.ai_keys[ai_pos] if ai_pos is not None else None,
+                'score': score,
+                'tier': tier
+            }
+        ai = {key: {'id': self.mosque_ids[key]} for key in self.ai_keys}
+
+        state = {
+            'version': STATE_VERSION,
+            'threshold': threshold,
+            'candidate_limit': CANDIDATE_LIMIT,
+            'next_ids': self._next_ids,
+            'excel': excel,
+            'ai': ai
+        }
+        tmp_path = self.state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        tmp_path.replace(self.state_path)
+
+    def assign_ids(self, state: Optional[dict]):
+        """
+        Stable mosque ids: records seen before keep theirs, new or changed
+        records get the next free number. Without state the ids follow row
+        order as before (EXL_0001..., AI_0001...).
+        """
+        known = {}
+        if state:
+            known = {key: entry['id'] for part in ('excel', 'ai') for key, entry in state[part].items()}
+        self._next_ids = dict(state['next_ids']) if state else {
+            'EXL': len(self.excel_df) + 1, 'AI': len(self.ai_df) + 1
+        }
+
+        self.mosque_ids = {}
+        for prefix, keys, df in (('EXL', self.excel_keys, self.excel_df), ('AI', self.ai_keys, self.ai_df)):
+            for idx, key in zip(df.index, keys):
+                if key in known:
+                    self.mosque_ids[key] = known[key]
+                elif state is None:
+                    self.mosque_ids[key] = f"{prefix}_{idx+1:04d}"
+                else:
+                    self.mosque_ids[key] = f"{prefix}_{self._next_ids[prefix]:04d}"
+                    self._next_ids[prefix] += 1
+
+    def match_incremental(self, state: dict, threshold: float) -> Dict[int, Tuple[int, float, str]]:
+        """
+        Reuse saved decisions; score only what changed since the last run.
 
-            if score > best_score and score >= threshold:
-                best_score = score
-                best_match = (idx, ai_row, score)
+        - New/changed Excel rows, and rows whose matched AI record is gone,
+          are scored against all AI rows of their province.
+        - New/changed AI rows are joined by skeleton key, then scored
+          against the saved Excel index, and take over an Excel row when
+          they beat its current match (`better_match`, as in a full run).
 
-        return best_match
+        Returns:
+            Excel row position -> (AI row position, score, tier)
+        """
+        ai_pos = {key: pos for pos, key in enumerate(self.ai_keys)}
+        saved_excel = state['excel']
+
+        matches, dirty = {}, []
+        for pos, key in enumerate(self.excel_keys):
+            entry = saved_excel.get(key)
+            if entry is None or (entry['match'] is not None and entry['match'] not in ai_pos):
+                dirty.append(pos)
+            elif entry['match'] is not None:
+                matches[pos] = (ai_pos[entry['match']], entry['score'], entry['tier'])
+
+        new_ai = [pos for pos, key in enumerate(self.ai_keys) if key not in state['ai']]
+        print(f"   Incremental: {len(new_ai)} new AI rows, {len(dirty)} Excel rows to rescore, "
+              f"{len(self.excel_keys) - len(dirty)} decisions reused")
+
+        if dirty:
+            matches.update(self.match_all(threshold, excel_rows=dirty))
+
+        if new_ai:
+            dirty_rows = set(dirty)
+            ai_skeletons = skeleton_keys(self.ai_df)
+            excel_by_key = {}
+            for row, key in enumerate(skeleton_keys(self.excel_df)):
+                if key is not None and row not in dirty_rows:
+                    excel_by_key.setdefault(key, []).append(row)
+            provinces = set(self.ai_df['province'].iloc[new_ai])
+            names, areas = self.excel_df['name_norm'].tolist(), self.excel_df['area_norm'].tolist()
+            excel_index = {}
+            for province, rows in self.excel_df.groupby('province', sort=False).indices.items():
+                if province in provinces:
+                    excel_index[province] = province_candidates([names[r] for r in rows],
+                                                                [areas[r] for r in rows])
+                    excel_index[province]['rows'] = rows
+
+            for pos in new_ai:
+                for row in excel_by_key.get(ai_skeletons[pos], []):
+                    if better_match((pos, 1.0, 'skeleton'), matches.get(row)):
+                        matches[row] = (pos, 1.0, 'skeleton')
+
+                candidates = excel_index.get(self.ai_df['province'].iat[pos])
+                if candidates is None:
+                    continue
+                name, area = self.ai_df['name_norm'].iat[pos], self.ai_df['area_norm'].iat[pos]
+                for local, score in scored_candidates(name, area, candidates, threshold):
+                    row = int(candidates['rows'][local])
+                    if row in dirty_rows:
+                        continue
+                    if better_match((pos, score, 'fuzzy'), matches.get(row)):
+                        matches[row] = (pos, score, 'fuzzy')
+
+        return matches
+
+    def match_datasets(self, threshold: float) -> Dict[int, Tuple[int, float, str]]:
+        """Match Excel rows to AI rows, incrementally when saved state allows."""
+        self.excel_keys = record_keys(self.excel_df, ['province', 'name_norm', 'area_norm'])
+        self.ai_keys = record_keys(self.ai_df, ['province', 'name_norm', 'area_norm', 'source_message_id']
+                                   if 'source_message_id' in self.ai_df else ['province', 'name_norm', 'area_norm'])
+
+        state = self.load_state(threshold)
+        self.assign_ids(state)
+        if state is None:
+            matches = self.match_all(threshold)
+        else:
+            matches = self.match_incremental(state, threshold)
+
+        self.save_state(matches, threshold)
+        self.tier_counts = {tier: sum(1 for match in matches.values() if match[2] == tier) for tier in TIERS}
+        return matches
 
     def merge_datasets(self, similarity_threshold: float = 0.85):
         """
@@ -146,10 +527,13 @@ class MosqueMerger:
         merged_records = []
         ai_matched_indices = set()
 
+        # Score all provinces up front (only new/changed rows if state allows)
+        matches = self.match_datasets(similarity_threshold)
+
         # Process Excel data first (ground truth)
-        for idx, excel_row in self.excel_df.iterrows():
+        for pos, (idx, excel_row) in enumerate(self.excel_df.iterrows()):
             record = {
-                'mosque_id': f"EXL_{idx+1:04d}",
+                'mosque_id': self.mosque_ids[self.excel_keys[pos]],
                 'mosque_name': excel_row['mosque_name'],
                 'area': excel_row.get('area', ''),
                 'province': excel_row['province'],
@@ -161,17 +545,19 @@ class MosqueMerger:
                 'merge_notes': 'From Excel master list'
             }
 
-            # Try to find matching AI data to enrich
-            match = self.find_duplicates(excel_row, self.ai_df, similarity_threshold)
-
-            if match:
-                match_idx, ai_row, score = match
+            # Matching AI data to enrich with
+            if pos in matches:
+                ai_pos, score, tier = matches[pos]
+                match_idx, ai_row = self.ai_df.index[ai_pos], self.ai_df.iloc[ai_pos]
                 ai_matched_indices.add(match_idx)
 
                 # Enrich with AI data
                 record['telegram_msg_id'] = ai_row.get('source_message_id')
                 record['source'] = 'excel+ai'
-                record['merge_notes'] = f'Matched with AI data (similarity: {score:.2%})'
+                if tier == 'skeleton':
+                    record['merge_notes'] = 'Matched with AI data (same skeleton key)'
+                else:
+                    record['merge_notes'] = f'Matched with AI data (similarity: {score:.2%})'
 
                 # Use AI area if Excel missing
                 if not record['area'] and pd.notna(ai_row.get('area')):
@@ -185,17 +571,19 @@ class MosqueMerger:
 
         print(f"✅ Processed {len(merged_records)} Excel mosques")
         print(f"✅ Matched {len(ai_matched_indices)} with AI data")
+        for tier in TIERS:
+            print(f"   • {tier} tier: {self.tier_counts.get(tier, 0)} pairs")
 
         # Add unmatched AI mosques (new discoveries)
-        ai_only_count = 0
-        for idx, ai_row in self.ai_df.iterrows():
+        ai_only_records = []
+        for pos, (idx, ai_row) in enumerate(self.ai_df.iterrows()):
             if idx not in ai_matched_indices:
                 # Skip low confidence AI extractions
                 if ai_row.get('confidence', '').lower() == 'low':
                     continue
 
                 record = {
-                    'mosque_id': f"AI_{idx+1:04d}",
+                    'mosque_id': self.mosque_ids[self.ai_keys[pos]],
                     'mosque_name': ai_row['mosque_name'],
                     'area': ai_row.get('area', ''),
                     'province': ai_row['province'],
@@ -206,8 +594,12 @@ class MosqueMerger:
                     'confidence': ai_row.get('confidence', 'medium'),
                     'merge_notes': 'AI extraction only (not in Excel)'
                 }
-                merged_records.append(record)
-                ai_only_count += 1
+                ai_only_records.append(record)
+
+        # By id, so mosques discovered since the last run are appended at the end
+        ai_only_records.sort(key=lambda record: int(record['mosque_id'].split('_')[1]))
+        merged_records.extend(ai_only_records)
+        ai_only_count = len(ai_only_records)
 
         print(f"✅ Added {ai_only_count} AI-only mosques")
 
@@ -220,6 +612,111 @@ class MosqueMerger:
         print(f"   Excel+AI: {len(self.merged_df[self.merged_df['source'] == 'excel+ai'])}")
         print(f"   AI only: {len(self.merged_df[self.merged_df['source'] == 'ai_only'])}")
 
+    def attach_coordinates(self) -> int:
+        """
+        latitude/longitude per merged record, looked up by Telegram message
+        id (AI columns if present, else extract_gps_coordinates.py output).
+
+        Returns:
+            Number of records with coordinates
+        """
+        coordinates = load_coordinates(self.gps_path)
+        if {'latitude', 'longitude', 'source_message_id'} <= set(self.ai_df.columns):
+            located = self.ai_df[self.ai_df['latitude'].notna() & self.ai_df['longitude'].notna()]
+            for msg_id, lat, lng in zip(located['source_message_id'], located['latitude'], located['longitude']):
+                coordinates[int(msg_id)] = (float(lat), float(lng))
+
+        msg_ids = pd.to_numeric(self.merged_df['telegram_msg_id'], errors='coerce')
+        found = [coordinates.get(int(m)) if pd.notna(m) else None for m in msg_ids]
+        self.merged_df['latitude'] = [c[0] if c else np.nan for c in found]
+        self.merged_df['longitude'] = [c[1] if c else np.nan for c in found]
+        return int(self.merged_df['latitude'].notna().sum())
+
+    def record_clusters(self) -> np.ndarray:
+        """Conversation cluster code per merged record (-1 = unknown)."""
+        clusters = load_message_clusters(self.gps_path)
+        msg_ids = pd.to_numeric(self.merged_df['telegram_msg_id'], errors='coerce')
+        keys = [clusters.get(int(m)) if pd.notna(m) else None for m in msg_ids]
+        return pd.factorize(pd.Series(keys, dtype=object))[0]
+
+    def geo_dedup(self, radius_m: float = GEO_RADIUS_M, threshold: float = GEO_THRESHOLD):
+        """
+        Fold AI records into nearby records of the same mosque.
+
+        Pairs within `radius_m` whose name + distance score passes are
+        merged transitively, strongest first. Two Excel records are never
+        merged (Excel is ground truth), also not through a chain: a group
+        keeps at most one Excel record, which absorbs the others. Likewise
+        a group never holds two records from one conversation cluster.
+        """
+        located = self.attach_coordinates()
+        self.merged_df['geo_merged_ids'] = None
+        if located < 2:
+            print(f"\n📍 Geo dedup skipped ({located} records with coordinates)")
+            return
+
+        print(f"\n📍 Geo dedup over {located} records with coordinates (radius {radius_m:.0f} m)...")
+        df = self.merged_df
+        names = normalize_series(df['mosque_name'], strip_prefix=True).tolist()
+        is_excel = df['source'].isin(['excel', 'excel+ai']).to_numpy()
+        clusters = self.record_clusters()
+        matches = geo_duplicates(names, df['latitude'].to_numpy(), df['longitude'].to_numpy(),
+                                 radius_m, threshold, clusters)
+
+        uf = UnionFind(len(df))
+        has_excel = is_excel.copy()  # Per root
+        group_clusters = [{c} if c >= 0 else set() for c in clusters]  # Per root
+        accepted = []
+        for i, j, score, dist in matches:
+            ri, rj = uf.find(i), uf.find(j)
+            if ri == rj or (has_excel[ri] and has_excel[rj]) or group_clusters[ri] & group_clusters[rj]:
+                continue
+            uf.union(ri, rj)
+            root = uf.find(ri)
+            has_excel[root] = has_excel[ri] or has_excel[rj]
+            group_clusters[root] = group_clusters[ri] | group_clusters[rj]
+            accepted.append((i, dist))
+
+        labels = uf.labels()
+        farthest = {}
+        for i, dist in accepted:
+            farthest[labels[i]] = max(farthest.get(labels[i], 0.0), dist)
+
+        groups = pd.Series(np.arange(len(df))).groupby(labels).agg(list)
+        groups = groups[groups.map(len) > 1]
+        drop = []
+        for root, members in groups.items():
+            # Keeper: the Excel record, else the first record
+            keeper = next((m for m in members if is_excel[m]), members[0])
+            absorbed = [m for m in members if m != keeper]
+            self._absorb(keeper, absorbed, farthest[root])
+            drop.extend(absorbed)
+
+        self.geo_merges = len(drop)
+        self.merged_df = df.drop(index=df.index[drop]).reset_index(drop=True)
+        print(f"✅ Geo-merged {self.geo_merges} records into {len(groups)} mosques")
+
+    def _absorb(self, keeper: int, absorbed: List[int], max_dist: float):
+        """Fill the keeper's gaps from absorbed records and note the merge."""
+        df = self.merged_df
+        for col in ('telegram_msg_id', 'area', 'latitude', 'longitude'):
+            if pd.isna(df.at[keeper, col]) or df.at[keeper, col] == '':
+                values = df.loc[absorbed, col].dropna()
+                if len(values):
+                    df.at[keeper, col] = values.iloc[0]
+        if df.at[keeper, 'damage_type'] == 'unknown':
+            known = df.loc[absorbed, 'damage_type'].dropna()
+            known = known[known != 'unknown']
+            if len(known):
+                df.at[keeper, 'damage_type'] = known.iloc[0]
+        if df.at[keeper, 'source'] == 'excel':
+            df.at[keeper, 'source'] = 'excel+ai'
+
+        ids = df.loc[absorbed, 'mosque_id'].tolist()
+        df.at[keeper, 'geo_merged_ids'] = '; '.join(ids)
+        df.at[keeper, 'merge_notes'] = (f"{df.at[keeper, 'merge_notes']}; geo-merged with "
+                                        f"{', '.join(ids)} (within {max_dist:.0f} m)")
+
     def export_results(self):
         """Export merged data to CSV."""
         print("\n💾 Exporting merged data...")
@@ -271,6 +768,11 @@ class MosqueMerger:
             f.write(f"  • AI only: {len(self.merged_df[self.merged_df['source'] == 'ai_only'])}\n")
             f.write(f"  • High confidence: {len(high_conf)}\n\n")
 
+            f.write(f"Match Tiers (Excel/AI pairs):\n")
+            f.write(f"  • Skeleton key (exact join): {self.tier_counts.get('skeleton', 0)}\n")
+            f.write(f"  • Fuzzy similarity: {self.tier_counts.get('fuzzy', 0)}\n")
+            f.write(f"  • Geo-merged records (name + distance): {self.geo_merges}\n\n")
+
             f.write(f"By Province:\n")
             for province, stats in province_stats.iterrows():
                 f.write(f"  • {province}: {int(stats['total'])} mosques ")
@@ -292,6 +794,7 @@ class MosqueMerger:
         """Execute the full merge process."""
         self.load_data()
         self.merge_datasets(similarity_threshold=0.85)
+        self.geo_dedup()
         self.export_results()
 
         print("\n" + "=" * 60)
@@ -304,9 +807,15 @@ class MosqueMerger:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge Excel and AI extracted mosque data')
+    parser.add_argument('--full', action='store_true',
+                        help='Rescore every record instead of reusing out_csv/merge_state.json')
+    args = parser.parse_args()
+
     merger = MosqueMerger(
         excel_path="out_csv/excel_mosques_master.csv",
         ai_path="out_csv/ai_extracted_mosques.csv",
-        output_dir="out_csv"
+        output_dir="out_csv",
+        incremental=not args.full
     )
     merger.run()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local Stand-in for the Anthropic Messages API
+=============================================
+Lets the AI stages be benchmarked reproducibly (e.g. in CI) without
+spending money or depending on network conditions.
+
+The server implements `POST /v1/messages` with:
+- configurable latency distributions (fixed, uniform, lognormal) plus an
+  optional per-output-token delay,
+- 429 injection, either at random or when too many requests are in flight,
+- canned JSON replies derived from the prompt: mosque names, media files
+  and maps links found in the prompt are echoed back in every field the
+  stages read, so downstream parsing and routing run as in production,
+- simulated prompt caching (cache_control system blocks are written on
+  first sight and read afterwards).
+
+Usage:
+    # Serve, then point any stage at it
+    python src/mock_anthropic_server.py serve --port 8765 --latency lognormal:0.8,0.4 --rate-limit 0.05
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=local python src/perfect_ai_etl.py --yes
+
+    # Benchmark a stage at several worker counts on a synthetic export
+    python src/mock_anthropic_server.py bench --stage perfect_ai_etl --workers 1 4 8
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from model_router import MOSQUE_KEYWORDS
+
+CHARS_PER_TOKEN = 3  # Same rough estimate as analyze_conversations
+
+# "مسجد النور" / "جامع الكبير": keyword plus up to three following words
+MOSQUE_NAME_PATTERN = re.compile(
+    r'(?:' + '|'.join(MOSQUE_KEYWORDS) + r')(?:\s+[^\s\-\(\)\[\],:،"]+){1,3}'
+)
+MEDIA_PATTERN = re.compile(r'files/[^\s,"\]\)]+')
+MAPS_PATTERN = re.compile(r'https?://(?:maps\.app\.goo\.gl|goo\.gl/maps|(?:www\.)?google\.[^/\s]+/maps)[^\s,"\]\)]*')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+class LatencyModel:
+    """
+    Response delay drawn from a distribution spec.
+
+    Specs: `fixed:S`, `uniform:LOW,HIGH`, `lognormal:MEDIAN,SIGMA` (seconds).
+    """
+
+    def __init__(self, spec: str = 'fixed:0', per_output_token: float = 0.0):
+        kind, _, params = spec.partition(':')
+        values = [float(v) for v in params.split(',') if v.strip()]
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Bad latency spec '{spec}' (use fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA)")
+        self.kind = kind
+        self.values = values
+        self.per_output_token = per_output_token
+
+    def sample(self, rng: random.Random, output_tokens: int) -> float:
+        if self.kind == 'fixed':
+            base = self.values[0]
+        elif self.kind == 'uniform':
+            base = rng.uniform(*self.values)
+        else:
+            median, sigma = self.values
+            base = median * rng.lognormvariate(0.0, sigma)
+        return base + output_tokens * self.per_output_token
+
+
+def _content_text(content) -> str:
+    """Flatten a messages/system `content` field (string or blocks) to text."""
+    if isinstance(content, str):
+        return content
+    return '\n'.join(block.get('text', '') for block in content or [] if isinstance(block, dict))
+
+
+def canned_reply(prompt: str) -> Dict:
+    """
+    Build a plausible JSON answer from the prompt.
+
+    The reply is a superset of the schemas used by ai_extract,
+    analyze_conversations, ai_photo_assignment and perfect_ai_etl. All media
+    found in the prompt go to the first mosque.
+    """
+    names = list(dict.fromkeys(m.group(0).strip() for m in MOSQUE_NAME_PATTERN.finditer(prompt)))
+    files = list(dict.fromkeys(MEDIA_PATTERN.findall(prompt)))
+    videos = [f for f in files if f.lower().endswith(VIDEO_EXTENSIONS)]
+    photos = [f for f in files if f not in videos]
+    maps = list(dict.fromkeys(MAPS_PATTERN.findall(prompt)))
+
+    mosques = []
+    assignments = {}
+    for i, name in enumerate(names):
+        media = {
+            'photos': photos if i == 0 else [],
+            'videos': videos if i == 0 else [],
+            'maps': maps if i == 0 else []
+        }
+        assignments[name] = media
+        mosques.append({
+            'name': name,
+            'area': '',
+            'damage_type': 'damaged',
+            'damage_status': 'damaged',
+            'confidence': 'high',
+            'reasoning': 'mock reply',
+            'photos': media['photos'],
+            'videos': media['videos'],
+            'maps_links': media['maps'],
+            'excel_match': None,
+            'gps_hint': None,
+            'cost': '',
+            'notes': ''
+        })
+
+    return {
+        'is_mosque_data': bool(mosques),
+        'confidence': 'high' if mosques else 'low',
+        'mosques_count': len(mosques),
+        'mosques': mosques,
+        'has_photos': bool(photos),
+        'has_maps': bool(maps),
+        'assignments': assignments,
+        'reasoning': 'mock reply',
+        'cluster_summary': f"{len(mosques)} mosques, {len(files)} files, {len(maps)} maps links"
+    }
+
+
+class MockAnthropicServer:
+    """Threaded HTTP server answering `POST /v1/messages` like the real API."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: Optional[LatencyModel] = None, rate_limit: float = 0.0,
+                 max_concurrent: Optional[int] = None, retry_after_ms: int = 200,
+                 seed: int = 0):
+        """
+        Args:
+            port: 0 picks a free port (see `base_url`)
+            latency: Delay model per request (default: no delay)
+            rate_limit: Probability of answering a request with 429
+            max_concurrent: Answer 429 when more requests than this are in flight
+            retry_after_ms: Back-off hint sent with every 429
+            seed: Seed for latency and 429 sampling
+        """
+        self.latency = latency or LatencyModel()
+        self.rate_limit = rate_limit
+        self.max_concurrent = max_concurrent
+        self.retry_after_ms = retry_after_ms
+        self.rng = random.Random(seed)
+
+        self.stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'bad_requests': 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._cached_prefixes = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockAnthropicServer':
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def _admit(self) -> bool:
+        """Count the request in and decide whether to answer it with 429."""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            throttled = (self.max_concurrent is not None and self.in_flight > self.max_concurrent) \
+                or self.rng.random() < self.rate_limit
+            if throttled:
+                self.stats['rate_limited'] += 1
+            return throttled
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def build_response(self, body: Dict) -> Tuple[Dict, float]:
+        """Return the Messages API response body and the delay to apply."""
+        system = body.get('system') or []
+        if isinstance(system, str):
+            system = [{'type': 'text', 'text': system}]
+        prompt = '\n'.join(_content_text(m.get('content')) for m in body.get('messages', []))
+
+        # Simulated prompt caching: system blocks up to the last cache_control
+        cached_upto = max((i + 1 for i, b in enumerate(system) if b.get('cache_control')), default=0)
+        cached_text = ''.join(b.get('text', '') for b in system[:cached_upto])
+        uncached_text = ''.join(b.get('text', '') for b in system[cached_upto:]) + prompt
+        cache_tokens = len(cached_text) // CHARS_PER_TOKEN
+
+        text = json.dumps(canned_reply(prompt), ensure_ascii=False)
+        output_tokens = min(max(1, len(text) // CHARS_PER_TOKEN), int(body.get('max_tokens', 4096)))
+
+        with self._lock:
+            self._counter += 1
+            msg_id = f"msg_mock_{self._counter:08d}"
+            prefix = hashlib.sha1(cached_text.encode('utf-8')).hexdigest() if cache_tokens else None
+            cache_hit = prefix in self._cached_prefixes
+            if prefix:
+                self._cached_prefixes.add(prefix)
+            delay = self.latency.sample(self.rng, output_tokens)
+
+        response = {
+            'id': msg_id,
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', ''),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {
+                'input_tokens': len(uncached_text) // CHARS_PER_TOKEN,
+                'output_tokens': output_tokens,
+                'cache_creation_input_tokens': 0 if cache_hit else cache_tokens,
+                'cache_read_input_tokens': cache_tokens if cache_hit else 0
+            }
+        }
+        return response, delay
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Don't add 40 ms delayed-ACK stalls to latency
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length)
+                if self.path.split('?')[0].rstrip('/') != '/v1/messages':
+                    self._send_json(404, {'type': 'error', 'error': {
+                        'type': 'not_found_error', 'message': f"Unknown path {self.path}"}})
+                    return
+
+                throttled = server._admit()
+                try:
+                    if throttled:
+                        self._send_json(429, {'type': 'error', 'error': {
+                            'type': 'rate_limit_error', 'message': 'Mock rate limit'}},
+                            {'retry-after-ms': str(server.retry_after_ms)})
+                        return
+                    try:
+                        body = json.loads(raw or b'{}')
+                    except json.JSONDecodeError:
+                        with server._lock:
+                            server.stats['bad_requests'] += 1
+                        self._send_json(400, {'type': 'error', 'error': {
+                            'type': 'invalid_request_error', 'message': 'Body is not JSON'}})
+                        return
+
+                    response, delay = server.build_response(body)
+                    time.sleep(delay)
+                    with server._lock:
+                        server.stats['ok'] += 1
+                    self._send_json(200, response)
+                finally:
+                    server._release()
+
+        return Handler
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+SYNTHETIC_PROVINCES = ['حلب', 'إدلب', 'حماة', 'حمص']
+SYNTHETIC_NAMES = ['النور', 'الرحمن', 'التقوى', 'الفاروق', 'الهدى', 'الإيمان', 'الصحابة', 'الكبير']
+
+
+def write_synthetic_export(out_dir: Path, clusters_per_province: int = 20,
+                           seed: int = 0) -> Tuple[Path, Path]:
+    """
+    Write a small Telegram export and Excel master list for benchmarking.
+
+    Each province topic gets clusters of: mosque name text, 1-4 photos,
+    sometimes a video and a maps link; clusters are 30 minutes apart.
+
+    Returns:
+        (export directory containing result.json, excel CSV path)
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    messages = []
+    excel_rows = []
+    msg_id = 1
+    clock = datetime(2024, 1, 1, 8, 0, 0)
+
+    def add(entry: Dict):
+        nonlocal msg_id, clock
+        clock += timedelta(seconds=rng.randint(5, 60))
+        messages.append({'id': msg_id, 'type': 'message', 'date': clock.isoformat(), **entry})
+        msg_id += 1
+
+    for province in SYNTHETIC_PROVINCES:
+        topic_id = msg_id
+        messages.append({'id': topic_id, 'type': 'service', 'action': 'topic_created',
+                         'title': f"مساجد {province}", 'date': clock.isoformat()})
+        msg_id += 1
+
+        for c in range(clusters_per_province):
+            clock += timedelta(minutes=30)
+            name = f"مسجد {rng.choice(SYNTHETIC_NAMES)} {c + 1}"
+            area = f"حي {c % 5 + 1}"
+            add({'reply_to_message_id': topic_id, 'text': f"{name} - {area}"})
+            for _ in range(rng.randint(1, 4)):
+                add({'reply_to_message_id': topic_id, 'file': f"files/IMG_{msg_id:05d}.jpg"})
+            if rng.random() < 0.3:
+                add({'reply_to_message_id': topic_id, 'file': f"files/VID_{msg_id:05d}.mp4",
+                     'media_type': 'video_file'})
+            if rng.random() < 0.5:
+                add({'reply_to_message_id': topic_id,
+                     'text': f"https://maps.app.goo.gl/mock{msg_id}"})
+            excel_rows.append({'province': province, 'mosque_name': name,
+                               'area': area, 'damage_type': 'damaged'})
+
+    export_dir = out_dir / 'export'
+    export_dir.mkdir(exist_ok=True)
+    with open(export_dir / 'result.json', 'w', encoding='utf-8') as f:
+        json.dump({'name': 'Synthetic', 'messages': messages}, f, ensure_ascii=False)
+
+    excel_path = out_dir / 'excel_mosques_master.csv'
+    pd.DataFrame(excel_rows).to_csv(excel_path, index=False, encoding='utf-8')
+    return export_dir, excel_path
+
+
+def run_stage(stage: str, export_dir: Path, excel_path: Path, workers: int, work_dir: Path):
+    """Run one AI stage end to end; returns its AITelemetry."""
+    if stage == 'perfect_ai_etl':
+        from perfect_ai_etl import PerfectAIETL
+        etl = PerfectAIETL(export_dir, excel_path, max_workers=workers,
+                           state_path=str(work_dir / 'perfect_ai_state.json'))
+        etl.telemetry.metrics_path = work_dir / 'ai_call_metrics.jsonl'
+        etl.process_all_data()
+        return etl.telemetry
+
+    from analyze_conversations import ConversationAnalyzer
+    analyzer = ConversationAnalyzer(export_path=str(export_dir / 'result.json'),
+                                    output_dir=str(work_dir), max_workers=workers)
+    analyzer.telemetry.metrics_path = work_dir / 'ai_call_metrics.jsonl'
+    analyzer.load_export()
+    analyzer.extract_topics()
+    analyzer.group_by_topic()
+    analyzer.cluster_messages()
+    analyzer.analyze_all_clusters()
+    return analyzer.telemetry
+
+
+def benchmark(args):
+    """Run a stage against a fresh mock server once per worker count."""
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'mock-key')
+    latency = LatencyModel(args.latency, args.per_output_token)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.export:
+            export_dir, excel_path = Path(args.export), Path(args.excel)
+        else:
+            export_dir, excel_path = write_synthetic_export(tmp / 'data', args.clusters, args.seed)
+
+        print(f"🏁 Benchmark: {args.stage} | latency {args.latency} | 429 rate {args.rate_limit:g}"
+              f"{f' | max concurrent {args.max_concurrent}' if args.max_concurrent else ''}")
+        print(f"   Data: {export_dir}")
+        print()
+        print(f"{'workers':>7} {'wall s':>8} {'calls':>6} {'429s':>5} {'retries':>7} "
+              f"{'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'calls/s':>8} {'cost $':>8}")
+
+        results = []
+        for workers in args.workers:
+            server = MockAnthropicServer(latency=latency, rate_limit=args.rate_limit,
+                                         max_concurrent=args.max_concurrent, seed=args.seed).start()
+            os.environ['ANTHROPIC_BASE_URL'] = server.base_url
+            work_dir = tmp / f"run_{workers}"
+            work_dir.mkdir()
+
+            start = time.perf_counter()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+                telemetry = run_stage(args.stage, export_dir, excel_path, workers, work_dir)
+            wall = time.perf_counter() - start
+            server.stop()
+
+            s = telemetry.summary()
+            row = {'workers': workers, 'wall_s': wall, 'rate_limited': server.stats['rate_limited'],
+                   'peak_in_flight': server.peak_in_flight, **s}
+            results.append(row)
+            print(f"{workers:>7} {wall:>8.2f} {s['calls']:>6} {server.stats['rate_limited']:>5} "
+                  f"{s['retries']:>7} {s['p50_s']:>6.2f} {s['p95_s']:>6.2f} {s['p99_s']:>6.2f} "
+                  f"{s['calls'] / wall if wall else 0:>8.1f} {s['cost']:>8.4f}")
+
+        os.environ.pop('ANTHROPIC_BASE_URL', None)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'stage': args.stage, 'latency': args.latency, 'rate_limit': args.rate_limit,
+                       'max_concurrent': args.max_concurrent, 'runs': results}, f, indent=2)
+        print(f"\n💾 Results: {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Anthropic Messages API')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_server_options(p):
+        p.add_argument('--latency', default='lognormal:0.5,0.4',
+                       help='fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (seconds)')
+        p.add_argument('--per-output-token', type=float, default=0.0,
+                       help='Extra seconds per output token')
+        p.add_argument('--rate-limit', type=float, default=0.0,
+                       help='Probability of answering with 429')
+        p.add_argument('--max-concurrent', type=int, default=None,
+                       help='Answer 429 above this many in-flight requests')
+        p.add_argument('--seed', type=int, default=0)
+
+    serve = sub.add_parser('serve', help='Run the stand-in server')
+    add_server_options(serve)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+
+    bench = sub.add_parser('bench', help='Benchmark a stage at several worker counts')
+    add_server_options(bench)
+    bench.add_argument('--stage', choices=['perfect_ai_etl', 'analyze_conversations'],
+                       default='perfect_ai_etl')
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    bench.add_argument('--clusters', type=int, default=20,
+                       help='Synthetic clusters per province')
+    bench.add_argument('--export', default=None,
+                       help='Real export directory instead of synthetic data (needs --excel)')
+    bench.add_argument('--excel', default='out_csv/excel_mosques_master.csv')
+    bench.add_argument('--output', default=None, help='Write results as JSON')
+    bench.add_argument('--verbose', action='store_true', help='Show stage output')
+
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args)
+        return
+
+    server = MockAnthropicServer(args.host, args.port,
+                                 LatencyModel(args.latency, args.per_output_token),
+                                 rate_limit=args.rate_limit, max_concurrent=args.max_concurrent,
+                                 seed=args.seed)
+    print(f"🧪 Mock Anthropic API on {server.base_url}")
+    print(f"   export ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+        print(f"Requests: {server.stats}")
+
+
+if __name__ == '__main__':
+    main()
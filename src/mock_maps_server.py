@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local Stand-in for Google Maps Short Links
+==========================================
+Lets extract_gps_coordinates.py be tested and benchmarked without the
+network.
+
+Any path is treated as a short-link code and answered with a redirect to
+`/place/@lat,lng,17z` (coordinates derived from the code, so every run
+agrees). Codes containing `nocoords` redirect to a page without
+coordinates, codes containing `missing` get 404. Latency and 503
+injection are configurable to exercise timeouts and retries.
+
+Usage:
+    python src/mock_maps_server.py serve --port 8766 --latency uniform:0.1,0.3 --error-rate 0.05
+    MAPS_SHORTLINK_BASE_URL=http://127.0.0.1:8766 python src/extract_gps_coordinates.py
+
+    # Resolve synthetic links at several worker counts
+    python src/mock_maps_server.py bench --links 300 --workers 1 8 16
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from mock_anthropic_server import LatencyModel
+
+
+def code_coordinates(code: str) -> Tuple[float, float]:
+    """Deterministic coordinates inside Syria for a short-link code."""
+    digest = hashlib.sha1(code.encode('utf-8')).digest()
+    lat = 32.5 + int.from_bytes(digest[:4], 'big') / 2 ** 32 * 4.5
+    lng = 35.8 + int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 6.0
+    return round(lat, 6), round(lng, 6)
+
+
+class MockMapsServer:
+    """Threaded HTTP server answering short-link requests with redirects."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: Optional[LatencyModel] = None, error_rate: float = 0.0,
+                 seed: int = 0):
+        """
+        Args:
+            port: 0 picks a free port (see `base_url`)
+            latency: Delay model per request (default: no delay)
+            error_rate: Probability of answering a request with 503
+            seed: Seed for latency and error sampling
+        """
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        self.stats = {'requests': 0, 'redirects': 0, 'pages': 0, 'errors': 0, 'not_found': 0}
+        self.codes_seen = {}  # code -> requests for it
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockMapsServer':
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def answer(self, path: str) -> Tuple[int, Optional[str], float]:
+        """Status, Location header and delay for one request."""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            delay = self.latency.sample(self.rng, 0)
+            failed = self.rng.random() < self.error_rate
+
+            if failed:
+                self.stats['errors'] += 1
+                return 503, None, delay
+            if path.startswith('/place/'):
+                self.stats['pages'] += 1
+                return 200, None, delay
+
+            code = path.strip('/')
+            self.codes_seen[code] = self.codes_seen.get(code, 0) + 1
+            if 'missing' in code:
+                self.stats['not_found'] += 1
+                return 404, None, delay
+            self.stats['redirects'] += 1
+            if 'nocoords' in code:
+                return 302, f"/place/search/{code}", delay
+            lat, lng = code_coordinates(code)
+            return 302, f"/place/@{lat},{lng},17z", delay
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, with_body: bool):
+                status, location, delay = server.answer(self.path.split('?')[0])
+                try:
+                    time.sleep(delay)
+                    body = b'' if location else f"status {status}".encode('utf-8')
+                    self.send_response(status)
+                    if location:
+                        self.send_header('Location', location)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    if with_body:
+                        self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def do_HEAD(self):
+                self._respond(with_body=False)
+
+            def do_GET(self):
+                self._respond(with_body=True)
+
+        return Handler
+
+
+def benchmark(args):
+    """Resolve the same synthetic links once per worker count."""
+    from link_resolver import ShortLinkResolver
+
+    links = [f"https://maps.app.goo.gl/bench{i:05d}" for i in range(args.links)]
+    links += links[:args.links // 4]  # Shared links must only be resolved once
+
+    print(f"🏁 Short-link benchmark: {args.links} unique links | latency {args.latency} | "
+          f"503 rate {args.error_rate:g}")
+    print(f"{'workers':>7} {'wall s':>8} {'requests':>8} {'503s':>5} {'resolved':>8} {'peak':>5}")
+    for workers in args.workers:
+        server = MockMapsServer(latency=LatencyModel(args.latency), error_rate=args.error_rate,
+                                seed=args.seed).start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resolver = ShortLinkResolver(max_workers=workers, base_url=server.base_url)
+        start = time.perf_counter()
+        results = resolver.resolve_all(links)
+        wall = time.perf_counter() - start
+        resolver.close()
+        server.stop()
+        resolved = sum(1 for _, status in results.values() if status == 'ok')
+        print(f"{workers:>7} {wall:>8.2f} {server.stats['requests']:>8} {server.stats['errors']:>5} "
+              f"{resolved:>8} {server.peak_in_flight:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for Google Maps short links')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_server_options(p):
+        p.add_argument('--latency', default='uniform:0.1,0.3',
+                       help='fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (seconds)')
+        p.add_argument('--error-rate', type=float, default=0.0,
+                       help='Probability of answering with 503')
+        p.add_argument('--seed', type=int, default=0)
+
+    serve = sub.add_parser('serve', help='Run the stand-in server')
+    add_server_options(serve)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8766)
+
+    bench = sub.add_parser('bench', help='Resolve synthetic links at several worker counts')
+    add_server_options(bench)
+    bench.add_argument('--links', type=int, default=300)
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, 8, 16])
+
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args)
+        return
+
+    server = MockMapsServer(args.host, args.port, LatencyModel(args.latency),
+                            error_rate=args.error_rate, seed=args.seed)
+    print(f"🧪 Mock short-link server on {server.base_url}")
+    print(f"   export MAPS_SHORTLINK_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+        print(f"Requests: {server.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Confidence-Based Model Tiering
+==============================
+Routes each AI request through a ladder of models, cheapest first.
+
+A request stays on the fast tier unless its answer is unparseable,
+low-confidence, or empty although the rule-based fast path found
+mosque-naming texts; only then is it
+escalated to the next (stronger, slower, pricier) model. Per-tier call
+counts, escalations and latency are recorded so the ladder can be tuned.
+
+The ladder can be overridden without code changes:
+    AI_MODEL_TIERS=claude-3-haiku-20240307,claude-3-5-sonnet-20241022
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Price per 1M tokens: (input, output). Cache writes cost 1.25x input,
+# cache reads 0.1x input.
+MODEL_PRICING = {
+    'claude-3-haiku-20240307': (0.25, 1.25),
+    'claude-3-5-haiku-20241022': (0.80, 4.00),
+    'claude-3-5-sonnet-20241022': (3.00, 15.00),
+}
+
+DEFAULT_TIERS = [
+    'claude-3-5-haiku-20241022',
+    'claude-3-5-sonnet-20241022',
+]
+
+# Words that mark a text message as naming a mosque
+MOSQUE_KEYWORDS = ('مسجد', 'جامع', 'مصلى')
+
+
+def tiers_from_env(default: List[str]) -> List[str]:
+    """Return the model ladder from AI_MODEL_TIERS, or the given default."""
+    configured = os.getenv('AI_MODEL_TIERS', '')
+    tiers = [m.strip() for m in configured.split(',') if m.strip()]
+    return tiers or list(default)
+
+
+def call_cost(model: str, usage) -> float:
+    """Compute the dollar cost of one call from its `response.usage`."""
+    input_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING['claude-3-5-sonnet-20241022'])
+    input_tokens = getattr(usage, 'input_tokens', 0) or 0
+    output_tokens = getattr(usage, 'output_tokens', 0) or 0
+    cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    return (
+        input_tokens * input_price
+        + cache_write * input_price * 1.25
+        + cache_read * input_price * 0.10
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+def count_mosque_texts(texts: List[str]) -> int:
+    """Rule-based fast path: how many text messages name a mosque."""
+    return sum(1 for text in texts if any(k in text for k in MOSQUE_KEYWORDS))
+
+
+def escalation_reason(mosques: List[Dict], expected_count: int) -> Optional[str]:
+    """
+    Decide whether an answer should go to a stronger model.
+
+    Keyword counts are only a soft signal: messages name mosques without
+    "مسجد" (bare names, neighbourhoods) and repeat one mosque across
+    several messages, so only an empty answer despite keyword texts counts
+    as disagreement.
+
+    Args:
+        mosques: Mosques returned by the model
+        expected_count: Mosque-naming texts found by the rule-based fast path
+
+    Returns:
+        A short reason string, or None if the answer is accepted
+    """
+    if expected_count > 0 and not mosques:
+        return 'disagrees_with_rules'
+    if any(str(m.get('confidence', '')).lower() == 'low' for m in mosques):
+        return 'low_confidence'
+    return None
+
+
+class TieredModelRouter:
+    """Try the cheapest model first and escalate only when needed."""
+
+    def __init__(self, tiers: Optional[List[str]] = None):
+        self.tiers = tiers_from_env(tiers or DEFAULT_TIERS)
+        self.tier_stats = {
+            model: {'calls': 0, 'finished': 0, 'escalated': 0, 'errors': 0, 'latency': 0.0}
+            for model in self.tiers
+        }
+        self.escalation_reasons = {}
+        self._lock = threading.Lock()  # route() may run from worker threads
+
+    def route(self, call: Callable[[str], Dict],
+              check: Callable[[Dict], Optional[str]]) -> Tuple[Dict, str]:
+        """
+        Run `call(model)` up the ladder until `check(result)` accepts it.
+
+        `call` must return the parsed result and raise on API or JSON
+        errors (treated as "unparseable"). The strongest tier's answer is
+        always accepted. If every tier fails, the last error is re-raised.
+
+        Returns:
+            (result, model that produced it)
+        """
+        best = None
+        last_error = None
+
+        for tier_idx, model in enumerate(self.tiers):
+            is_last = tier_idx == len(self.tiers) - 1
+
+            start = time.perf_counter()
+            failed = False
+            try:
+                result = call(model)
+                reason = None if is_last else check(result)
+            except Exception as e:
+                result = None
+                reason = 'unparseable'
+                last_error = e
+                failed = True
+            latency = time.perf_counter() - start
+
+            if result is not None:
+                best = (result, model)
+            accepted = reason is None and result is not None
+
+            with self._lock:
+                stats = self.tier_stats[model]
+                stats['calls'] += 1
+                stats['latency'] += latency
+                if failed:
+                    stats['errors'] += 1
+                if accepted:
+                    stats['finished'] += 1
+                elif not is_last:
+                    stats['escalated'] += 1
+                    self.escalation_reasons[reason] = self.escalation_reasons.get(reason, 0) + 1
+
+            if accepted:
+                return result, model
+
+        if best is not None:
+            return best
+        raise last_error
+
+    def print_summary(self):
+        """Print per-tier call counts, escalations and latency."""
+        print("\nModel tier usage:")
+        for model, stats in self.tier_stats.items():
+            avg = stats['latency'] / stats['calls'] if stats['calls'] else 0.0
+            print(f"  {model}: {stats['calls']} calls, {stats['finished']} finished here, "
+                  f"{stats['escalated']} escalated, {stats['errors']} errors, avg {avg:.2f}s")
+        if self.escalation_reasons:
+            reasons = ', '.join(f"{r}={n}" for r, n in sorted(self.escalation_reasons.items()))
+            print(f"  Escalation reasons: {reasons}")
@@ -16,6 +16,8 @@ from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 
+from maps_links import MapsRegistry, contains_maps_url
+
 # Fix Windows console encoding for emojis
 if sys.platform == 'win32':
     try:
@@ -44,6 +46,7 @@ class TelegramMosqueParser:
         self.locations = []
         self.excel_files = []
         self.message_index = []
+        self.maps = None  # MapsRegistry of the export
 
         print(f"📂 Initialized parser for: {self.export_path}")
 
@@ -97,12 +100,7 @@ class TelegramMosqueParser:
 
     def is_google_maps_link(self, text: str) -> bool:
         """Check if text contains a Google Maps link."""
-        maps_patterns = [
-            r'maps\.google\.com',
-            r'goo\.gl',
-            r'maps\.app\.goo\.gl'
-        ]
-        return any(re.search(pattern, text, re.IGNORECASE) for pattern in maps_patterns)
+        return contains_maps_url(text)
 
     def extract_mosque_name_area(self, text: str) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -128,6 +126,8 @@ class TelegramMosqueParser:
         Pattern: Photos -> Text (name+area) -> Maps link
         """
         mosques = []
+        if self.maps is None:
+            self.maps = MapsRegistry(messages)
         i = 0
 
         while i < len(messages):
@@ -173,11 +173,8 @@ class TelegramMosqueParser:
                 maps_link = None
                 if i + 1 < len(messages):
                     next_msg = messages[i + 1]
-                    next_text = self.extract_text_content(next_msg.get('text', ''))
-
-                    if (next_msg.get('reply_to_message_id') == topic_id and
-                        self.is_google_maps_link(next_text)):
-                        maps_link = next_text.strip()
+                    if next_msg.get('reply_to_message_id') == topic_id:
+                        maps_link = self.maps.first_url(next_msg.get('id'))
 
                 # Create mosque entry
                 mosque_entry = {
@@ -368,6 +365,8 @@ class TelegramMosqueParser:
         # Load data
         data = self.load_export()
         messages = data.get('messages', [])
+        self.maps = MapsRegistry(messages)
+        print(f"🗺️ Maps links: {len(self.maps)} unique")
 
         # Extract provinces (topics)
         print("\n1️⃣ Extracting provinces...")
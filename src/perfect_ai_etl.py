@@ -14,19 +14,96 @@ Author: Claude Code
 Date: October 25, 2025
 """
 
+import hashlib
+import itertools
 import json
 import pandas as pd
-import anthropic
 import os
-from pathlib import Path
-from typing import Dict, List, Tuple
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ai_telemetry import AITelemetry, create_client
+from arabic_text import add_normalized_columns, normalize_arabic, normalize_name
+from clustering import MessageIndex
+from edit_distance import batch_ratio, search_ratio
+from maps_links import MapsRegistry
+from model_router import MODEL_PRICING, TieredModelRouter, call_cost, count_mosque_texts, escalation_reason
+from prompt_cache import build_system, cache_usage
+
+
+# Static instructions sent as a cached system prefix on every cluster call
+CLUSTER_ANALYSIS_INSTRUCTIONS = """You are analyzing a Telegram conversation about mosque damage documentation in Syria.
+Each request gives the province name and the conversation messages; the Excel reference data for that province follows these instructions.
+
+YOUR TASK:
+Analyze this conversation completely and extract ALL mosques mentioned. For EACH mosque:
+
+1. **Name** - Extract the mosque name (Arabic)
+2. **Area** - Extract the area/neighborhood within the province
+3. **Photos** - Assign which photos belong to this mosque (use Message IDs or file names)
+4. **Videos** - Assign which videos belong to this mosque
+5. **Maps** - Extract Google Maps links for this mosque
+6. **Damage Type** - Infer: "damaged", "demolished", or "unknown" (from context or conversation tone)
+7. **Excel Match** - If this mosque appears in Excel reference, provide the Excel name
+8. **GPS Hint** - If text mentions location details (street, area descriptions)
+9. **Confidence** - Rate your extraction: "high", "medium", or "low"
+10. **Notes** - Any relevant context or ambiguity
+
+IMPORTANT RULES:
+- Photos/videos immediately after a mosque name usually belong to that mosque
+- If a maps link is in the same message as mosque name, they belong together
+- If multiple mosques share media, indicate it's "shared"
+- Use conversation flow and timing to decide assignments
+- Match with Excel based on name similarity (fuzzy matching)
+- Infer damage type from words like "مدمر" (demolished), "متضرر" (damaged)
+
+OUTPUT (JSON only):
+{
+  "mosques": [
+    {
+      "name": "مسجد ...",
+      "area": "...",
+      "photos": ["files/IMG_123.JPG", "files/IMG_124.JPG"],
+      "videos": [],
+      "maps_links": ["https://maps.app.goo.gl/..."],
+      "damage_type": "damaged",
+      "excel_match": "mosque name from Excel or null",
+      "gps_hint": "near ... street" or null,
+      "confidence": "high",
+      "notes": "..."
+    }
+  ],
+  "cluster_summary": "Brief description of what this cluster documents"
+}
+
+Respond with ONLY valid JSON, no other text."""
+
+# An Excel name counts as mentioned if some stretch of the cluster text is this close
+EXCEL_MENTION_THRESHOLD = 0.85
+# The AI's excel_match is snapped to the closest province Excel name at or above this
+EXCEL_MATCH_THRESHOLD = 0.85
+
+
+def round_robin(queues: List[List[Dict]]) -> Iterator[Dict]:
+    """Yield one item from each non-empty queue in turn, so no queue starves the others."""
+    iterators = [iter(q) for q in queues]
+    while iterators:
+        for it in list(iterators):
+            item = next(it, None)
+            if item is None:
+                iterators.remove(it)
+            else:
+                yield item
 
 
 class PerfectAIETL:
     """Complete AI-based data extraction and organization"""
 
-    def __init__(self, telegram_export_path: str, excel_csv_path: str):
+    def __init__(self, telegram_export_path: str, excel_csv_path: str, max_workers: int = 4,
+                 state_path: str = 'out_csv/perfect_ai_state.json'):
         self.telegram_export_path = Path(telegram_export_path)
         self.excel_csv_path = Path(excel_csv_path)
 
@@ -35,7 +112,13 @@ class PerfectAIETL:
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment")
 
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        # Concurrency replaces fixed sleeps; the SDK backs off on 429s
+        self.client = create_client(self.api_key, max_retries=5)
+        self.max_workers = max_workers
+        self.telemetry = AITelemetry('perfect_ai_etl')
+
+        # Haiku first, escalate to Sonnet only for doubtful clusters
+        self.router = TieredModelRouter()
 
         # Load Telegram data
         print("Loading Telegram export...")
@@ -44,16 +127,27 @@ class PerfectAIETL:
 
         self.messages = telegram_data['messages']
         self.messages_dict = {msg['id']: msg for msg in self.messages}
+        self.maps = MapsRegistry(self.messages)
+        self.message_index = MessageIndex(self.messages)
+        self._topic_clusters = None  # topic_id -> clusters, built on first use
 
         # Load Excel data
         print("Loading Excel master list...")
         self.excel_df = pd.read_csv(excel_csv_path, encoding='utf-8')
+        add_normalized_columns(self.excel_df, {'province': 'province_norm', 'mosque_name': 'name_norm'})
 
         print(f"Loaded {len(self.messages)} Telegram messages")
         print(f"Loaded {len(self.excel_df)} Excel mosque records")
 
         self.total_cost = 0
         self.api_calls = 0
+        self.cache_write_tokens = 0
+        self.cache_read_tokens = 0
+        self._stats_lock = threading.Lock()  # Clusters run in worker threads
+
+        # Resume state: finished clusters survive a stopped or crashed run
+        self.state_path = Path(state_path)
+        self.state = self.load_state()
 
     def extract_topics(self) -> Dict[int, str]:
         """Extract province topics from Telegram"""
@@ -73,49 +167,21 @@ class PerfectAIETL:
         """
         Group messages into conversation clusters based on time proximity.
 
+        All topics are clustered in one vectorized pass on first use; later
+        calls are dictionary lookups.
+
         Returns list of message ID groups (clusters).
         """
-        # Get all messages for this topic
-        topic_messages = [
-            msg for msg in self.messages
-            if msg.get('reply_to_message_id') == topic_id
-        ]
-
-        # Sort by ID (chronological)
-        topic_messages.sort(key=lambda x: x['id'])
-
-        clusters = []
-        current_cluster = []
-        last_timestamp = None
-
-        for msg in topic_messages:
-            msg_id = msg['id']
-            timestamp = msg.get('date')
-
-            if not timestamp:
-                continue
-
-            # Parse timestamp
-            from datetime import datetime
-            try:
-                current_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            except:
-                continue
-
+        if self._topic_clusters is None:
+            self._topic_clusters = {}
             # If more than 30 minutes gap, start new cluster
-            if last_timestamp and (current_time - last_timestamp).total_seconds() > 1800:
-                if current_cluster:
-                    clusters.append(current_cluster)
-                current_cluster = []
-
-            current_cluster.append(msg_id)
-            last_timestamp = current_time
-
-        # Add last cluster
-        if current_cluster:
-            clusters.append(current_cluster)
+            for rows in self.message_index.clusters(max_time_gap=1800):
+                topic = int(self.message_index.topics[rows[0]])
+                self._topic_clusters.setdefault(topic, []).append(
+                    self.message_index.ids[rows].tolist()
+                )
 
-        return clusters
+        return self._topic_clusters.get(topic_id, [])
 
     def _extract_text(self, text_obj) -> str:
         """Extract text from Telegram text object"""
@@ -157,13 +223,29 @@ class PerfectAIETL:
             if 'text' in msg and msg['text']:
                 text = self._extract_text(msg['text'])
                 if text.strip():
-                    if 'maps.app.goo.gl' in text or 'google.com/maps' in text:
+                    if self.maps.has_maps(msg_id):
                         lines.append(f"[{time_str}] ID {msg_id}: TEXT WITH MAPS LINK = {text[:200]}")
                     else:
                         lines.append(f"[{time_str}] ID {msg_id}: TEXT = {text[:200]}")
 
         return '\n'.join(lines)
 
+    def cluster_texts(self, msg_ids: List[int]) -> List[str]:
+        """Return the non-empty text messages of a cluster"""
+        texts = []
+        for msg_id in msg_ids:
+            msg = self.messages_dict.get(msg_id)
+            if msg and msg.get('text'):
+                text = self._extract_text(msg['text']).strip()
+                if text:
+                    texts.append(text)
+        return texts
+
+    def build_excel_reference(self, excel_mosques_in_province: List[Dict]) -> str:
+        """Format the province's Excel mosques as prompt reference lines"""
+        return '\n'.join([f"- {m['mosque_name']} ({m['area']}) - {m['damage_type']}"
+                          for m in excel_mosques_in_province])
+
     def analyze_cluster_completely(self, cluster_msgs: List[int], province: str,
                                    excel_mosques_in_province: List[Dict]) -> Dict:
         """
@@ -176,75 +258,37 @@ class PerfectAIETL:
         context = self.build_cluster_context(cluster_msgs)
 
         # Prepare Excel reference (for matching)
-        excel_names = [m['mosque_name'] for m in excel_mosques_in_province]
-        excel_ref = '\n'.join([f"- {name} ({m['area']}) - {m['damage_type']}"
-                               for m, name in zip(excel_mosques_in_province, excel_names)])
+        excel_ref = self.build_excel_reference(excel_mosques_in_province)
 
-        prompt = f"""You are analyzing a Telegram conversation about mosque damage documentation in {province}, Syria.
+        # Static instructions + per-province Excel reference form the cached
+        # prefix; only the conversation itself changes from call to call
+        system = build_system(
+            CLUSTER_ANALYSIS_INSTRUCTIONS,
+            f"EXCEL REFERENCE DATA (mosques documented in Excel for {province}):\n{excel_ref}"
+        )
 
-CONVERSATION MESSAGES (chronological):
-{context}
+        prompt = f"""PROVINCE: {province}
 
-EXCEL REFERENCE DATA (mosques documented in Excel for this province):
-{excel_ref}
-
-YOUR TASK:
-Analyze this conversation completely and extract ALL mosques mentioned. For EACH mosque:
-
-1. **Name** - Extract the mosque name (Arabic)
-2. **Area** - Extract the area/neighborhood within {province}
-3. **Photos** - Assign which photos belong to this mosque (use Message IDs or file names)
-4. **Videos** - Assign which videos belong to this mosque
-5. **Maps** - Extract Google Maps links for this mosque
-6. **Damage Type** - Infer: "damaged", "demolished", or "unknown" (from context or conversation tone)
-7. **Excel Match** - If this mosque appears in Excel reference, provide the Excel name
-8. **GPS Hint** - If text mentions location details (street, area descriptions)
-9. **Confidence** - Rate your extraction: "high", "medium", or "low"
-10. **Notes** - Any relevant context or ambiguity
-
-IMPORTANT RULES:
-- Photos/videos immediately after a mosque name usually belong to that mosque
-- If a maps link is in the same message as mosque name, they belong together
-- If multiple mosques share media, indicate it's "shared"
-- Use conversation flow and timing to decide assignments
-- Match with Excel based on name similarity (fuzzy matching)
-- Infer damage type from words like "مدمر" (demolished), "متضرر" (damaged)
-
-OUTPUT (JSON only):
-{{
-  "mosques": [
-    {{
-      "name": "مسجد ...",
-      "area": "...",
-      "photos": ["files/IMG_123.JPG", "files/IMG_124.JPG"],
-      "videos": [],
-      "maps_links": ["https://maps.app.goo.gl/..."],
-      "damage_type": "damaged",
-      "excel_match": "mosque name from Excel or null",
-      "gps_hint": "near ... street" or null,
-      "confidence": "high",
-      "notes": "..."
-    }}
-  ],
-  "cluster_summary": "Brief description of what this cluster documents"
-}}
-
-Respond with ONLY valid JSON, no other text."""
+CONVERSATION MESSAGES (chronological):
+{context}"""
 
-        try:
-            self.api_calls += 1
-            message = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",  # Using Sonnet for better quality
+        def call(model: str) -> Dict:
+            message = self.telemetry.create(
+                self.client,
+                model=model,
                 max_tokens=4000,
                 temperature=0,
+                system=system,
                 messages=[{"role": "user", "content": prompt}]
             )
 
-            # Calculate cost (Sonnet: $3 per 1M input, $15 per 1M output)
-            input_tokens = message.usage.input_tokens
-            output_tokens = message.usage.output_tokens
-            cost = (input_tokens * 3.0 / 1_000_000) + (output_tokens * 15.0 / 1_000_000)
-            self.total_cost += cost
+            # Calculate cost (per-model pricing, including cache reads/writes)
+            usage = cache_usage(message)
+            with self._stats_lock:
+                self.api_calls += 1
+                self.cache_write_tokens += usage['cache_write_tokens']
+                self.cache_read_tokens += usage['cache_read_tokens']
+                self.total_cost += call_cost(model, message.usage)
 
             # Parse JSON response
             response_text = message.content[0].text
@@ -255,38 +299,171 @@ Respond with ONLY valid JSON, no other text."""
             elif '```' in response_text:
                 response_text = response_text.split('```')[1].split('```')[0]
 
-            result = json.loads(response_text.strip())
+            try:
+                return json.loads(response_text.strip())
+            except json.JSONDecodeError:
+                self.telemetry.mark_outcome(message, 'unparseable')
+                raise
+
+        # Rule-based fast path: mosque-naming texts in this cluster
+        expected_count = count_mosque_texts(self.cluster_texts(cluster_msgs))
+
+        try:
+            result, model = self.router.route(
+                call,
+                lambda r: escalation_reason(r.get('mosques', []), expected_count)
+            )
+            result['ai_model'] = model
             return result
 
         except Exception as e:
             print(f"  ERROR analyzing cluster: {str(e)}")
             return {
                 "mosques": [],
-                "cluster_summary": f"Error: {str(e)}"
+                "cluster_summary": f"Error: {str(e)}",
+                "error": True
             }
 
-    def process_all_data(self) -> pd.DataFrame:
+    def analyze_job(self, job: Dict) -> Dict:
+        """Analyze one scheduled cluster."""
+        return self.analyze_cluster_completely(job['msgs'], job['province'], job['excel'])
+
+    def run_jobs(self, jobs: Iterator[Dict],
+                 should_stop: Callable[[], bool] = lambda: False) -> Iterator[Tuple[Dict, Dict]]:
         """
-        Complete processing of all Telegram data with AI analysis.
+        Run cluster jobs on a bounded worker pool, yielding (job, result) as they finish.
 
-        Returns: Comprehensive mosque dataset
+        At most `max_workers` requests are in flight; a new job is pulled
+        from `jobs` only when one completes, so the (round-robin) order of
+        the iterator is the order work starts in. Once `should_stop()` is
+        true no new jobs start, but in-flight ones are allowed to finish.
         """
-        # Extract topics
-        topics = self.extract_topics()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = {}
+            for job in itertools.islice(jobs, self.max_workers):
+                in_flight[pool.submit(self.analyze_job, job)] = job
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    yield job, future.result()
+
+                    next_job = None if should_stop() else next(jobs, None)
+                    if next_job is not None:
+                        in_flight[pool.submit(self.analyze_job, next_job)] = next_job
+
+    def build_mosque_records(self, job: Dict, result: Dict) -> List[Dict]:
+        """Flatten an AI cluster result into output rows."""
+        records = []
+        for mosque_data in result.get('mosques', []):
+            records.append({
+                'cluster_id': job['cluster_id'],
+                'province': job['province'],
+                'name': mosque_data.get('name', ''),
+                'area': mosque_data.get('area', ''),
+                'damage_type': mosque_data.get('damage_type', 'unknown'),
+                'confidence': mosque_data.get('confidence', 'medium'),
+
+                # Media
+                'photo_files': '; '.join(mosque_data.get('photos', [])) if mosque_data.get('photos') else None,
+                'photo_count': len(mosque_data.get('photos', [])),
+                'video_files': '; '.join(mosque_data.get('videos', [])) if mosque_data.get('videos') else None,
+                'maps_urls': '; '.join(mosque_data.get('maps_links', [])) if mosque_data.get('maps_links') else None,
+
+                # Matching & metadata
+                'excel_match': self.snap_excel_match(mosque_data.get('excel_match'), job['excel']),
+                'gps_hint': mosque_data.get('gps_hint'),
+                'notes': mosque_data.get('notes', ''),
+
+                # Source
+                'message_ids': '; '.join(map(str, job['msgs'])),
+                'cluster_summary': result.get('cluster_summary', ''),
+                'ai_model': result.get('ai_model'),
+                'extraction_method': 'ai_complete_analysis'
+            })
+        return records
+
+    @staticmethod
+    def snap_excel_match(excel_match: Optional[str], excel_mosques: List[Dict]) -> Optional[str]:
+        """
+        The province Excel name the AI's `excel_match` refers to.
 
-        all_mosques = []
-        cluster_counter = 0
+        The AI may return the name re-spelled or one that is not in the list
+        at all; the closest Excel name (Levenshtein on normalized names) is
+        used, and the match is dropped below EXCEL_MATCH_THRESHOLD.
+        """
+        query = normalize_name(excel_match) if isinstance(excel_match, str) else ''
+        if not query or not excel_mosques:
+            return None
+        scores = batch_ratio(query, [m.get('name_norm', '') for m in excel_mosques], EXCEL_MATCH_THRESHOLD)
+        best = int(scores.argmax())
+        return str(excel_mosques[best]['mosque_name']) if scores[best] > 0 else None
+
+    def cluster_value(self, msg_ids: List[int], excel_mosques: List[Dict],
+                      matched_excel: set) -> int:
+        """
+        Score how much a cluster is worth analyzing early.
 
-        print("\n" + "=" * 60)
-        print("PROCESSING ALL TELEGRAM DATA WITH AI")
-        print("=" * 60)
+        Clusters that mention Excel mosques not yet matched by any finished
+        cluster count most, then the number of photos they carry.
+        """
+        text = normalize_arabic('\n'.join(self.cluster_texts(msg_ids)))
+        cores = [m.get('name_norm', '') for m in excel_mosques
+                 if str(m.get('mosque_name', '')) not in matched_excel]
+        # Fuzzy occurrence, so misspelled mentions count too
+        unmatched_hits = int((search_ratio(cores, text, EXCEL_MENTION_THRESHOLD) > 0).sum())
 
+        photos = 0
+        for msg_id in msg_ids:
+            file_path = str(self.messages_dict.get(msg_id, {}).get('file') or '').lower()
+            if file_path.endswith(('.jpg', '.jpeg', '.png')):
+                photos += 1
+
+        return unmatched_hits * 10 + photos
+
+    def cluster_key(self, province: str, msg_ids: List[int]) -> str:
+        """Stable key for a cluster across runs (used by the resume state)"""
+        return hashlib.sha1(f"{province}|{','.join(map(str, msg_ids))}".encode('utf-8')).hexdigest()
+
+    def load_state(self) -> Dict:
+        """Load finished clusters from an earlier (possibly interrupted) run"""
+        if self.state_path.exists():
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'completed': {}, 'total_cost': 0.0}
+
+    def save_state(self):
+        """Persist finished clusters so a stopped run can resume (written atomically)"""
+        tmp_path = self.state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        tmp_path.replace(self.state_path)
+
+    def plan_jobs(self) -> List[List[Dict]]:
+        """
+        Build one work queue per province, highest-value clusters first.
+
+        Cluster ids follow topic order; clusters already finished in the
+        resume state are marked `done` and are not sent to the AI again.
+        """
+        topics = self.extract_topics()
+
+        matched_excel = {
+            mosque.get('excel_match')
+            for entry in self.state['completed'].values()
+            for mosque in entry['result'].get('mosques', [])
+            if mosque.get('excel_match')
+        }
+
+        queues = []
+        cluster_counter = 0
         for topic_id, province in topics.items():
-            print(f"\n📍 Processing province: {province}")
+            print(f"\n📍 Province: {province}")
 
             # Get Excel mosques for this province
             excel_province_mosques = self.excel_df[
-                self.excel_df['province'].str.contains(province, na=False, case=False)
+                self.excel_df['province_norm'].str.contains(normalize_arabic(province), regex=False)
             ].to_dict('records')
 
             print(f"   Excel reference: {len(excel_province_mosques)} mosques")
@@ -295,51 +472,132 @@ Respond with ONLY valid JSON, no other text."""
             clusters = self.cluster_messages_by_timeframe(topic_id)
             print(f"   Conversation clusters: {len(clusters)}")
 
-            # Analyze each cluster
+            queue = []
             for i, cluster_msgs in enumerate(clusters, 1):
-                print(f"   Analyzing cluster {i}/{len(clusters)}...", end=' ')
-
                 cluster_counter += 1
-                result = self.analyze_cluster_completely(
-                    cluster_msgs,
-                    province,
-                    excel_province_mosques
-                )
+                key = self.cluster_key(province, cluster_msgs)
+                queue.append({
+                    'cluster_id': cluster_counter,
+                    'key': key,
+                    'province': province,
+                    'index': i,
+                    'of': len(clusters),
+                    'msgs': cluster_msgs,
+                    'excel': excel_province_mosques,
+                    'done': key in self.state['completed'],
+                    'value': self.cluster_value(cluster_msgs, excel_province_mosques, matched_excel)
+                })
+
+            queue.sort(key=lambda job: -job['value'])
+            queues.append(queue)
+
+        # Provinces whose best cluster is most valuable go first in each round
+        queues.sort(key=lambda q: -q[0]['value'] if q else 0)
+        return queues
+
+    def estimate_run(self, queues: List[List[Dict]]) -> Dict:
+        """
+        Estimate cost and time of the pending clusters from their real prompt sizes.
+
+        Input tokens are estimated from prompt length; output tokens from
+        the number of mosque-naming texts in each cluster.
+        """
+        chars_per_token = 3
+        pending = [job for q in queues for job in q if not job['done']]
+
+        input_tokens = 0
+        output_tokens = 0
+        for job in pending:
+            prompt_chars = (len(CLUSTER_ANALYSIS_INSTRUCTIONS)
+                            + len(self.build_excel_reference(job['excel']))
+                            + len(self.build_cluster_context(job['msgs'])))
+            input_tokens += prompt_chars // chars_per_token
+            output_tokens += 100 + 150 * count_mosque_texts(self.cluster_texts(job['msgs']))
+
+        def tier_cost(model: str) -> float:
+            input_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING['claude-3-5-sonnet-20241022'])
+            return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+        # ~2s request overhead plus ~50 output tokens/s, spread over the workers
+        seconds = (len(pending) * 2 + output_tokens / 50) / self.max_workers
+
+        return {
+            'clusters': sum(len(q) for q in queues),
+            'pending': len(pending),
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cost_fast': tier_cost(self.router.tiers[0]),
+            'cost_all_escalated': sum(tier_cost(m) for m in self.router.tiers),
+            'minutes': seconds / 60
+        }
+
+    def process_all_data(self, queues: Optional[List[List[Dict]]] = None,
+                         max_cost: Optional[float] = None,
+                         max_minutes: Optional[float] = None) -> pd.DataFrame:
+        """
+        Complete processing of all Telegram data with AI analysis.
 
-                # Process results
-                for mosque_data in result.get('mosques', []):
-                    mosque_record = {
-                        'cluster_id': cluster_counter,
-                        'province': province,
-                        'name': mosque_data.get('name', ''),
-                        'area': mosque_data.get('area', ''),
-                        'damage_type': mosque_data.get('damage_type', 'unknown'),
-                        'confidence': mosque_data.get('confidence', 'medium'),
-
-                        # Media
-                        'photo_files': '; '.join(mosque_data.get('photos', [])) if mosque_data.get('photos') else None,
-                        'photo_count': len(mosque_data.get('photos', [])),
-                        'video_files': '; '.join(mosque_data.get('videos', [])) if mosque_data.get('videos') else None,
-                        'maps_urls': '; '.join(mosque_data.get('maps_links', [])) if mosque_data.get('maps_links') else None,
-
-                        # Matching & metadata
-                        'excel_match': mosque_data.get('excel_match'),
-                        'gps_hint': mosque_data.get('gps_hint'),
-                        'notes': mosque_data.get('notes', ''),
-
-                        # Source
-                        'message_ids': '; '.join(map(str, cluster_msgs)),
-                        'cluster_summary': result.get('cluster_summary', ''),
-                        'ai_model': 'claude-3.5-sonnet',
-                        'extraction_method': 'ai_complete_analysis'
-                    }
-
-                    all_mosques.append(mosque_record)
-
-                print(f"✓ Found {len(result.get('mosques', []))} mosques | Cost: ${self.total_cost:.3f}")
-
-                # Rate limiting
-                time.sleep(1)
+        Args:
+            queues: Work plan from plan_jobs() (built if not given)
+            max_cost: Stop starting new clusters once this run has spent this many dollars
+            max_minutes: Stop starting new clusters after this many minutes
+
+        Finished clusters are saved to the resume state as they complete;
+        rerunning after a stop picks up where this run left off.
+
+        Returns: Comprehensive mosque dataset
+        """
+        print("\n" + "=" * 60)
+        print("PROCESSING ALL TELEGRAM DATA WITH AI")
+        print("=" * 60)
+
+        if queues is None:
+            queues = self.plan_jobs()
+
+        all_mosques = []
+        cluster_counter = sum(len(q) for q in queues)
+
+        # Reuse clusters finished by an earlier run
+        resumed = 0
+        for job in (job for q in queues for job in q if job['done']):
+            all_mosques.extend(self.build_mosque_records(job, self.state['completed'][job['key']]['result']))
+            resumed += 1
+
+        pending = [[job for job in q if not job['done']] for q in queues]
+        pending_count = sum(len(q) for q in pending)
+
+        previous_cost = self.state.get('total_cost', 0.0)
+        start_time = time.monotonic()
+        stop_reason = None
+
+        def should_stop() -> bool:
+            nonlocal stop_reason
+            if max_cost is not None and self.total_cost >= max_cost:
+                stop_reason = f"cost cap ${max_cost:.2f} reached"
+            elif max_minutes is not None and time.monotonic() - start_time >= max_minutes * 60:
+                stop_reason = f"time cap {max_minutes:g} min reached"
+            return stop_reason is not None
+
+        print(f"\n🚀 Analyzing {pending_count} clusters across {len(queues)} provinces "
+              f"({self.max_workers} concurrent requests, {resumed} resumed from {self.state_path})...")
+
+        done = 0
+        for job, result in self.run_jobs(round_robin(pending), should_stop):
+            all_mosques.extend(self.build_mosque_records(job, result))
+            done += 1
+            if not result.get('error'):
+                self.state['completed'][job['key']] = {'cluster_id': job['cluster_id'], 'result': result}
+            self.state['total_cost'] = previous_cost + self.total_cost
+            self.save_state()
+            print(f"   [{done}/{pending_count}] {job['province']} cluster {job['index']}/{job['of']}: "
+                  f"✓ Found {len(result.get('mosques', []))} mosques | Cost: ${self.total_cost:.3f}")
+
+        if stop_reason:
+            print(f"\n⏸ Stopped early: {stop_reason}. {pending_count - done} clusters left; "
+                  f"rerun to resume from {self.state_path}")
+
+        # Completion order is nondeterministic; restore cluster order
+        all_mosques.sort(key=lambda r: r['cluster_id'])
 
         # Create DataFrame
         result_df = pd.DataFrame(all_mosques)
@@ -347,10 +605,13 @@ Respond with ONLY valid JSON, no other text."""
         print("\n" + "=" * 60)
         print("PROCESSING COMPLETE")
         print("=" * 60)
-        print(f"Total clusters analyzed: {cluster_counter}")
+        print(f"Total clusters: {cluster_counter} ({resumed} resumed, {done} analyzed this run)")
         print(f"Total mosques extracted: {len(result_df)}")
         print(f"Total API calls: {self.api_calls}")
-        print(f"Total cost: ${self.total_cost:.2f}")
+        print(f"Total cost: ${self.total_cost:.2f} (all runs: ${self.state.get('total_cost', 0.0):.2f})")
+        print(f"Cache hit tokens: {self.cache_read_tokens:,} (written: {self.cache_write_tokens:,})")
+        self.router.print_summary()
+        self.telemetry.report()
         print()
         print("Quality metrics:")
         print(f"  With photos: {result_df['photo_count'].gt(0).sum()} ({result_df['photo_count'].gt(0).sum()/len(result_df)*100:.1f}%)")
@@ -363,6 +624,21 @@ Respond with ONLY valid JSON, no other text."""
 
 def main():
     """Main execution"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Complete AI-based analysis of the Telegram export')
+    parser.add_argument('--yes', '--headless', dest='yes', action='store_true',
+                        help='Run without the confirmation prompt')
+    parser.add_argument('--max-cost', type=float, default=None,
+                        help='Stop starting new clusters after spending this many dollars')
+    parser.add_argument('--max-minutes', type=float, default=None,
+                        help='Stop starting new clusters after this many minutes')
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help='Concurrent API requests')
+    parser.add_argument('--state-file', default='out_csv/perfect_ai_state.json',
+                        help='Resume state (delete to start from scratch)')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("PERFECT AI-BASED ETL PIPELINE")
     print("Complete data reconstruction from scratch")
@@ -381,15 +657,26 @@ def main():
         return
 
     # Initialize
-    etl = PerfectAIETL(telegram_export, excel_csv)
-
-    # Estimate cost
-    num_topics = len(etl.extract_topics())
-    estimated_clusters = num_topics * 30  # rough estimate
-    estimated_cost = estimated_clusters * 0.15  # ~$0.15 per cluster with Sonnet
-
-    print(f"\nEstimated cost: ${estimated_cost:.2f}")
-    print(f"Estimated time: {estimated_clusters * 1.5 / 60:.0f} minutes")
+    etl = PerfectAIETL(telegram_export, excel_csv, max_workers=args.max_workers,
+                       state_path=args.state_file)
+
+    # Estimate cost from the real cluster plan and prompt sizes
+    queues = etl.plan_jobs()
+    estimate = etl.estimate_run(queues)
+
+    print(f"\nClusters: {estimate['clusters']} ({estimate['pending']} pending, "
+          f"{estimate['clusters'] - estimate['pending']} already done)")
+    print(f"Estimated tokens: ~{estimate['input_tokens']:,} input / ~{estimate['output_tokens']:,} output")
+    print(f"Estimated cost: ${estimate['cost_fast']:.2f} on the fast tier "
+          f"(up to ${estimate['cost_all_escalated']:.2f} if every cluster escalates)")
+    print(f"Estimated time: {estimate['minutes']:.0f} minutes")
+    if args.max_cost is not None or args.max_minutes is not None:
+        caps = []
+        if args.max_cost is not None:
+            caps.append(f"${args.max_cost:.2f}")
+        if args.max_minutes is not None:
+            caps.append(f"{args.max_minutes:g} min")
+        print(f"Caps: {', '.join(caps)} (run stops gracefully and can be resumed)")
     print()
     print("This will:")
     print("  ✓ Analyze ALL conversations from scratch")
@@ -401,14 +688,15 @@ def main():
     print("  ✓ No duplicates, no ambiguity")
     print()
 
-    response = input("Proceed with complete AI analysis? (yes/no): ")
-    if response.lower() != 'yes':
-        print("Cancelled.")
-        return
+    if not args.yes:
+        response = input("Proceed with complete AI analysis? (yes/no): ")
+        if response.lower() != 'yes':
+            print("Cancelled.")
+            return
 
     # Run complete ETL
     print("\nStarting complete AI-based analysis...\n")
-    result_df = etl.process_all_data()
+    result_df = etl.process_all_data(queues, max_cost=args.max_cost, max_minutes=args.max_minutes)
 
     # Save
     print(f"\nSaving to {output_csv}...")
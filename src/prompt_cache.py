@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt Caching Helpers
+======================
+Shared helpers for splitting AI prompts into a static, cacheable system
+prefix and a small per-call user suffix.
+
+Blocks built here carry Anthropic's `cache_control` marker, so repeated
+calls with the same prefix are served from the prompt cache (cheaper input
+tokens, faster time-to-first-token). Prefixes shorter than the model's
+minimum cacheable length are simply sent uncached by the API.
+"""
+
+from typing import Dict, List
+
+
+def cached_block(text: str) -> Dict:
+    """Wrap static prompt text in a system block marked for caching."""
+    return {
+        "type": "text",
+        "text": text,
+        "cache_control": {"type": "ephemeral"}
+    }
+
+
+def build_system(*static_parts: str) -> List[Dict]:
+    """
+    Build a cacheable system prompt from one or more static parts.
+
+    Parts should be ordered from most to least shared (e.g. global
+    instructions first, then per-province reference data) so that a change
+    in a later part still reuses the cache for the earlier ones.
+    """
+    return [cached_block(part) for part in static_parts if part]
+
+
+def cache_usage(response) -> Dict[str, int]:
+    """Read prompt-cache token counts from an API response."""
+    usage = getattr(response, 'usage', None)
+    return {
+        'cache_write_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+        'cache_read_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0
+    }
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Character-Trigram Inverted Index
+================================
+Candidate generation for fuzzy name matching.
+
+Instead of scoring a query against every record, the index looks up the
+records sharing the most character trigrams with it and returns only the
+top few; the expensive exact similarity is then computed for those alone.
+
+    index = TrigramIndex(normalized_names)
+    rows, overlap = index.search('النور الكبير', limit=20)
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def trigrams(text: str) -> List[str]:
+    """Distinct character trigrams of a string padded with spaces at both ends."""
+    if not text:
+        return []
+    padded = f"  {text} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+class TrigramIndex:
+    """Inverted index: trigram -> row positions of the texts containing it."""
+
+    def __init__(self, texts: Sequence[str]):
+        postings: Dict[str, List[int]] = {}
+        sizes = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            grams = trigrams(text)
+            sizes[row] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+
+        self.postings = {gram: np.asarray(rows, dtype=np.int64) for gram, rows in postings.items()}
+        self.sizes = sizes
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def overlap(self, query: str) -> np.ndarray:
+        """Dice coefficient of trigram sets between the query and every row."""
+        grams = trigrams(query)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return np.zeros(len(self.sizes))
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        return 2.0 * shared / np.maximum(self.sizes + len(grams), 1)
+
+    def search(self, query: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows with the highest trigram overlap (rows sharing none are skipped).
+
+        Returns:
+            (rows, overlap) sorted by descending overlap
+        """
+        scores = self.overlap(query)
+        return top_candidates(scores, limit)
+
+
+def top_candidates(scores: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The `limit` best rows by score (zero scores dropped), best first."""
+    rows = np.flatnonzero(scores > 0)
+    if len(rows) > limit:
+        rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+    rows = rows[np.argsort(-scores[rows], kind='stable')]
+    return rows, scores[rows]
+
+
+def combined_overlap(indexes: Iterable[Tuple['TrigramIndex', str, float]]) -> np.ndarray:
+    """Weighted sum of trigram overlaps from several indexes over the same rows."""
+    total = None
+    for index, query, weight in indexes:
+        scores = index.overlap(query) * weight
+        total = scores if total is None else total + scores
+    return total
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from geo_dedup import geo_duplicates, load_coordinates, load_message_clusters
+from merge_data import MosqueMerger
+
+# Two mosques documented in one conversation cluster, 150 m apart
+LAT, LNG = 36.2000, 37.1500
+LAT_NEAR = LAT + 150 / 111_320
+
+
+def write_gps(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def cluster_rows():
+    ids = '101; 102; 103; 104'
+    return [
+        {'name': 'مسجد الرحمن', 'cluster_id': 7, 'message_ids': ids,
+         'maps_urls': 'https://maps.app.goo.gl/a', 'latitude': LAT, 'longitude': LNG},
+        {'name': 'مسجد الرحمه', 'cluster_id': 7, 'message_ids': ids,
+         'maps_urls': 'https://maps.app.goo.gl/a', 'latitude': LAT, 'longitude': LNG},
+        {'name': 'مسجد النور', 'cluster_id': 8, 'message_ids': '201; 202',
+         'maps_urls': 'https://maps.app.goo.gl/b', 'latitude': 35.0, 'longitude': 36.0},
+    ]
+
+
+def test_cluster_wide_ids_give_no_coordinates(tmp_path):
+    gps = tmp_path / 'mosques_with_gps.csv'
+    write_gps(gps, cluster_rows())
+
+    coordinates = load_coordinates(gps)
+    assert 101 not in coordinates  # Two mosques share these ids
+    assert coordinates[201] == (35.0, 36.0)  # Single-mosque cluster
+    assert load_message_clusters(gps)[102] == load_message_clusters(gps)[104]
+
+
+def test_same_cluster_records_are_never_paired():
+    names = ['الرحمن', 'الرحمه']
+    lat, lng = np.array([LAT, LAT_NEAR]), np.array([LNG, LNG])
+
+    assert geo_duplicates(names, lat, lng)  # Close enough to merge on their own
+    assert geo_duplicates(names, lat, lng, clusters=np.array([3, 3])) == []
+    assert geo_duplicates(names, lat, lng, clusters=np.array([-1, -1]))
+
+
+def test_nearby_mosques_of_one_cluster_stay_separate(tmp_path):
+    write_gps(tmp_path / 'mosques_with_gps.csv', cluster_rows())
+    merger = MosqueMerger(tmp_path / 'excel.csv', tmp_path / 'ai.csv', output_dir=str(tmp_path))
+    merger.ai_df = pd.DataFrame({'source_message_id': [101, 103], 'latitude': [LAT, LAT_NEAR],
+                                 'longitude': [LNG, LNG]})
+    merger.merged_df = pd.DataFrame({
+        'mosque_id': ['AI_0001', 'AI_0002'],
+        'mosque_name': ['مسجد الرحمن', 'مسجد الرحمه'],
+        'source': ['ai', 'ai'],
+        'telegram_msg_id': [101, 103],
+        'area': ['', ''],
+        'damage_type': ['unknown', 'unknown'],
+        'merge_notes': ['', ''],
+    })
+
+    merger.geo_dedup()
+
+    assert merger.geo_merges == 0
+    assert len(merger.merged_df) == 2
@@ -0,0 +1,22 @@
+from model_router import count_mosque_texts, escalation_reason
+
+
+def test_bare_name_without_keyword_is_accepted():
+    texts = ['قصف الرحمن في حي النور']
+    mosques = [{'name': 'الرحمن', 'confidence': 'high'}]
+    assert count_mosque_texts(texts) == 0
+    assert escalation_reason(mosques, count_mosque_texts(texts)) is None
+
+
+def test_one_mosque_named_in_several_messages_is_accepted():
+    texts = ['مسجد الرحمن قبل القصف', 'مسجد الرحمن بعد القصف', 'صور جامع الرحمن']
+    mosques = [{'name': 'مسجد الرحمن', 'confidence': 'high'}]
+    assert escalation_reason(mosques, count_mosque_texts(texts)) is None
+
+
+def test_empty_answer_despite_keyword_texts_escalates():
+    assert escalation_reason([], count_mosque_texts(['دمار مسجد الرحمن'])) == 'disagrees_with_rules'
+
+
+def test_low_confidence_escalates():
+    assert escalation_reason([{'name': 'مسجد الرحمن', 'confidence': 'low'}], 1) == 'low_confidence'